@@ -0,0 +1,442 @@
+"""
+API load test and latency benchmark
+Drives the job endpoints at a fixed concurrency and reports throughput,
+p50/p95/p99 latency and process CPU time per request for each scenario,
+written to a JSON file for comparing commits.
+
+By default everything runs offline in one process: the app over an ASGI
+transport, fakeredis (or --redis-url for a local redis-server), the concurrent
+worker runtime on its own thread and workers/fake_llm.py with --llm-latency-ms.
+
+    cd api
+    PYTHONPATH=.. python -m benchmarks.load_test --requests 500 --concurrency 32
+    PYTHONPATH=.. python -m benchmarks.load_test --compare benchmarks/results/<old>.json
+
+Prompt caching savings: run job_e2e with --llm-prefill-ms-per-1k, once as is
+and once with PROMPT_CACHE=0, and compare p95 and meta.llm_tokens.
+
+Scenarios:
+    create_job     POST /v1/jobs
+    generate       POST /v1/generate
+    get_job        GET  /v1/jobs/{id}
+    get_blueprint  GET  /v1/jobs/{id}/blueprint (jobs already ready)
+    job_e2e        POST /v1/generate, then poll until ready (includes the LLM)
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, cast
+
+import fakeredis
+import httpx
+import redis.asyncio as aioredis
+from workers import assets, orchestrator
+from workers.fake_llm import CACHE_MIN_TOKENS, serve_in_thread
+from workers.runtime import WorkerRuntime
+from workers.scheduler import Scheduler
+
+from main import app
+
+RESULTS_DIR = Path(__file__).parent / "results"
+SCENARIOS = ("create_job", "generate", "get_job", "get_blueprint", "job_e2e")
+
+DREAMS = [
+    "I was flying over a forest at night following a bird to a floating house",
+    "A city street in the rain where someone was searching for a lost key",
+    "Running across desert sand at sunset to escape a storm",
+    "Floating in space between the stars, looking for a way home",
+    "An ocean of feathers under a bright sun, and people I never met",
+]
+
+E2E_POLL_SECONDS = 0.02
+E2E_TIMEOUT_SECONDS = 60.0
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(
+    latencies: list[float],
+    errors: int,
+    duration: float,
+    concurrency: int,
+    cpu: float = 0.0,
+) -> dict[str, Any]:
+    """Throughput, CPU per request and latency distribution (ms) for one scenario"""
+    values = sorted(latency * 1000 for latency in latencies)
+    requests = len(values) + errors
+    return {
+        "requests": requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "duration_s": round(duration, 4),
+        "throughput_rps": round(len(values) / duration, 2) if duration else 0.0,
+        # Whole process (client, app and, offline, Redis stand-in and worker)
+        "cpu_ms_per_request": round(cpu * 1000 / requests, 4) if requests else 0.0,
+        "latency_ms": {
+            "min": round(values[0], 3) if values else 0.0,
+            "mean": round(statistics.fmean(values), 3) if values else 0.0,
+            "p50": round(percentile(values, 50), 3),
+            "p95": round(percentile(values, 95), 3),
+            "p99": round(percentile(values, 99), 3),
+            "max": round(values[-1], 3) if values else 0.0,
+        },
+    }
+
+
+async def run_scenario(
+    call: Callable[[int], Awaitable[None]],
+    total: int,
+    concurrency: int,
+) -> dict[str, Any]:
+    """Run `call(i)` for i in range(total) with `concurrency` callers in flight"""
+    counter = itertools.count()
+    latencies: list[float] = []
+    errors = 0
+
+    async def caller() -> None:
+        nonlocal errors
+        while (i := next(counter)) < total:
+            start = time.perf_counter()
+            try:
+                await call(i)
+            except Exception:
+                errors += 1
+            else:
+                latencies.append(time.perf_counter() - start)
+
+    start, cpu_start = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return summarize(
+        latencies,
+        errors,
+        time.perf_counter() - start,
+        concurrency,
+        time.process_time() - cpu_start,
+    )
+
+
+def job_payload(i: int, output_types: list[str]) -> dict[str, Any]:
+    return {
+        "dream_text": f"{DREAMS[i % len(DREAMS)]} ({i})",
+        "output_type": output_types[i % len(output_types)],
+        "style": "lowpoly",
+        "mood": "mystic",
+        "length": "short",
+        # Distinct users, so the per-client rate limit is exercised but not hit
+        "user_id": f"loadtest-{i}",
+    }
+
+
+async def post_job(
+    client: httpx.AsyncClient, path: str, payload: dict[str, Any]
+) -> str:
+    response = await client.post(path, json=payload)
+    response.raise_for_status()
+    job_id: str = response.json()["job_id"]
+    return job_id
+
+
+async def wait_until_ready(client: httpx.AsyncClient, job_id: str) -> None:
+    deadline = time.perf_counter() + E2E_TIMEOUT_SECONDS
+    while time.perf_counter() < deadline:
+        response = await client.get(f"/v1/jobs/{job_id}")
+        response.raise_for_status()
+        status = response.json()["status"]
+        if status == "ready":
+            return
+        if status == "failed":
+            raise RuntimeError(f"Job {job_id} failed")
+        await asyncio.sleep(E2E_POLL_SECONDS)
+    raise TimeoutError(f"Job {job_id} not ready after {E2E_TIMEOUT_SECONDS}s")
+
+
+async def wait_for_jobs(client: httpx.AsyncClient, job_ids: list[str]) -> None:
+    """Wait for jobs to finish, ignoring individual failures"""
+    await asyncio.gather(
+        *(wait_until_ready(client, job_id) for job_id in job_ids),
+        return_exceptions=True,
+    )
+
+
+async def run_benchmarks(
+    client: httpx.AsyncClient, args: argparse.Namespace
+) -> dict[str, Any]:
+    """Run the selected scenarios in order against one client"""
+    output_types = args.output_types.split(",")
+    total, concurrency = args.requests, args.concurrency
+    results: dict[str, Any] = {}
+    created: list[str] = []
+
+    async def create_job(i: int) -> None:
+        created.append(await post_job(client, "/v1/jobs", job_payload(i, ["game"])))
+
+    async def generate(i: int) -> None:
+        created.append(
+            await post_job(client, "/v1/generate", job_payload(i, output_types))
+        )
+
+    async def get_job(i: int) -> None:
+        response = await client.get(f"/v1/jobs/{created[i % len(created)]}")
+        response.raise_for_status()
+
+    async def get_blueprint(i: int) -> None:
+        response = await client.get(
+            f"/v1/jobs/{ready_games[i % len(ready_games)]}/blueprint"
+        )
+        response.raise_for_status()
+
+    async def job_e2e(i: int) -> None:
+        payload = job_payload(total + i, output_types)
+        payload["bypass_cache"] = True
+        await wait_until_ready(client, await post_job(client, "/v1/generate", payload))
+
+    calls = {
+        "create_job": create_job,
+        "generate": generate,
+        "get_job": get_job,
+        "get_blueprint": get_blueprint,
+        "job_e2e": job_e2e,
+    }
+
+    # Read scenarios need jobs to exist; blueprints need a few finished games
+    ready_games: list[str] = []
+    if {"get_job", "get_blueprint"} & set(args.scenarios):
+        seed = [
+            await post_job(client, "/v1/jobs", job_payload(i, ["game"]))
+            for i in range(8)
+        ]
+        for job_id in seed:
+            await wait_until_ready(client, job_id)
+        ready_games.extend(seed)
+        created.extend(seed)
+
+    for name in args.scenarios:
+        if name == "job_e2e":
+            # Let the worker drain earlier scenarios' jobs so e2e measures the pipeline
+            await wait_for_jobs(client, created)
+        results[name] = await run_scenario(calls[name], total, concurrency)
+        print(format_row(name, results[name]))
+
+    return results
+
+
+def format_row(name: str, summary: dict[str, Any]) -> str:
+    latency = summary["latency_ms"]
+    return (
+        f"{name:<14} {summary['throughput_rps']:>10.1f} req/s"
+        f"  p50 {latency['p50']:>8.2f}  p95 {latency['p95']:>8.2f}"
+        f"  p99 {latency['p99']:>8.2f} ms"
+        f"  cpu {summary['cpu_ms_per_request']:>7.3f} ms/req"
+        f"  errors {summary['errors']}"
+    )
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any]) -> list[str]:
+    """Per-scenario change in throughput, p95 and CPU per request against a baseline"""
+    lines = []
+    for name, summary in current["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+        rps_change = pct_change(old["throughput_rps"], summary["throughput_rps"])
+        p95_change = pct_change(old["latency_ms"]["p95"], summary["latency_ms"]["p95"])
+        cpu_change = pct_change(
+            old.get("cpu_ms_per_request", 0.0), summary["cpu_ms_per_request"]
+        )
+        lines.append(
+            f"{name:<14} throughput {rps_change:+7.1f}%  p95 {p95_change:+7.1f}%"
+            f"  cpu {cpu_change:+7.1f}%"
+        )
+    return lines
+
+
+def pct_change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LocalStack:
+    """App, Redis stand-in, worker runtime and fake LLM, all in this process"""
+
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.fake_server = None if args.redis_url else fakeredis.FakeServer()
+        self.runtime = WorkerRuntime(concurrency=args.worker_concurrency)
+        self.worker_loop = asyncio.new_event_loop()
+        self.worker_ready = threading.Event()
+        self.worker_thread = threading.Thread(target=self.run_worker, daemon=True)
+
+    def start(self) -> httpx.AsyncClient:
+        self.llm_server = serve_in_thread(
+            latency_ms=self.args.llm_latency_ms,
+            jitter_ms=self.args.llm_jitter_ms,
+            prefill_ms_per_1k=self.args.llm_prefill_ms_per_1k,
+            cache_min_tokens=self.args.llm_cache_min_tokens,
+        )
+        os.environ["ANTHROPIC_BASE_URL"] = self.llm_server.base_url
+        os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+
+        self.output_dir = tempfile.TemporaryDirectory()
+        orchestrator.WEBGL_OUTPUT_DIR = os.path.join(self.output_dir.name, "webgl")
+        assets.ASSET_STORE_DIR = os.path.join(self.output_dir.name, "assets")
+
+        app.state.redis = self.async_redis()
+        app.state.scheduler = Scheduler(app.state.redis)
+
+        self.worker_thread.start()
+        self.worker_ready.wait()
+
+        # httpx types app as a plain ASGI callable, which FastAPI's signature misses
+        transport = httpx.ASGITransport(app=cast(Any, app))
+        return httpx.AsyncClient(transport=transport, base_url="http://benchmark")
+
+    def async_redis(self) -> Any:
+        if self.fake_server is None:
+            return aioredis.from_url(self.args.redis_url, decode_responses=True)
+        return fakeredis.FakeAsyncRedis(server=self.fake_server, decode_responses=True)
+
+    def run_worker(self) -> None:
+        """Worker runtime on its own thread and event loop, like a separate process"""
+        self.worker_loop.call_soon(self.worker_ready.set)
+        self.worker_loop.run_until_complete(self.runtime.run(r=self.async_redis()))
+        self.worker_loop.close()
+
+    def stop(self) -> None:
+        self.worker_loop.call_soon_threadsafe(self.runtime.stop)
+        self.worker_thread.join()
+        self.llm_server.shutdown()
+        self.output_dir.cleanup()
+
+
+async def main(args: argparse.Namespace) -> dict[str, Any]:
+    stack = None
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=E2E_TIMEOUT_SECONDS)
+    else:
+        stack = LocalStack(args)
+        client = stack.start()
+
+    llm_tokens = None
+    try:
+        async with client:
+            scenarios = await run_benchmarks(client, args)
+        if stack is not None:
+            llm_tokens = stack.llm_server.state.snapshot()["tokens"]
+    finally:
+        if stack is not None:
+            stack.stop()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "target": args.base_url
+            or ("redis:" + args.redis_url if args.redis_url else "fakeredis"),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "worker_concurrency": args.worker_concurrency,
+            "llm_latency_ms": args.llm_latency_ms,
+            "llm_jitter_ms": args.llm_jitter_ms,
+            "llm_prefill_ms_per_1k": args.llm_prefill_ms_per_1k,
+            # Prompt tokens the fake LLM saw, split by prompt cache outcome
+            "llm_tokens": llm_tokens,
+            "output_types": args.output_types,
+        },
+        "scenarios": scenarios,
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="DreamQuest API load test")
+    parser.add_argument(
+        "--requests", type=int, default=200, help="requests per scenario"
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=16, help="requests in flight"
+    )
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output-types", default="image,video,game")
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--llm-jitter-ms", type=float, default=50)
+    parser.add_argument(
+        "--llm-prefill-ms-per-1k",
+        type=float,
+        default=0,
+        help="fake LLM time to first token per 1k uncached prompt tokens",
+    )
+    parser.add_argument(
+        "--llm-cache-min-tokens",
+        type=int,
+        default=CACHE_MIN_TOKENS,
+        help="smallest prompt prefix the fake LLM caches",
+    )
+    parser.add_argument("--worker-concurrency", type=int, default=16)
+    parser.add_argument(
+        "--redis-url", help="use a local redis-server instead of fakeredis"
+    )
+    parser.add_argument(
+        "--base-url", help="benchmark a running API instead of the local stack"
+    )
+    parser.add_argument(
+        "--output", type=Path, help="results file (default: results/<commit>.json)"
+    )
+    parser.add_argument(
+        "--compare", type=Path, help="earlier results file to diff against"
+    )
+    args = parser.parse_args(argv)
+
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def cli(argv: list[str] | None = None) -> Path:
+    args = parse_args(argv)
+    report = asyncio.run(main(args))
+
+    output = args.output or RESULTS_DIR / f"{report['meta']['commit'] or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"results written to {output}")
+
+    if args.compare:
+        for line in compare(report, json.loads(args.compare.read_text())):
+            print(line)
+
+    return output
+
+
+if __name__ == "__main__":
+    cli()
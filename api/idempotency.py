@@ -0,0 +1,113 @@
+"""
+Idempotency keys for job creation
+A client that retries POST /v1/jobs or /v1/generate with the same
+Idempotency-Key header gets the job the first attempt created, instead of a
+second job (and a second LLM bill). The key is claimed with SET NX before
+anything is created, so a retry racing the still-running original sees the
+claim and returns the same job id.
+
+Keys are scoped per endpoint (and per user_id when given) and expire after
+IDEMPOTENCY_TTL_SECONDS, the lifetime of the job record they point at. The
+claim also stores a fingerprint of the request body: reusing a key for a
+different request is a 422, not a silent replay.
+"""
+
+import hashlib
+import os
+import uuid
+from typing import Any
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel
+from workers.job_store import JOB_TTL_SECONDS, AsyncJobStore
+from workers.metrics import redis_operation
+
+from schemas import CreateJobResponse, JobStatusEnum
+
+IDEMPOTENCY_TTL_SECONDS = int(
+    os.getenv("IDEMPOTENCY_TTL_SECONDS", str(JOB_TTL_SECONDS))
+)
+MAX_KEY_LENGTH = 255
+
+KEY_PREFIX = "idempotency:"
+
+# Only delete the claim if it is still ours
+RELEASE_CLAIM_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def claim_key(endpoint: str, idempotency_key: str, user_id: str | None) -> str:
+    digest = hashlib.sha256(idempotency_key.encode()).hexdigest()
+    return f"{KEY_PREFIX}{endpoint}:{user_id or ''}:{digest}"
+
+
+def fingerprint(body: BaseModel) -> str:
+    return hashlib.sha256(body.model_dump_json().encode()).hexdigest()
+
+
+@redis_operation("idempotency.claim")
+async def claim(r: Any, key: str, value: str) -> str | None:
+    """Claim key for value; returns the existing value if already claimed"""
+    if await r.set(key, value, nx=True, ex=IDEMPOTENCY_TTL_SECONDS):
+        return None
+    existing: str | None = await r.get(key)
+    # Expired between SET and GET: treat as ours on the next attempt
+    return existing if existing is not None else await claim(r, key, value)
+
+
+async def claim_job(
+    request: Request,
+    endpoint: str,
+    idempotency_key: str | None,
+    body: Any,
+    job_id: uuid.UUID,
+) -> CreateJobResponse | None:
+    """Claim the key for a new job, or return the job an earlier request created"""
+    if idempotency_key is None:
+        return None
+    if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+
+    r = request.app.state.redis
+    request_fingerprint = fingerprint(body)
+    existing = await claim(
+        r,
+        claim_key(endpoint, idempotency_key, body.user_id),
+        f"{job_id}:{request_fingerprint}",
+    )
+    if existing is None:
+        return None
+
+    original_job_id, original_fingerprint = existing.split(":", 1)
+    if original_fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request",
+        )
+
+    # The original request may still be between its claim and creating the job
+    fields, _ = await AsyncJobStore(r).get_status(original_job_id)
+    status = fields["status"] if fields else JobStatusEnum.QUEUED.value
+    return CreateJobResponse(job_id=uuid.UUID(original_job_id), status=status)
+
+
+async def release_job(
+    request: Request,
+    endpoint: str,
+    idempotency_key: str | None,
+    body: Any,
+    job_id: uuid.UUID,
+) -> None:
+    """Give the key up after a failed creation, so a retry can try again"""
+    if not idempotency_key:
+        return
+    r = request.app.state.redis
+    release = r.register_script(RELEASE_CLAIM_LUA)
+    await release(
+        keys=[claim_key(endpoint, idempotency_key, body.user_id)],
+        args=[f"{job_id}:{fingerprint(body)}"],
+    )
@@ -0,0 +1,64 @@
+"""
+Request metrics and the /metrics exposition
+Latency is recorded per route template (not raw path) so job ids don't blow up
+label cardinality. It is measured to the start of the response, which is what
+clients wait for and keeps long-lived SSE streams meaningful.
+"""
+
+import time
+from typing import Any
+
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from workers.job_store import count_live_jobs
+from workers.metrics import HTTP_REQUEST_SECONDS, JOBS_BY_STATUS, QUEUE_DEPTH
+from workers.scheduler import CLASSES, DEPTH_KEY
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no per-request task or body buffering)"""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        recorded = False
+
+        def record(status: int) -> None:
+            nonlocal recorded
+            recorded = True
+            # FastAPI stores the matched route on the scope during routing
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            ).observe(time.perf_counter() - start)
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if not recorded:
+                record(500)
+            raise
+
+
+async def render_metrics(r: Any) -> tuple[bytes, str]:
+    """Refresh the Redis-backed gauges and render the registry"""
+    depths = await r.hgetall(DEPTH_KEY)
+    for job_class in CLASSES:
+        QUEUE_DEPTH.labels(job_class).set(int(depths.get(job_class, 0)))
+    for status, count in (await count_live_jobs(r)).items():
+        JOBS_BY_STATUS.labels(status).set(count)
+
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,12 +1,15 @@
 import os
+from collections.abc import AsyncIterator
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from typing import AsyncIterator
 
 import redis.asyncio as redis
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from workers.scheduler import Scheduler
 
-from routes import jobs, transcribe, generate
+from instrumentation import MetricsMiddleware, render_metrics
+from routes import cache, generate, jobs, transcribe
 
 
 @asynccontextmanager
@@ -14,10 +17,17 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     # Startup
     redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
     app.state.redis = await redis.from_url(redis_url, decode_responses=True)
+    # Registers the queue scripts once; routes share it
+    app.state.scheduler = Scheduler(app.state.redis)
+    # /v1/transcribe chunks run here, so they cannot starve the default threadpool
+    app.state.transcribe_pool = ThreadPoolExecutor(
+        int(os.getenv("TRANSCRIBE_API_THREADS", "4")), thread_name_prefix="transcribe"
+    )
 
     yield
 
     # Shutdown
+    app.state.transcribe_pool.shutdown(wait=False, cancel_futures=True)
     await app.state.redis.close()
 
 
@@ -37,11 +47,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # Routes
 app.include_router(jobs.router, prefix="/v1", tags=["jobs"])
 app.include_router(transcribe.router, prefix="/v1", tags=["transcribe"])
 app.include_router(generate.router, prefix="/v1", tags=["generate"])
+app.include_router(cache.router, prefix="/v1", tags=["cache"])
 
 
 @app.get("/")
@@ -52,3 +64,10 @@ async def root() -> dict[str, str]:
 @app.get("/health")
 async def health() -> dict[str, str]:
     return {"status": "healthy"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Prometheus scrape endpoint (API process metrics + queue/job gauges)"""
+    body, content_type = await render_metrics(app.state.redis)
+    return Response(body, media_type=content_type)
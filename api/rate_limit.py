@@ -0,0 +1,120 @@
+"""
+Sliding-window rate limiting for job creation and transcription
+Each client (user_id when given, else the client IP) gets a sorted set of
+its recent requests, one per scope (jobs, batch, transcriptions). One Lua script
+trims entries older than the window, counts the rest and records the new
+jobs if they fit, so a check is a single Redis round trip and concurrent
+API instances cannot both squeeze into the last slot.
+
+Limits are jobs per RATE_LIMIT_WINDOW_SECONDS: MAX_JOBS_AUTHENTICATED for
+requests with a user_id, MAX_JOBS_ANONYMOUS otherwise (0 disables a limit).
+Batch ingestion has its own scope and larger MAX_BATCH_JOBS_* limits, so a
+backfill neither needs the interactive budget nor eats it. A batch costs one
+slot per job; one larger than the whole limit could never fit, so it is
+refused with 413 instead of a Retry-After it cannot honour.
+Behind a proxy, run uvicorn with --proxy-headers so the client IP is real.
+"""
+
+import math
+import os
+import uuid
+from typing import Any
+
+from fastapi import HTTPException, Request
+from workers.metrics import redis_operation
+
+MAX_JOBS_ANONYMOUS = int(os.getenv("MAX_JOBS_ANONYMOUS", "3"))
+MAX_JOBS_AUTHENTICATED = int(os.getenv("MAX_JOBS_AUTHENTICATED", "10"))
+MAX_BATCH_JOBS_ANONYMOUS = int(os.getenv("MAX_BATCH_JOBS_ANONYMOUS", "50"))
+MAX_BATCH_JOBS_AUTHENTICATED = int(os.getenv("MAX_BATCH_JOBS_AUTHENTICATED", "1000"))
+RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
+
+KEY_PREFIX = "ratelimit:"
+
+# KEYS: the client's window zset
+# ARGV: window (ms), limit, cost, unique request id
+# Returns {1, 0}, {0, ms until enough entries leave the window},
+# or {0, -1} if cost exceeds the limit and can never fit
+SLIDING_WINDOW_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count + cost > limit then
+    if cost > limit then
+        return {0, -1}
+    end
+    -- The entry whose expiry frees enough room for this request
+    local index = count + cost - limit - 1
+    local entry = redis.call('ZRANGE', KEYS[1], index, index, 'WITHSCORES')
+    return {0, math.max(1, tonumber(entry[2]) + window - now)}
+end
+for i = 1, cost do
+    redis.call('ZADD', KEYS[1], now, ARGV[4] .. ':' .. i)
+end
+redis.call('PEXPIRE', KEYS[1], window)
+return {1, 0}
+"""
+
+
+def client_key(request: Request, user_id: str | None, scope: str = "jobs") -> str:
+    if user_id:
+        return f"{KEY_PREFIX}{scope}:user:{user_id}"
+    host = request.client.host if request.client else "unknown"
+    return f"{KEY_PREFIX}{scope}:ip:{host}"
+
+
+def scope_limit(scope: str, user_id: str | None) -> int:
+    if scope == "batch":
+        return MAX_BATCH_JOBS_AUTHENTICATED if user_id else MAX_BATCH_JOBS_ANONYMOUS
+    return MAX_JOBS_AUTHENTICATED if user_id else MAX_JOBS_ANONYMOUS
+
+
+@redis_operation("rate_limit.check")
+async def check_rate_limit(
+    r: Any, key: str, limit: int, cost: int = 1
+) -> tuple[bool, float]:
+    """(allowed, seconds until allowed or inf) for cost jobs; records them if allowed"""
+    script = r.register_script(SLIDING_WINDOW_LUA)
+    allowed, value = await script(
+        keys=[key],
+        args=[RATE_LIMIT_WINDOW_SECONDS * 1000, limit, cost, uuid.uuid4().hex],
+    )
+    if int(value) < 0:
+        return False, math.inf
+    return bool(allowed), int(value) / 1000
+
+
+async def enforce_rate_limit(
+    request: Request, user_id: str | None, cost: int = 1, scope: str = "jobs"
+) -> None:
+    """Record cost new jobs for the client, or raise 429 (413 if cost can never fit)"""
+    limit = scope_limit(scope, user_id)
+    if limit <= 0:
+        return
+    if cost > limit:
+        raise HTTPException(
+            status_code=413,
+            detail=(
+                f"Batch of {cost} jobs exceeds the rate limit of {limit} jobs per "
+                f"{RATE_LIMIT_WINDOW_SECONDS}s; split it into batches of at most "
+                f"{limit}"
+            ),
+        )
+
+    allowed, retry_after = await check_rate_limit(
+        request.app.state.redis, client_key(request, user_id, scope), limit, cost
+    )
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=(
+                f"Rate limit exceeded: {limit} {scope} per "
+                f"{RATE_LIMIT_WINDOW_SECONDS}s"
+            ),
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
@@ -0,0 +1,15 @@
+from typing import Any
+
+from fastapi import APIRouter, Request
+from workers.result_cache import format_stats, stats_pipeline
+
+router = APIRouter()
+
+
+@router.get("/cache/stats")
+async def get_cache_stats(request: Request) -> dict[str, Any]:
+    """Generation result cache hit/miss counters, for sizing the cache"""
+
+    pipe = stats_pipeline(request.app.state.redis)
+    stats: dict[str, Any] = format_stats(await pipe.execute())
+    return stats
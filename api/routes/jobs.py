@@ -1,121 +1,478 @@
 import json
+import logging
+import time
 import uuid
-from typing import Any
-
-from fastapi import APIRouter, HTTPException, Request
-from rq import Queue
-from rq.job import Job
+from collections.abc import AsyncIterator
+from typing import Any, cast
+
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError
+from workers.blueprints import VARIANTS, encode_document, variant_body, variant_etag
+from workers.job_store import (
+    TERMINAL_STATUSES,
+    AsyncJobStore,
+    events_channel,
+    parse_event,
+)
+from workers.scheduler import job_class
 
+from idempotency import claim_job, release_job
+from rate_limit import enforce_rate_limit
 from schemas import (
+    BatchJobItemResult,
+    CreateJobBatchRequest,
+    CreateJobBatchResponse,
     CreateJobRequest,
     CreateJobResponse,
     GetJobResponse,
-    JobResult,
     JobStatusEnum,
 )
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
+# Comment line sent on idle streams so proxies keep the connection open
+SSE_KEEPALIVE_SECONDS = 15.0
 
-def get_queue(request: Request) -> Queue:
-    """Get RQ queue from Redis connection"""
-    from redis import Redis
+BLUEPRINT_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# The blueprint representation depends on these request headers
+BLUEPRINT_VARY = "Accept, Accept-Encoding"
 
-    redis_client = Redis.from_url(request.app.state.redis.connection_pool.connection_kwargs["host"])
-    return Queue("dreamquest", connection=redis_client)
 
+DREAM_FUNC = "workers.orchestrator.process_dream"
 
-@router.post("/jobs", response_model=CreateJobResponse)
-async def create_job(request: Request, body: CreateJobRequest) -> CreateJobResponse:
-    """Create a new dream-to-world generation job"""
 
-    # Validate that either dream_text or audio_url is provided
-    if not body.dream_text and not body.audio_url:
-        raise HTTPException(
-            status_code=400,
-            detail="Either dream_text or audio_url must be provided"
-        )
+def queue_class(func: str, job_data: dict[str, Any]) -> str:
+    """Scheduler class for a job: process_dream always builds a game"""
+    output_type = "game" if func == DREAM_FUNC else job_data["output_type"]
+    return cast(str, job_class(output_type, job_data["length"]))
 
-    # Rate limiting check (simplified - should use Redis for production)
-    # TODO: Implement proper rate limiting with Redis
 
-    # Create job
-    job_id = uuid.uuid4()
+async def enqueue(request: Request, func: str, job_data: dict[str, Any]) -> None:
+    """Queue a worker job in its class and user's share, logging its latency"""
+    start = time.perf_counter()
+    await request.app.state.scheduler.enqueue(
+        func, job_data["job_id"], queue_class(func, job_data), job_data["user_id"]
+    )
+    logger.info(
+        "enqueue func=%s job_id=%s latency_ms=%.2f",
+        func,
+        job_data["job_id"],
+        (time.perf_counter() - start) * 1000,
+    )
+
 
-    # Store job data in Redis
-    job_data = {
+def new_job_data(job_id: uuid.UUID, body: CreateJobRequest) -> dict[str, Any]:
+    """Initial job record for a validated request"""
+    assert body.output_type is not None  # validate_output_types always sets it
+    return {
         "job_id": str(job_id),
         "status": JobStatusEnum.QUEUED.value,
         "progress": 0,
         "dream_text": body.dream_text,
         "audio_url": body.audio_url,
+        "output_type": body.output_type.value,
+        "output_types": ",".join(t.value for t in body.output_types)
+        if body.output_types
+        else None,
         "style": body.style.value,
         "mood": body.mood.value,
         "length": body.length.value,
         "user_id": body.user_id,
+        "bypass_cache": body.bypass_cache,
     }
 
-    await request.app.state.redis.set(
-        f"job:{job_id}",
-        json.dumps(job_data),
-        ex=86400  # 24h expiration
+
+def unsupported_output_types(func: str, body: CreateJobRequest) -> str | None:
+    """Why a request's output_types cannot run under func, if they cannot"""
+    if body.output_types and func == DREAM_FUNC:
+        return "output_types is only supported by /v1/generate"
+    return None
+
+
+def format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'body'}: {e['msg']}"
+        for e in error.errors()
     )
 
-    # Enqueue worker job
-    # queue = get_queue(request)
-    # queue.enqueue("workers.orchestrator.process_dream", job_id)
 
-    return CreateJobResponse(
-        job_id=job_id,
-        status=JobStatusEnum.QUEUED
+async def submit_job(
+    request: Request,
+    response: Response,
+    body: CreateJobRequest,
+    func: str,
+    idempotency_key: str | None,
+) -> CreateJobResponse:
+    """Create and enqueue one job (or replay an earlier, identical request's job)"""
+
+    # Validate that either dream_text or audio_url is provided
+    if not body.dream_text and not body.audio_url:
+        raise HTTPException(
+            status_code=400, detail="Either dream_text or audio_url must be provided"
+        )
+    unsupported = unsupported_output_types(func, body)
+    if unsupported:
+        raise HTTPException(status_code=400, detail=unsupported)
+
+    # Create job
+    job_id = uuid.uuid4()
+
+    endpoint = func.rsplit(".", 1)[-1]
+    replay = await claim_job(request, endpoint, idempotency_key, body, job_id)
+    if replay is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+        return replay
+
+    try:
+        await enforce_rate_limit(request, body.user_id)
+
+        # Store job data in Redis
+        job_data = new_job_data(job_id, body)
+
+        job_store = AsyncJobStore(request.app.state.redis)
+        await job_store.create(job_data)
+
+        # Enqueue worker job
+        try:
+            await enqueue(request, func, job_data)
+        except Exception as e:
+            await job_store.set_status(
+                job_id, JobStatusEnum.FAILED.value, 0, error=str(e)
+            )
+            raise HTTPException(status_code=503, detail="Job queue unavailable") from e
+    except BaseException:
+        # Let a retry with the same key create the job
+        await release_job(request, endpoint, idempotency_key, body, job_id)
+        raise
+
+    return CreateJobResponse(job_id=job_id, status=JobStatusEnum.QUEUED)
+
+
+@router.post("/jobs", response_model=CreateJobResponse)
+async def create_job(
+    request: Request,
+    response: Response,
+    body: CreateJobRequest,
+    idempotency_key: str | None = Header(None),
+) -> CreateJobResponse:
+    """Create a new dream-to-world generation job"""
+    return await submit_job(request, response, body, DREAM_FUNC, idempotency_key)
+
+
+@router.post("/jobs:batch", response_model=CreateJobBatchResponse)
+async def create_jobs_batch(
+    request: Request, body: CreateJobBatchRequest
+) -> CreateJobBatchResponse:
+    """Create many jobs at once: one Redis pipeline, one bulk enqueue"""
+
+    results: list[BatchJobItemResult] = []
+    accepted: list[dict[str, Any]] = []
+
+    # Validate every item in one pass, collecting per-item errors
+    for index, item in enumerate(body.jobs):
+        try:
+            job_request = CreateJobRequest.model_validate(item)
+        except ValidationError as e:
+            results.append(
+                BatchJobItemResult(index=index, error=format_validation_error(e))
+            )
+            continue
+
+        if not job_request.dream_text and not job_request.audio_url:
+            results.append(
+                BatchJobItemResult(
+                    index=index, error="Either dream_text or audio_url must be provided"
+                )
+            )
+            continue
+        unsupported = unsupported_output_types(DREAM_FUNC, job_request)
+        if unsupported:
+            results.append(BatchJobItemResult(index=index, error=unsupported))
+            continue
+
+        job_id = uuid.uuid4()
+        accepted.append(new_job_data(job_id, job_request))
+        results.append(
+            BatchJobItemResult(index=index, job_id=job_id, status=JobStatusEnum.QUEUED)
+        )
+
+    if accepted:
+        # One user's batch counts against that user, anything else against the client IP
+        user_ids = {job_data["user_id"] for job_data in accepted}
+        await enforce_rate_limit(
+            request,
+            user_ids.pop() if len(user_ids) == 1 else None,
+            len(accepted),
+            scope="batch",
+        )
+
+        job_store = AsyncJobStore(request.app.state.redis)
+        await job_store.create_many(accepted)
+
+        start = time.perf_counter()
+        try:
+            await request.app.state.scheduler.enqueue_many(
+                [
+                    {
+                        "func": DREAM_FUNC,
+                        "job_id": job_data["job_id"],
+                        "job_class": queue_class(DREAM_FUNC, job_data),
+                        "user_id": job_data["user_id"],
+                    }
+                    for job_data in accepted
+                ]
+            )
+            logger.info(
+                "enqueue_many func=%s count=%d latency_ms=%.2f",
+                DREAM_FUNC,
+                len(accepted),
+                (time.perf_counter() - start) * 1000,
+            )
+        except Exception as e:
+            await job_store.fail_many(
+                [job_data["job_id"] for job_data in accepted], str(e)
+            )
+            raise HTTPException(status_code=503, detail="Job queue unavailable") from e
+
+    return CreateJobBatchResponse(
+        accepted=len(accepted),
+        rejected=len(body.jobs) - len(accepted),
+        results=results,
     )
 
 
 @router.get("/jobs/{job_id}", response_model=GetJobResponse)
-async def get_job(request: Request, job_id: uuid.UUID) -> GetJobResponse:
-    """Get job status and result"""
+async def get_job(request: Request, job_id: uuid.UUID) -> Response | GetJobResponse:
+    """Get job status and result
 
-    # Get job from Redis
-    job_data_str = await request.app.state.redis.get(f"job:{job_id}")
+    Served from the document the job store renders on every write, as is.
+    """
+    store = AsyncJobStore(request.app.state.redis)
+    document = await store.get_status_document(job_id)
+    if document is not None:
+        return Response(document, media_type="application/json")
+
+    # Jobs stored before status documents existed
+    return await render_job(store, job_id)
 
-    if not job_data_str:
-        raise HTTPException(status_code=404, detail="Job not found")
 
-    job_data = json.loads(job_data_str)
+async def render_job(store: AsyncJobStore, job_id: uuid.UUID) -> GetJobResponse:
+    """Build the status response from the job hash and result"""
+
+    # Get job status fields (and result, if any) from Redis
+    job_data, result = await store.get_status(job_id)
+
+    if not job_data:
+        raise HTTPException(status_code=404, detail="Job not found")
 
     # Build response
     response_data: dict[str, Any] = {
         "job_id": job_id,
         "status": job_data["status"],
-        "progress": job_data.get("progress", 0),
+        "progress": job_data["progress"],
     }
 
     # Add result if job is ready
-    if job_data["status"] == JobStatusEnum.READY.value and "result" in job_data:
-        response_data["result"] = job_data["result"]
+    if job_data["status"] == JobStatusEnum.READY.value and result:
+        response_data["result"] = result
 
     # Add error if job failed
-    if job_data["status"] == JobStatusEnum.FAILED.value and "error" in job_data:
+    if job_data["status"] == JobStatusEnum.FAILED.value and job_data["error"]:
         response_data["error"] = job_data["error"]
 
+    # Add streamed output while the LLM is still generating
+    if job_data["partial"]:
+        response_data["partial"] = job_data["partial"]
+
     return GetJobResponse(**response_data)
 
 
 @router.get("/jobs/{job_id}/blueprint")
-async def get_job_blueprint(request: Request, job_id: uuid.UUID) -> dict[str, Any]:
-    """Get job blueprint JSON for Unity"""
+async def get_job_blueprint(
+    request: Request,
+    job_id: uuid.UUID,
+    accept: str | None = Header(None),
+    accept_encoding: str | None = Header(None),
+    if_none_match: str | None = Header(None),
+) -> Response:
+    """Get job blueprint JSON for Unity (pre-encoded, cacheable)"""
+
+    store = AsyncJobStore(request.app.state.redis)
+    variant = preferred_variant(accept, accept_encoding)
+    status, document = await store.get_blueprint(job_id, variant)
+
+    vary = {"Vary": BLUEPRINT_VARY}
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job not found", headers=vary)
+
+    if status != JobStatusEnum.READY.value:
+        raise HTTPException(status_code=400, detail="Job not ready", headers=vary)
+
+    if document["etag"] is None:
+        # Jobs that finished before blueprints were stored pre-encoded
+        _, result = await store.get_status(job_id)
+        if not result or "blueprint" not in result:
+            raise HTTPException(
+                status_code=404, detail="Blueprint not found", headers=vary
+            )
+        document = encode_document(result["blueprint"])
+
+    if document.get(variant) is None:
+        variant = "json"  # stored by workers that predate the variant
+
+    # A ready job's blueprint never changes: let browsers, CDNs and nginx keep it
+    etag = variant_etag(document["etag"], variant)
+    headers = {"ETag": f'"{etag}"', "Cache-Control": BLUEPRINT_CACHE_CONTROL, **vary}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type, content_encoding = VARIANTS[variant]
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    return Response(
+        variant_body(variant, document[variant]), media_type=media_type, headers=headers
+    )
 
-    job_data_str = await request.app.state.redis.get(f"job:{job_id}")
 
-    if not job_data_str:
-        raise HTTPException(status_code=404, detail="Job not found")
+def accepts(header: str | None, token: str) -> bool:
+    """Whether an Accept/Accept-Encoding header lists token with a nonzero q"""
+    for item in (header or "").split(","):
+        name, *params = item.split(";")
+        if name.strip().lower() != token:
+            continue
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def preferred_variant(accept: str | None, accept_encoding: str | None) -> str:
+    if accepts(accept, "application/msgpack"):
+        return "msgpack"
+    if accepts(accept_encoding, "gzip"):
+        return "gzip"
+    return "json"
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 specifies for it)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (
+        tag.strip().removeprefix("W/").strip('"') for tag in if_none_match.split(",")
+    )
+    return etag in tags
 
-    job_data = json.loads(job_data_str)
 
-    if job_data["status"] != JobStatusEnum.READY.value:
-        raise HTTPException(status_code=400, detail="Job not ready")
+def format_sse(event: str, version: int, data: dict[str, Any]) -> str:
+    """One Server-Sent Events frame; the job version doubles as the event id"""
+    return f"id: {version}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
 
-    if "result" not in job_data or "blueprint" not in job_data["result"]:
-        raise HTTPException(status_code=404, detail="Blueprint not found")
 
-    return job_data["result"]["blueprint"]
+def job_event(
+    job_id: uuid.UUID, fields: dict[str, Any], result: dict[str, Any] | None
+) -> str:
+    """Status or partial-output frame, or the result frame once the job has finished"""
+    data: dict[str, Any] = {
+        "job_id": str(job_id),
+        "status": fields["status"],
+        "progress": fields["progress"],
+    }
+    if fields["status"] not in TERMINAL_STATUSES:
+        if fields.get("partial"):
+            data["partial"] = fields["partial"]
+            return format_sse("partial", fields["version"], data)
+        return format_sse("status", fields["version"], data)
+
+    if fields["status"] == JobStatusEnum.READY.value:
+        data["result"] = result
+    if fields.get("error"):
+        data["error"] = fields["error"]
+    return format_sse("result", fields["version"], data)
+
+
+async def job_event_stream(
+    request: Request,
+    job_id: uuid.UUID,
+    pubsub: Any,
+    fields: dict[str, Any],
+    result: dict[str, Any] | None,
+    last_seen: int,
+) -> AsyncIterator[str]:
+    store = AsyncJobStore(request.app.state.redis)
+
+    try:
+        # Current state first, unless the client already saw this version
+        # (a finished job always repeats its final event so clients can close)
+        if fields["version"] > last_seen or fields["status"] in TERMINAL_STATUSES:
+            yield job_event(job_id, fields, result)
+            last_seen = fields["version"]
+        if fields["status"] in TERMINAL_STATUSES:
+            return
+
+        while not await request.is_disconnected():
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True, timeout=SSE_KEEPALIVE_SECONDS
+            )
+            if message is None:
+                yield ": keepalive\n\n"
+                continue
+
+            version, event = parse_event(message["data"])
+            if version <= last_seen:
+                continue
+            last_seen = version
+            event["version"] = version
+
+            if event["status"] in TERMINAL_STATUSES:
+                _, result = await store.get_status(job_id)
+                yield job_event(job_id, event, result)
+                return
+
+            yield job_event(job_id, event, None)
+    finally:
+        await pubsub.unsubscribe()
+        await pubsub.aclose()
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(
+    request: Request,
+    job_id: uuid.UUID,
+    last_event_id: str | None = Header(None),
+) -> StreamingResponse:
+    """Push job status/progress transitions as Server-Sent Events
+
+    Sends the current state, then every transition published by the worker,
+    and closes after one final `result` event. Reconnects with Last-Event-ID
+    skip versions the client has already seen.
+    """
+
+    # Subscribe before reading the snapshot so no transition falls in between
+    pubsub = request.app.state.redis.pubsub()
+    await pubsub.subscribe(events_channel(job_id))
+
+    fields, result = await AsyncJobStore(request.app.state.redis).get_status(job_id)
+    if not fields:
+        await pubsub.aclose()
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    try:
+        last_seen = int(last_event_id) if last_event_id else -1
+    except ValueError:
+        last_seen = -1
+
+    return StreamingResponse(
+        job_event_stream(request, job_id, pubsub, fields, result, last_seen),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
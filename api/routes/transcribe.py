@@ -1,25 +1,87 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+from collections.abc import AsyncIterator
+from concurrent.futures import Executor
 
+import httpx
+from fastapi import APIRouter, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from workers.transcription import AudioTooLarge, transcribe_url
+
+from rate_limit import enforce_rate_limit
+from routes.jobs import accepts, format_sse
 from schemas import TranscribeRequest, TranscribeResponse
 
 router = APIRouter()
 
 
+def transcription_error(error: Exception) -> HTTPException:
+    """HTTP error for a failed transcription"""
+    if isinstance(error, AudioTooLarge):
+        return HTTPException(status_code=413, detail=str(error))
+    if isinstance(error, httpx.HTTPError):
+        return HTTPException(status_code=502, detail="Could not fetch audio_url")
+    return HTTPException(status_code=422, detail=str(error))
+
+
+async def transcript_events(audio_url: str, executor: Executor) -> AsyncIterator[str]:
+    """`partial` frames with the transcript so far, then a `result` or `error` frame"""
+    partials: asyncio.Queue[str] = asyncio.Queue()
+    task = asyncio.create_task(
+        transcribe_url(audio_url, executor, on_partial=partials.put)
+    )
+    version = 0
+
+    try:
+        while not (task.done() and partials.empty()):
+            getter = asyncio.ensure_future(partials.get())
+            await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                continue
+            version += 1
+            yield format_sse("partial", version, {"text": getter.result()})
+
+        try:
+            text = task.result()
+        except (ValueError, httpx.HTTPError) as e:
+            error = transcription_error(e)
+            yield format_sse(
+                "error",
+                version + 1,
+                {"status_code": error.status_code, "detail": error.detail},
+            )
+            return
+        yield format_sse("result", version + 1, {"text": text})
+    finally:
+        task.cancel()
+
+
 @router.post("/transcribe", response_model=TranscribeResponse)
-async def transcribe_audio(body: TranscribeRequest) -> TranscribeResponse:
-    """Transcribe audio to text (stub implementation)"""
+async def transcribe_audio(
+    request: Request, body: TranscribeRequest, accept: str | None = Header(None)
+) -> TranscribeResponse | StreamingResponse:
+    """Transcribe audio to text
 
-    # TODO: Replace with actual Whisper/HuggingFace API call
-    # For now, return a stub response
+    With `Accept: text/event-stream` the transcript is streamed as it grows.
+    Chunks run on the API's bounded transcription pool, not the default one.
+    """
 
     if not body.audio_url:
         raise HTTPException(status_code=400, detail="audio_url is required")
 
-    # Stub: return a fixed text for demonstration
-    stub_text = (
-        "I was flying over a magical forest at night. "
-        "A glowing bird appeared and guided me to a floating house. "
-        "Feathers were falling from the sky like rain."
-    )
+    await enforce_rate_limit(request, body.user_id, scope="transcriptions")
+    executor = request.app.state.transcribe_pool
+
+    if accepts(accept, "text/event-stream"):
+        return StreamingResponse(
+            transcript_events(body.audio_url, executor),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    try:
+        text = await transcribe_url(body.audio_url, executor)
+    except (ValueError, httpx.HTTPError) as e:
+        raise transcription_error(e) from e
 
-    return TranscribeResponse(text=stub_text)
+    return TranscribeResponse(text=text)
@@ -1,8 +1,8 @@
 from enum import Enum
-from typing import Any, Optional
+from typing import Any
 from uuid import UUID
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, field_validator, model_validator
 
 
 class StyleEnum(str, Enum):
@@ -40,30 +40,74 @@ class JobStatusEnum(str, Enum):
 
 
 class CreateJobRequest(BaseModel):
-    dream_text: Optional[str] = Field(None, min_length=30, max_length=2000)
-    audio_url: Optional[str] = None
-    output_type: OutputTypeEnum = Field(..., description="Type of output: image, video, or game")
+    dream_text: str | None = Field(None, min_length=30, max_length=2000)
+    audio_url: str | None = None
+    output_type: OutputTypeEnum | None = Field(
+        None, description="Type of output: image, video, or game"
+    )
+    output_types: list[OutputTypeEnum] | None = Field(
+        None,
+        min_length=1,
+        description=(
+            "Several outputs from one job (POST /v1/generate): "
+            "one shared analysis, then each output"
+        ),
+    )
     style: StyleEnum = Field(..., description="Visual style of the world")
     mood: MoodEnum = Field(..., description="Emotional mood of the world")
     length: LengthEnum = Field(..., description="Duration of the experience")
-    user_id: Optional[str] = None
+    user_id: str | None = None
+    bypass_cache: bool = Field(False, description="Skip the generation result cache")
 
     @field_validator("dream_text", "audio_url")
     @classmethod
-    def validate_dream_input(cls, v: Optional[str], info: Any) -> Optional[str]:
+    def validate_dream_input(cls, v: str | None, info: Any) -> str | None:
         # At least one of dream_text or audio_url must be provided
         return v
 
+    @model_validator(mode="after")
+    def validate_output_types(self) -> "CreateJobRequest":
+        if self.output_types is None:
+            if self.output_type is None:
+                raise ValueError("output_type or output_types is required")
+            return self
+        # Canonical order (cheapest first), so equal sets give equal requests
+        types = [t for t in OutputTypeEnum if t in self.output_types]
+        if self.output_type is not None and self.output_type not in types:
+            raise ValueError("output_type must be one of output_types")
+        # The most expensive output stands for the job (result.output_type, scheduling)
+        self.output_type = types[-1]
+        self.output_types = types if len(types) > 1 else None
+        return self
+
 
 class CreateJobResponse(BaseModel):
     job_id: UUID
     status: JobStatusEnum
 
 
+class CreateJobBatchRequest(BaseModel):
+    # Items are validated individually so one bad item doesn't reject the batch
+    jobs: list[dict[str, Any]] = Field(..., min_length=1, max_length=500)
+
+
+class BatchJobItemResult(BaseModel):
+    index: int
+    job_id: UUID | None = None
+    status: JobStatusEnum | None = None
+    error: str | None = None
+
+
+class CreateJobBatchResponse(BaseModel):
+    accepted: int
+    rejected: int
+    results: list[BatchJobItemResult]
+
+
 class BlueprintCharacter(BaseModel):
     type: str
-    role: Optional[str] = None
-    float: Optional[bool] = None
+    role: str | None = None
+    float: bool | None = None
 
 
 class Blueprint(BaseModel):
@@ -78,22 +122,28 @@ class Blueprint(BaseModel):
 
 class JobResult(BaseModel):
     output_type: OutputTypeEnum
-    webgl_url: Optional[str] = None  # For game output
-    image_url: Optional[str] = None  # For image output
-    video_url: Optional[str] = None  # For video output
-    blueprint: Optional[Blueprint] = None  # For game output
+    output_types: list[OutputTypeEnum] | None = (
+        None  # Multi-output jobs: every output included
+    )
+    webgl_url: str | None = None  # For game output
+    build_id: str | None = None  # Shared WebGL build the game points at
+    image_url: str | None = None  # For image output
+    video_url: str | None = None  # For video output
+    blueprint: Blueprint | None = None  # For game output
 
 
 class GetJobResponse(BaseModel):
     job_id: UUID
     status: JobStatusEnum
     progress: int = Field(ge=0, le=100)
-    result: Optional[JobResult] = None
-    error: Optional[str] = None
+    result: JobResult | None = None
+    error: str | None = None
+    partial: dict[str, Any] | None = None  # Streamed output so far, while generating
 
 
 class TranscribeRequest(BaseModel):
     audio_url: str
+    user_id: str | None = None  # Rate limited per user when given, else per client IP
 
 
 class TranscribeResponse(BaseModel):
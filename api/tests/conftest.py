@@ -1,15 +1,55 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import fakeredis
 import pytest
-from unittest.mock import AsyncMock, MagicMock
+from fastapi.testclient import TestClient
+from workers.scheduler import CLASSES, Scheduler, user_list_key
+
+from main import app
+
+
+@pytest.fixture
+def fake_server():
+    """In-memory Redis server shared by the async API client and sync helpers"""
+    return fakeredis.FakeServer()
 
 
 @pytest.fixture(autouse=True)
-def mock_lifespan(monkeypatch):
-    """Mock the lifespan context manager to avoid Redis connection during tests"""
+def fake_app_state(fake_server):
+    """Replace the lifespan-managed Redis connection and its dependents with fakes"""
+    app.state.redis = fakeredis.FakeAsyncRedis(
+        server=fake_server, decode_responses=True
+    )
+    app.state.scheduler = Scheduler(app.state.redis)
+    with ThreadPoolExecutor(2) as app.state.transcribe_pool:
+        yield app.state.redis
+
+
+@pytest.fixture
+def mock_redis(fake_server):
+    """Synchronous view of the fake Redis, for seeding and inspecting job data"""
+    return fakeredis.FakeRedis(server=fake_server, decode_responses=True)
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def queued_jobs(mock_redis):
+    """Scheduler entries waiting in any class (with job_class and user), oldest first"""
 
-    async def mock_lifespan_func(app):
-        # Mock Redis
-        app.state.redis = AsyncMock()
-        yield
-        # Cleanup
+    def entries():
+        queued = []
+        for job_class in CLASSES:
+            for key in mock_redis.scan_iter(user_list_key(job_class, "*")):
+                user = key.rsplit(":", 1)[1]
+                for entry in mock_redis.lrange(key, 0, -1):
+                    queued.append(
+                        {**json.loads(entry), "job_class": job_class, "user": user}
+                    )
+        return sorted(queued, key=lambda entry: entry["enqueued_at"])
 
-    monkeypatch.setattr("main.lifespan", mock_lifespan_func)
+    return entries
@@ -1,22 +1,13 @@
+import base64
 import json
-import pytest
-from fastapi.testclient import TestClient
-from unittest.mock import AsyncMock, patch
+import threading
+import time
 
-from main import app
-
-
-@pytest.fixture
-def client():
-    return TestClient(app)
-
-
-@pytest.fixture
-def mock_redis():
-    with patch("routes.jobs.Request.app.state.redis") as mock:
-        mock.set = AsyncMock()
-        mock.get = AsyncMock()
-        yield mock
+import msgpack
+from workers.blueprints import blueprint_key, canonical_blueprint
+from workers.builds import build_id
+from workers.job_store import JobStore, status_document_key
+from workers.scheduler import Scheduler
 
 
 def test_root_endpoint(client):
@@ -37,6 +28,7 @@ def test_create_job_with_valid_data(client, mock_redis):
     """Test creating a job with valid dream text"""
     payload = {
         "dream_text": "I was flying over a magical forest at night. A bird guided me.",
+        "output_type": "game",
         "style": "lowpoly",
         "mood": "mystic",
         "length": "short",
@@ -53,6 +45,7 @@ def test_create_job_with_valid_data(client, mock_redis):
 def test_create_job_without_dream_text_or_audio(client):
     """Test creating a job without dream text or audio fails"""
     payload = {
+        "output_type": "game",
         "style": "lowpoly",
         "mood": "mystic",
         "length": "short",
@@ -95,8 +88,6 @@ def test_create_job_with_invalid_style(client):
 
 def test_get_job_not_found(client, mock_redis):
     """Test getting a non-existent job"""
-    mock_redis.get.return_value = None
-
     response = client.get("/v1/jobs/00000000-0000-0000-0000-000000000000")
 
     assert response.status_code == 404
@@ -111,6 +102,7 @@ def test_get_job_success(client, mock_redis):
         "status": "ready",
         "progress": 100,
         "result": {
+            "output_type": "game",
             "webgl_url": f"/webgl/{job_id}/index.html",
             "blueprint": {
                 "world": "forest",
@@ -124,7 +116,7 @@ def test_get_job_success(client, mock_redis):
         },
     }
 
-    mock_redis.get.return_value = json.dumps(job_data)
+    JobStore(mock_redis).create(job_data)
 
     response = client.get(f"/v1/jobs/{job_id}")
 
@@ -135,13 +127,463 @@ def test_get_job_success(client, mock_redis):
     assert data["progress"] == 100
 
 
-def test_transcribe_audio(client):
-    """Test audio transcription endpoint"""
-    payload = {"audio_url": "http://example.com/audio.mp3"}
+def test_status_document_matches_validated_response(client, mock_redis):
+    """Test the pre-rendered status body equals the validated one at every step"""
+    job_id = "12345678-1234-1234-1234-123456789012"
+    store = JobStore(mock_redis)
+
+    def assert_same():
+        served = client.get(f"/v1/jobs/{job_id}")
+        assert served.headers["content-type"] == "application/json"
+        document = mock_redis.get(status_document_key(job_id))
+        mock_redis.delete(status_document_key(job_id))
+        assert served.json() == client.get(f"/v1/jobs/{job_id}").json()
+        mock_redis.set(status_document_key(job_id), document)
+
+    store.create(
+        {"job_id": job_id, "status": "queued", "progress": 0, "dream_text": "x" * 40}
+    )
+    assert_same()
+    store.set_status(job_id, "generating", 30)
+    store.set_partial(
+        job_id, "generating", 30, {"output_type": "video", "storyboard": 'Scène 1 "é"'}
+    )
+    assert_same()
+    store.set_status(
+        job_id,
+        "ready",
+        100,
+        result={
+            "output_type": "game",
+            "output_types": ["video", "game"],
+            "video_url": "https://example.com/v.mp4",
+            "webgl_url": "/webgl/builds/abc/index.html",
+            "build_id": "abc",
+            "storyboard": "not part of the public result",
+            "blueprint": {
+                **BLUEPRINT,
+                "characters": [{"type": "bird", "role": "guide", "extra": 1}],
+            },
+        },
+    )
+    assert_same()
+    assert "storyboard" not in client.get(f"/v1/jobs/{job_id}").text
+
+    store.set_status(job_id, "failed", 0, error='LLM said "no" / timed out')
+    assert_same()
+    assert (
+        client.get(f"/v1/jobs/{job_id}").json()["error"] == 'LLM said "no" / timed out'
+    )
+
+
+BLUEPRINT = {
+    "world": "forest",
+    "time": "night",
+    "weather": "clear",
+    "goal": "explore",
+    "characters": [{"type": "bird", "role": "guide"}],
+    "style": "lowpoly",
+    "mood": "mystic",
+}
+
+
+def create_ready_game(mock_redis, job_id):
+    store = JobStore(mock_redis)
+    store.create({"job_id": job_id, "status": "building", "progress": 75})
+    store.set_status(
+        job_id, "ready", 100, result={"output_type": "game", "blueprint": BLUEPRINT}
+    )
+
+
+def test_get_blueprint_is_cacheable(client, mock_redis):
+    """Test the blueprint has a strong ETag and cache headers, and revalidates to 304"""
+    job_id = "12345678-1234-1234-1234-123456789012"
+    create_ready_game(mock_redis, job_id)
+
+    response = client.get(
+        f"/v1/jobs/{job_id}/blueprint", headers={"Accept-Encoding": "identity"}
+    )
+
+    assert response.status_code == 200
+    assert response.json() == BLUEPRINT
+    assert response.content == canonical_blueprint(BLUEPRINT)
+    etag = response.headers["etag"]
+    assert etag == f'"{build_id(BLUEPRINT)}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    revalidated = client.get(
+        f"/v1/jobs/{job_id}/blueprint",
+        headers={"Accept-Encoding": "identity", "If-None-Match": etag},
+    )
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["etag"] == etag
+    assert revalidated.headers["vary"] == "Accept, Accept-Encoding"
+
+
+def test_blueprint_variants_have_their_own_etags(client, mock_redis):
+    """Test a tag revalidates only the representation it was issued for"""
+    job_id = "12345678-1234-1234-1234-123456789012"
+    create_ready_game(mock_redis, job_id)
+    url = f"/v1/jobs/{job_id}/blueprint"
+
+    plain = client.get(url, headers={"Accept-Encoding": "identity"})
+    gzipped = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert gzipped.headers["etag"] == f'"{build_id(BLUEPRINT)}-gzip"'
+    stale = client.get(
+        url, headers={"Accept-Encoding": "gzip", "If-None-Match": plain.headers["etag"]}
+    )
+    assert stale.status_code == 200
+    assert stale.headers["content-encoding"] == "gzip"
+    fresh = client.get(
+        url,
+        headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["etag"]},
+    )
+    assert fresh.status_code == 304
+    assert fresh.headers["vary"] == "Accept, Accept-Encoding"
+
+
+def test_get_blueprint_serves_precompressed_gzip(client, mock_redis):
+    """Test gzip clients get the stored compressed bytes, not per-request compression"""
+    job_id = "12345678-1234-1234-1234-123456789012"
+    create_ready_game(mock_redis, job_id)
+
+    response = client.get(
+        f"/v1/jobs/{job_id}/blueprint", headers={"Accept-Encoding": "gzip"}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json() == BLUEPRINT
+    stored = mock_redis.hget(blueprint_key(job_id), "gzip")
+    assert int(response.headers["content-length"]) == len(base64.b64decode(stored))
+
+
+def test_get_blueprint_serves_msgpack(client, mock_redis):
+    """Test MessagePack clients get the stored binary encoding with its own ETag"""
+    job_id = "12345678-1234-1234-1234-123456789012"
+    create_ready_game(mock_redis, job_id)
+    url = f"/v1/jobs/{job_id}/blueprint"
+
+    response = client.get(url, headers={"Accept": "application/msgpack"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/msgpack"
+    assert "content-encoding" not in response.headers
+    assert msgpack.unpackb(response.content) == BLUEPRINT
+    assert len(response.content) < len(canonical_blueprint(BLUEPRINT))
+    etag = response.headers["etag"]
+    assert etag == f'"{build_id(BLUEPRINT)}-msgpack"'
+    revalidated = client.get(
+        url, headers={"Accept": "application/msgpack", "If-None-Match": etag}
+    )
+    assert revalidated.status_code == 304
+
+
+def test_get_blueprint_not_ready(client, mock_redis):
+    """Test the blueprint of an unfinished job is not served (or cached)"""
+    job_id = "12345678-1234-1234-1234-123456789012"
+    JobStore(mock_redis).create(
+        {"job_id": job_id, "status": "building", "progress": 75}
+    )
+
+    response = client.get(f"/v1/jobs/{job_id}/blueprint")
+
+    assert response.status_code == 400
+    assert "immutable" not in response.headers.get("cache-control", "")
+
+
+def test_generate_enqueues_without_calling_llm(client, mock_redis, queued_jobs):
+    """Test /v1/generate persists the job and hands it to the worker queue"""
+    payload = {
+        "dream_text": "I was flying over a magical forest at night. A bird guided me.",
+        "output_type": "video",
+        "style": "surreal",
+        "mood": "calm",
+        "length": "long",
+    }
+
+    response = client.post("/v1/generate", json=payload)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["status"] == "queued"
+
+    store = JobStore(mock_redis)
+    job_data = store.get(data["job_id"])
+    assert job_data["status"] == "queued"
+    assert job_data["output_type"] == "video"
+    assert store.get_result(data["job_id"]) is None
+
+    [queued_job] = queued_jobs()
+    assert queued_job["func"] == "workers.orchestrator.process_generation"
+    assert queued_job["job_id"] == data["job_id"]
+    assert queued_job["job_class"] == "video:long"
+
+
+def test_generate_accepts_several_output_types(client, mock_redis, queued_jobs):
+    """Test a multi-output job is queued by its costliest output, on /v1/generate"""
+    payload = {
+        "dream_text": "I was flying over a magical forest at night. A bird guided me.",
+        "output_types": ["game", "image", "image"],
+        "style": "surreal",
+        "mood": "calm",
+        "length": "short",
+    }
+
+    response = client.post("/v1/generate", json=payload)
+
+    assert response.status_code == 200
+    job_data = JobStore(mock_redis).get(response.json()["job_id"])
+    assert job_data["output_types"] == "image,game"
+    assert job_data["output_type"] == "game"
+    [queued_job] = queued_jobs()
+    assert queued_job["job_class"] == "game:short"
+
+    assert client.post("/v1/jobs", json=payload).status_code == 400
+    assert (
+        client.post("/v1/generate", json={**payload, "output_types": None}).status_code
+        == 422
+    )
+    assert (
+        client.post(
+            "/v1/generate", json={**payload, "output_type": "video"}
+        ).status_code
+        == 422
+    )
+
+
+def parse_sse(body):
+    """Split an SSE body into (id, event, data) frames, skipping comments"""
+    frames = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(
+            line.split(": ", 1)
+            for line in block.splitlines()
+            if not line.startswith(":")
+        )
+        if lines:
+            frames.append((int(lines["id"]), lines["event"], json.loads(lines["data"])))
+    return frames
+
+
+def seed_events_job(mock_redis, job_id):
+    JobStore(mock_redis).create(
+        {
+            "job_id": job_id,
+            "status": "queued",
+            "progress": 0,
+            "dream_text": "I was flying over a magical forest at night.",
+            "output_type": "image",
+            "style": "lowpoly",
+            "mood": "mystic",
+            "length": "short",
+        }
+    )
+
+
+def test_job_events_streams_transitions_until_result(client, mock_redis):
+    """Test the event stream pushes worker transitions and ends with the result"""
+    job_id = "12345678-1234-1234-1234-123456789012"
+    seed_events_job(mock_redis, job_id)
+    store = JobStore(mock_redis)
+
+    def worker():
+        time.sleep(0.2)
+        store.set_status(job_id, "analyzing", 10)
+        store.set_status(job_id, "generating", 30)
+        store.set_status(
+            job_id, "ready", 100, result={"output_type": "image", "image_url": "x"}
+        )
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    response = client.get(f"/v1/jobs/{job_id}/events")
+    thread.join()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = parse_sse(response.text)
+    assert [(v, e, d["status"]) for v, e, d in frames] == [
+        (0, "status", "queued"),
+        (1, "status", "analyzing"),
+        (2, "status", "generating"),
+        (3, "result", "ready"),
+    ]
+    assert frames[-1][2]["result"] == {"output_type": "image", "image_url": "x"}
+
+
+def test_job_events_resume_after_reconnect(client, mock_redis):
+    """Test Last-Event-ID skips already-seen state but repeats the final event"""
+    job_id = "12345678-1234-1234-1234-123456789012"
+    seed_events_job(mock_redis, job_id)
+    store = JobStore(mock_redis)
+    store.set_status(job_id, "analyzing", 10)
+
+    def worker():
+        time.sleep(0.2)
+        store.set_status(job_id, "failed", 0, error="boom")
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    response = client.get(f"/v1/jobs/{job_id}/events", headers={"Last-Event-ID": "1"})
+    thread.join()
+
+    assert parse_sse(response.text) == [
+        (
+            2,
+            "result",
+            {"job_id": job_id, "status": "failed", "progress": 0, "error": "boom"},
+        ),
+    ]
+
+    again = client.get(f"/v1/jobs/{job_id}/events", headers={"Last-Event-ID": "2"})
+    assert [e for _, e, _ in parse_sse(again.text)] == ["result"]
+
+
+def test_get_job_includes_partial_output(client, mock_redis):
+    """Test polling clients see streamed LLM output while the job is generating"""
+    job_id = "12345678-1234-1234-1234-123456789012"
+    seed_events_job(mock_redis, job_id)
+    store = JobStore(mock_redis)
+    store.set_status(job_id, "generating", 30)
+    store.set_partial(
+        job_id, "generating", 30, {"output_type": "image", "prompt": "A glowing"}
+    )
+
+    data = client.get(f"/v1/jobs/{job_id}").json()
+    assert data["partial"] == {"output_type": "image", "prompt": "A glowing"}
+
+    # Finished jobs drop the partial output and refuse late chunks
+    store.set_status(
+        job_id, "ready", 100, result={"output_type": "image", "image_url": "x"}
+    )
+    assert store.set_partial(job_id, "generating", 30, {"prompt": "late"}) is False
+    assert client.get(f"/v1/jobs/{job_id}").json()["partial"] is None
+
+
+def test_job_events_forward_partial_output(client, mock_redis):
+    """Test streamed LLM output is pushed as partial events before the result"""
+    job_id = "12345678-1234-1234-1234-123456789012"
+    seed_events_job(mock_redis, job_id)
+    store = JobStore(mock_redis)
+    store.set_status(job_id, "generating", 30)
+    store.set_partial(
+        job_id, "generating", 30, {"output_type": "image", "prompt": "A glowing"}
+    )
+
+    def worker():
+        time.sleep(0.2)
+        store.set_partial(
+            job_id,
+            "generating",
+            30,
+            {"output_type": "image", "prompt": "A glowing forest"},
+        )
+        store.set_status(
+            job_id, "ready", 100, result={"output_type": "image", "image_url": "x"}
+        )
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    response = client.get(f"/v1/jobs/{job_id}/events")
+    thread.join()
+
+    frames = parse_sse(response.text)
+    assert [
+        (event, data.get("partial", {}).get("prompt")) for _, event, data in frames
+    ] == [
+        ("partial", "A glowing"),
+        ("partial", "A glowing forest"),
+        ("result", None),
+    ]
+
+
+def test_job_events_not_found(client):
+    """Test streaming a non-existent job"""
+    response = client.get("/v1/jobs/00000000-0000-0000-0000-000000000000/events")
+
+    assert response.status_code == 404
+
+
+def test_create_jobs_batch_reports_per_item_results(client, mock_redis, queued_jobs):
+    """Test a batch stores and enqueues valid items and reports invalid ones"""
+    valid = {
+        "dream_text": "I was flying over a magical forest at night. A bird guided me.",
+        "output_type": "game",
+        "style": "lowpoly",
+        "mood": "mystic",
+        "length": "short",
+    }
+    payload = {
+        "jobs": [valid, {**valid, "style": "invalid_style"}, {**valid, "mood": "calm"}]
+    }
 
-    response = client.post("/v1/transcribe", json=payload)
+    response = client.post("/v1/jobs:batch", json=payload)
 
     assert response.status_code == 200
     data = response.json()
-    assert "text" in data
-    assert len(data["text"]) > 0
+    assert data["accepted"] == 2
+    assert data["rejected"] == 1
+    assert [item["index"] for item in data["results"]] == [0, 1, 2]
+    assert data["results"][1]["job_id"] is None
+    assert "style" in data["results"][1]["error"]
+
+    job_ids = [data["results"][0]["job_id"], data["results"][2]["job_id"]]
+    store = JobStore(mock_redis)
+    assert [store.get(job_id)["mood"] for job_id in job_ids] == ["mystic", "calm"]
+
+    queued = queued_jobs()
+    assert [job["func"] for job in queued] == ["workers.orchestrator.process_dream"] * 2
+    assert [job["job_id"] for job in queued] == job_ids
+
+
+def test_create_jobs_batch_rejects_oversized_batch(client):
+    """Test the batch size cap"""
+    response = client.post("/v1/jobs:batch", json={"jobs": [{}] * 501})
+
+    assert response.status_code == 422
+
+
+def test_create_job_enqueues_process_dream(client, queued_jobs):
+    """Test /v1/jobs reaches the worker queue"""
+    payload = {
+        "dream_text": "I was flying over a magical forest at night. A bird guided me.",
+        "output_type": "game",
+        "style": "lowpoly",
+        "mood": "mystic",
+        "length": "short",
+    }
+
+    response = client.post("/v1/jobs", json=payload)
+
+    [queued_job] = queued_jobs()
+    assert queued_job["func"] == "workers.orchestrator.process_dream"
+    assert queued_job["job_id"] == response.json()["job_id"]
+    assert queued_job["job_class"] == "game:short"
+    assert queued_job["user"] == "anonymous"
+
+
+def test_create_job_marks_job_failed_when_queue_is_down(
+    client, mock_redis, monkeypatch
+):
+    """Test an enqueue failure surfaces as 503 and fails the stored job"""
+
+    async def broken_enqueue(*args, **kwargs):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(Scheduler, "enqueue", broken_enqueue)
+    payload = {
+        "dream_text": "I was flying over a magical forest at night. A bird guided me.",
+        "output_type": "game",
+        "style": "lowpoly",
+        "mood": "mystic",
+        "length": "short",
+    }
+
+    response = client.post("/v1/jobs", json=payload)
+
+    assert response.status_code == 503
+    [job_key] = [key for key in mock_redis.keys("job:*") if key.count(":") == 1]
+    assert mock_redis.hget(job_key, "status") == "failed"
@@ -0,0 +1,124 @@
+import asyncio
+import os
+
+import fakeredis
+import pytest
+from workers.assets import (
+    ASSET_GENERATORS,
+    INDEX_KEY,
+    AssetService,
+    ContentStore,
+    asset_key,
+    asset_specs,
+)
+
+BLUEPRINT = {
+    "world": "forest",
+    "mood": "mystic",
+    "characters": [{"type": "bird", "role": "guide"}, {"type": "house", "float": True}],
+}
+
+
+@pytest.fixture
+def counting_generators():
+    """Generators that count calls and take a moment, like a real model"""
+    calls = []
+
+    async def generate(spec):
+        calls.append(asset_key(spec))
+        await asyncio.sleep(0.05)
+        return f"{spec['type']}:{sorted(spec['params'].items())}".encode()
+
+    generators = {
+        category: (generate, ext) for category, (_, ext) in ASSET_GENERATORS.items()
+    }
+    return generators, calls
+
+
+def make_service(fake_server, tmp_path, generators):
+    r = fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    return AssetService(r, ContentStore(str(tmp_path)), generators)
+
+
+def test_asset_specs_match_blueprint():
+    """Test one spec per character, plus terrain and ambient audio"""
+    specs = asset_specs(BLUEPRINT)
+    assert [(s["category"], s["type"]) for s in specs] == [
+        ("models", "bird"),
+        ("models", "house"),
+        ("models", "terrain"),
+        ("audio", "ambient"),
+    ]
+    assert asset_key(specs[2]) == asset_key(
+        {**specs[2], "params": {"terrain": "forest"}}
+    )
+    assert asset_key(specs[2]) != asset_key(
+        {**specs[2], "params": {"terrain": "ocean"}}
+    )
+
+
+async def test_concurrent_jobs_share_one_generation_per_asset(
+    fake_server, tmp_path, counting_generators
+):
+    """Test many jobs across two workers generate each distinct asset exactly once"""
+    generators, calls = counting_generators
+    worker_a = make_service(fake_server, tmp_path, generators)
+    worker_b = make_service(fake_server, tmp_path, generators)
+
+    results = await asyncio.gather(
+        *(
+            (worker_a if i % 2 else worker_b).generate_for_blueprint(BLUEPRINT)
+            for i in range(20)
+        )
+    )
+
+    assert len(calls) == len(set(calls)) == 4
+    assert all(result == results[0] for result in results)
+
+    terrain = results[0]["models"][2]
+    assert terrain["type"] == "terrain"
+    assert terrain["file"] == f"/assets/{terrain['hash'][:2]}/{terrain['hash']}.glb"
+    assert os.path.exists(tmp_path / terrain["hash"][:2] / f"{terrain['hash']}.glb")
+
+    # Later jobs are served from the shared index without generating
+    await worker_a.generate_for_blueprint(BLUEPRINT)
+    assert len(calls) == 4
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    """Test the store is content-addressed and leaves no temp files behind"""
+    store = ContentStore(str(tmp_path))
+    first = store.put(b"same bytes", "glb")
+    second = store.put(b"same bytes", "glb")
+
+    assert first == second
+    files = [name for _, _, names in os.walk(tmp_path) for name in names]
+    assert files == [f"{first['hash']}.glb"]
+
+
+async def test_failed_generation_releases_the_asset(fake_server, tmp_path):
+    """Test a generator error reaches every waiter and a later request retries"""
+    attempts = []
+
+    async def flaky(spec):
+        attempts.append(spec["type"])
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError("generator down")
+        return b"ok"
+
+    generators = {
+        category: (flaky, ext) for category, (_, ext) in ASSET_GENERATORS.items()
+    }
+    service = make_service(fake_server, tmp_path, generators)
+    spec = {"category": "audio", "type": "ambient", "params": {"ambient": "calm"}}
+
+    results = await asyncio.gather(
+        service.get(spec), service.get(spec), return_exceptions=True
+    )
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+    assert attempts == ["ambient"]
+
+    ref = await service.get(spec)
+    assert ref["bytes"] == 2
+    assert await service.r.hexists(INDEX_KEY, asset_key(spec))
@@ -0,0 +1,43 @@
+import json
+
+from benchmarks.load_test import SCENARIOS, cli, compare, percentile
+
+
+def test_percentile_nearest_rank():
+    """Test percentiles pick actual samples by nearest rank"""
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 99) == 0.0
+
+
+def test_load_test_writes_results(tmp_path):
+    """Test a small offline run covers every scenario and writes comparable JSON"""
+    output = tmp_path / "results.json"
+    cli(
+        [
+            "--requests",
+            "6",
+            "--concurrency",
+            "3",
+            "--llm-latency-ms",
+            "0",
+            "--llm-jitter-ms",
+            "0",
+            "--output",
+            str(output),
+        ]
+    )
+
+    report = json.loads(output.read_text())
+    assert set(report["scenarios"]) == set(SCENARIOS)
+    for summary in report["scenarios"].values():
+        assert summary["requests"] == 6
+        assert summary["errors"] == 0
+        assert summary["throughput_rps"] > 0
+        latency = summary["latency_ms"]
+        assert latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+        assert summary["cpu_ms_per_request"] > 0
+
+    assert compare(report, report)[0].startswith("create_job")
@@ -0,0 +1,112 @@
+import asyncio
+import os
+
+import fakeredis
+import pytest
+from workers.build_gc import BuildGC
+from workers.builds import (
+    BUILDS_DIR,
+    LAST_USED_KEY,
+    BuildRegistry,
+    build_id,
+    publish_build,
+)
+from workers.job_store import JobStore
+
+JOB_LIVE = "0b1e6c2a-8d4f-4a57-9c3e-2f6a1b7d9e04"
+JOB_GONE = "5f3d9a71-2c6b-4e8a-b1d0-7a9e3c5f2b16"
+
+
+def blueprint(world):
+    return {"world": world, "mood": "calm", "characters": []}
+
+
+@pytest.fixture
+def r(fake_server):
+    return fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+
+
+async def add_build(registry, root, world):
+    """What the dream pipeline does for stage C"""
+    await registry.use(build_id(blueprint(world)))
+    build, written = publish_build(root, blueprint(world))
+    await registry.record_size(build, written)
+    return build, written
+
+
+def builds_on_disk(root):
+    return sorted(os.listdir(os.path.join(root, BUILDS_DIR)))
+
+
+async def test_expired_builds_are_removed(r, tmp_path):
+    """Test builds are removed once the last job using them has expired"""
+    root = str(tmp_path)
+    expired, size = await add_build(BuildRegistry(r, job_ttl=0), root, "forest")
+    live, _ = await add_build(BuildRegistry(r), root, "ocean")
+    await asyncio.sleep(0.01)
+
+    report = await BuildGC(r, root, grace_seconds=0).collect()
+
+    assert builds_on_disk(root) == [live]
+    assert report["expired"] == 1
+    assert report["bytes_reclaimed"] == size
+    assert await r.zscore(LAST_USED_KEY, expired) is None
+
+
+async def test_least_recently_used_builds_are_evicted_over_budget(r, tmp_path):
+    """Test eviction under the disk budget starts with the least recently used build"""
+    root = str(tmp_path)
+    registry = BuildRegistry(r)
+    forest, size = await add_build(registry, root, "forest")
+    await asyncio.sleep(0.01)
+    ocean, _ = await add_build(registry, root, "ocean")
+    await asyncio.sleep(0.01)
+    space, _ = await add_build(registry, root, "space")
+    await asyncio.sleep(0.01)
+    # Reusing the oldest build makes it the most recently used
+    await registry.use(forest)
+
+    report = await BuildGC(r, root, budget_bytes=2 * size, grace_seconds=0).collect()
+
+    assert builds_on_disk(root) == sorted([forest, space])
+    assert report["evicted"] == 1
+    assert report["bytes_in_use"] <= 2 * size
+
+
+async def test_build_used_during_a_sweep_is_kept(r, tmp_path):
+    """Test a build a worker starts using after the GC looked at it is not removed"""
+    root = str(tmp_path)
+    registry = BuildRegistry(r)
+    build, size = await add_build(registry, root, "forest")
+    seen = int(await r.zscore(LAST_USED_KEY, build))
+    await asyncio.sleep(0.01)
+    await registry.use(build)
+
+    gc = BuildGC(r, root, grace_seconds=0)
+    report = {"evicted": 0, "bytes_reclaimed": 0}
+    assert not await gc._remove(build, seen, size, "evicted", report)
+    assert builds_on_disk(root) == [build]
+
+
+async def test_expired_job_directories_and_leftovers_are_removed(
+    r, mock_redis, tmp_path
+):
+    """Test directories of expired jobs and crashed temp builds are cleaned up"""
+    root = tmp_path
+    for name in (JOB_LIVE, JOB_GONE, "fixtures"):
+        (root / name).mkdir()
+        (root / name / "blueprint.json").write_text("{}")
+    (root / BUILDS_DIR).mkdir()
+    (root / BUILDS_DIR / ".tmp-crashed").mkdir()
+    JobStore(mock_redis).create(
+        {"job_id": JOB_LIVE, "status": "ready", "progress": 100}
+    )
+    await asyncio.sleep(0.01)
+
+    report = await BuildGC(r, str(root), grace_seconds=0).collect()
+
+    # Only job-id directories are legacy job output: checked-in siblings stay
+    assert sorted(os.listdir(root)) == sorted([BUILDS_DIR, JOB_LIVE, "fixtures"])
+    assert os.listdir(root / BUILDS_DIR) == []
+    assert report["orphaned"] == 2
+    assert report["bytes_reclaimed"] == 2
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import fakeredis
+import pytest
+from workers import assets, orchestrator
+from workers.builds import BUILDS_DIR, build_id, canonical_blueprint, publish_build
+from workers.job_store import JobStore
+
+BLUEPRINT = {
+    "world": "forest",
+    "time": "night",
+    "weather": "feathers_rain",
+    "goal": "explore",
+    "characters": [{"type": "bird", "role": "guide"}],
+    "style": "lowpoly",
+    "mood": "mystic",
+}
+
+
+def test_build_id_ignores_key_order():
+    """Test equal blueprints map to one build regardless of key order"""
+    reordered = dict(reversed(list(BLUEPRINT.items())))
+    assert canonical_blueprint(reordered) == canonical_blueprint(BLUEPRINT)
+    assert build_id(reordered) == build_id(BLUEPRINT)
+    assert build_id({**BLUEPRINT, "world": "ocean"}) != build_id(BLUEPRINT)
+
+
+def test_concurrent_publishes_create_one_build(tmp_path):
+    """Test racing builders of the same world leave exactly one complete build"""
+    with ThreadPoolExecutor(8) as pool:
+        results = list(
+            pool.map(lambda _: publish_build(str(tmp_path), BLUEPRINT), range(16))
+        )
+
+    assert {build for build, _ in results} == {build_id(BLUEPRINT)}
+    assert sum(1 for _, written in results if written) == 1
+    # No temporary directories are left behind
+    assert os.listdir(tmp_path / BUILDS_DIR) == [build_id(BLUEPRINT)]
+    with open(tmp_path / BUILDS_DIR / build_id(BLUEPRINT) / "blueprint.json") as f:
+        assert json.load(f) == BLUEPRINT
+
+
+async def test_jobs_with_same_dream_share_a_build(
+    fake_server, mock_redis, tmp_path, monkeypatch
+):
+    """Test two jobs for the same dream point at one shared build"""
+    monkeypatch.setattr(orchestrator, "WEBGL_OUTPUT_DIR", str(tmp_path / "webgl"))
+    monkeypatch.setattr(assets, "ASSET_STORE_DIR", str(tmp_path / "assets"))
+
+    store = JobStore(mock_redis)
+    for job_id in ("job-a", "job-b"):
+        store.create(
+            {
+                "job_id": job_id,
+                "status": "queued",
+                "progress": 0,
+                "dream_text": "I was flying over a forest at night",
+                "output_type": "game",
+                "style": "lowpoly",
+                "mood": "mystic",
+                "length": "short",
+                "bypass_cache": True,
+            }
+        )
+
+    r = fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    async with orchestrator.WorkerContext(r) as ctx:
+        await asyncio.gather(
+            orchestrator.run_dream_pipeline(ctx, "job-a"),
+            orchestrator.run_dream_pipeline(ctx, "job-b"),
+        )
+
+    result_a, result_b = store.get_result("job-a"), store.get_result("job-b")
+    assert (
+        result_a["build_id"] == result_b["build_id"] == build_id(result_a["blueprint"])
+    )
+    assert result_a["webgl_url"] == f"/webgl/builds/{result_a['build_id']}/index.html"
+    assert os.listdir(tmp_path / "webgl" / BUILDS_DIR) == [result_a["build_id"]]
+
+
+async def test_pipeline_error_is_not_hidden_by_a_missing_job(
+    fake_server, mock_redis, tmp_path, monkeypatch
+):
+    """Test the stage's own error propagates when the job can't be marked failed"""
+    monkeypatch.setattr(assets, "ASSET_STORE_DIR", str(tmp_path / "assets"))
+
+    def expire_then_fail(blueprint):
+        mock_redis.delete("job:job-a")
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(orchestrator, "build_webgl_world", expire_then_fail)
+    JobStore(mock_redis).create(
+        {
+            "job_id": "job-a",
+            "status": "queued",
+            "progress": 0,
+            "dream_text": "I was flying over a forest at night",
+            "output_type": "game",
+            "style": "lowpoly",
+            "mood": "mystic",
+            "length": "short",
+            "bypass_cache": True,
+        }
+    )
+
+    r = fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    async with orchestrator.WorkerContext(r) as ctx:
+        with pytest.raises(RuntimeError, match="disk full"):
+            await orchestrator.run_dream_pipeline(ctx, "job-a")
@@ -0,0 +1,62 @@
+import pytest
+from workers.dream_rules import parse_many
+from workers.orchestrator import parse_dream_to_blueprint
+
+SAMPLE_DREAM = (
+    "I was flying over a magical forest at night. "
+    "A glowing bird appeared and guided me to a floating house. "
+    "Feathers were falling from the sky like rain."
+)
+
+
+def test_sample_dream_blueprint():
+    """Test the reference dream keeps its blueprint"""
+    blueprint = parse_dream_to_blueprint(SAMPLE_DREAM, "lowpoly", "mystic")
+
+    assert blueprint == {
+        "world": "forest",
+        "time": "night",
+        "weather": "feathers_rain",
+        "goal": "explore_world",
+        "characters": [
+            {"type": "bird", "role": "guide"},
+            {"type": "house", "float": True},
+        ],
+        "style": "lowpoly",
+        "mood": "mystic",
+    }
+
+
+@pytest.mark.parametrize(
+    "text, field, expected",
+    [
+        ("We watched the sunset over the hills", "time", "sunset"),
+        ("Someday I will go back there", "time", "night"),
+        ("I lay on the ground, perfectly still", "goal", "explore_world"),
+        ("I had to RUN from the shadows", "goal", "escape_danger"),
+        ("The sea was calm and the sun was out", "world", "ocean"),
+        ("A seashell on a shelf", "world", "forest"),
+    ],
+)
+def test_rules_match_whole_words(text, field, expected):
+    """Test keywords no longer fire inside longer words"""
+    assert parse_dream_to_blueprint(text, "toon", "calm")[field] == expected
+
+
+def test_first_listed_rule_wins():
+    """Test rule order decides between conflicting keywords"""
+    blueprint = parse_dream_to_blueprint(
+        "A city street next to the forest", "toon", "calm"
+    )
+
+    assert blueprint["world"] == "forest"
+
+
+def test_parse_many_matches_single_parse():
+    """Test the batch API returns one blueprint per dream, in order"""
+    dreams = [
+        (SAMPLE_DREAM, "lowpoly", "mystic"),
+        ("Lost in a desert storm, searching for water", "surreal", "tense"),
+    ]
+
+    assert parse_many(dreams) == [parse_dream_to_blueprint(*dream) for dream in dreams]
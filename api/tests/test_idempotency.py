@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+
+import rate_limit
+from main import app
+from routes import jobs
+
+PAYLOAD = {
+    "dream_text": "I was flying over a magical forest at night. A bird guided me.",
+    "output_type": "image",
+    "style": "lowpoly",
+    "mood": "mystic",
+    "length": "short",
+}
+
+
+def test_retry_returns_the_original_job(client, queued_jobs, monkeypatch):
+    """Test a retried request replays the first job without enqueueing it again"""
+    monkeypatch.setattr(rate_limit, "MAX_JOBS_ANONYMOUS", 1)
+    headers = {"Idempotency-Key": "retry-1"}
+
+    first = client.post("/v1/generate", json=PAYLOAD, headers=headers)
+    retry = client.post("/v1/generate", json=PAYLOAD, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json()["job_id"] == first.json()["job_id"]
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+    assert len(queued_jobs()) == 1
+
+    # Keys are per endpoint: the same key on /v1/jobs is a new request
+    assert client.post("/v1/jobs", json=PAYLOAD, headers=headers).status_code == 429
+
+
+def test_key_reused_for_a_different_request(client):
+    """Test reusing a key with another body is rejected rather than replayed"""
+    headers = {"Idempotency-Key": "retry-2"}
+    assert client.post("/v1/jobs", json=PAYLOAD, headers=headers).status_code == 200
+
+    response = client.post(
+        "/v1/jobs", json={**PAYLOAD, "mood": "calm"}, headers=headers
+    )
+
+    assert response.status_code == 422
+
+
+def test_failed_request_releases_the_key(client, queued_jobs, monkeypatch):
+    """Test a retry after a queue failure creates the job instead of replaying it"""
+
+    async def unavailable(request, func, job_data):
+        raise ConnectionError("queue down")
+
+    headers = {"Idempotency-Key": "retry-3"}
+    with monkeypatch.context() as patch:
+        patch.setattr(jobs, "enqueue", unavailable)
+        assert client.post("/v1/jobs", json=PAYLOAD, headers=headers).status_code == 503
+
+    response = client.post("/v1/jobs", json=PAYLOAD, headers=headers)
+
+    assert response.status_code == 200
+    assert "idempotent-replayed" not in response.headers
+    assert [job["job_id"] for job in queued_jobs()] == [response.json()["job_id"]]
+
+
+async def test_concurrent_duplicates_share_one_job(queued_jobs):
+    """Test a duplicate arriving while the original is in flight gets the same job"""
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = await asyncio.gather(
+            *(
+                client.post(
+                    "/v1/generate",
+                    json={**PAYLOAD, "user_id": "alice"},
+                    headers={"Idempotency-Key": "retry-4"},
+                )
+                for _ in range(5)
+            )
+        )
+
+    assert {response.status_code for response in responses} == {200}
+    assert len({response.json()["job_id"] for response in responses}) == 1
+    assert len(queued_jobs()) == 1
@@ -0,0 +1,159 @@
+import time
+
+import fakeredis
+import pytest
+from workers.job_store import (
+    AsyncJobStore,
+    JobStore,
+    count_live_jobs,
+    job_key,
+    live_index_key,
+    result_key,
+)
+
+
+@pytest.fixture
+def job_data():
+    return {
+        "job_id": "job-1",
+        "status": "queued",
+        "progress": 0,
+        "dream_text": "I was flying over a magical forest at night.",
+        "audio_url": None,
+        "style": "lowpoly",
+        "mood": "mystic",
+        "length": "short",
+        "bypass_cache": False,
+    }
+
+
+def test_create_round_trips_fields(mock_redis, job_data):
+    """Test job fields survive the hash encoding"""
+    store = JobStore(mock_redis)
+    store.create(job_data)
+
+    stored = store.get("job-1")
+    assert stored == {k: v for k, v in job_data.items() if v is not None}
+    assert 0 < mock_redis.ttl(job_key("job-1")) <= 86400
+
+
+def test_set_status_writes_fields_and_result_separately(mock_redis, job_data):
+    """Test a transition updates status/progress in place and stores the result apart"""
+    store = JobStore(mock_redis)
+    store.create(job_data)
+
+    store.set_status(
+        "job-1", "ready", 100, result={"output_type": "game", "webgl_url": "/webgl/x"}
+    )
+
+    assert store.get("job-1")["status"] == "ready"
+    assert store.get("job-1")["dream_text"] == job_data["dream_text"]
+    assert store.get_result("job-1") == {"output_type": "game", "webgl_url": "/webgl/x"}
+    assert mock_redis.type(result_key("job-1")) == "string"
+
+
+def test_set_status_on_missing_job_raises(mock_redis):
+    """Test transitions never resurrect an expired job"""
+    with pytest.raises(ValueError, match="not found"):
+        JobStore(mock_redis).set_status("missing", "analyzing", 10)
+
+    assert not mock_redis.exists(job_key("missing"))
+
+
+async def test_async_store_reads_status_and_result_in_one_call(fake_server, job_data):
+    """Test the API-side store sees worker-side transitions"""
+    store = AsyncJobStore(
+        fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    )
+    await store.create(job_data)
+    await store.set_status("job-1", "failed", 0, error="boom")
+
+    fields, result = await store.get_status("job-1")
+    assert fields == {
+        "status": "failed",
+        "progress": 0,
+        "error": "boom",
+        "version": 1,
+        "partial": None,
+    }
+    assert result is None
+    assert await store.get_status("missing") == (None, None)
+
+
+async def test_async_create_many_and_fail_many(fake_server, job_data, mock_redis):
+    """Test bulk writes and bulk failure land on every job"""
+    store = AsyncJobStore(
+        fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    )
+    jobs = [{**job_data, "job_id": f"job-{i}"} for i in range(3)]
+
+    await store.create_many(jobs)
+    await store.fail_many(["job-0", "job-2"], "queue down")
+
+    sync_store = JobStore(mock_redis)
+    assert [sync_store.get(f"job-{i}")["status"] for i in range(3)] == [
+        "failed",
+        "queued",
+        "failed",
+    ]
+    assert sync_store.get("job-0")["error"] == "queue down"
+
+
+async def test_status_counts_follow_transitions(fake_server, mock_redis, job_data):
+    """Test the per-status gauges move with each job and drop terminal jobs"""
+    r = fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    store = JobStore(mock_redis)
+    store.create(job_data)
+    store.create({**job_data, "job_id": "job-2"})
+    assert (await count_live_jobs(r))["queued"] == 2
+
+    store.set_status("job-1", "analyzing", 25)
+    store.set_status("job-1", "analyzing", 30)
+    counts = await count_live_jobs(r)
+    assert (counts["queued"], counts["analyzing"]) == (1, 1)
+
+    store.set_status("job-1", "ready", 100)
+    store.set_status("job-2", "failed", 0, error="boom")
+    assert await count_live_jobs(r) == dict.fromkeys(counts, 0)
+
+
+async def test_expired_jobs_leave_the_status_counts(fake_server, mock_redis, job_data):
+    """Test a job whose record expires unfinished is no longer counted"""
+    r = fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    store = JobStore(mock_redis, ttl=1)
+    store.create(job_data)
+    store.set_status("job-1", "generating", 50)
+    assert (await count_live_jobs(r))["generating"] == 1
+
+    time.sleep(1.1)
+
+    assert not mock_redis.exists(job_key("job-1"))
+    assert (await count_live_jobs(r))["generating"] == 0
+    assert mock_redis.zcard(live_index_key("generating")) == 0
+
+
+async def test_sync_and_async_stores_write_the_same_records(
+    fake_server, job_data, mock_redis
+):
+    """Test both stores leave identical keys after the same create and update calls"""
+    async_store = AsyncJobStore(
+        fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    )
+    sync_store = JobStore(mock_redis)
+    result = {"output_type": "image", "image_url": "https://example.com/x.png"}
+
+    sync_store.create({**job_data, "job_id": "sync"})
+    sync_store.set_partial("sync", "generating", 30, {"prompt": "A forest"})
+    sync_store.set_status("sync", "ready", 100, result=result)
+    await async_store.create({**job_data, "job_id": "async"})
+    await async_store.set_partial("async", "generating", 30, {"prompt": "A forest"})
+    await async_store.set_status("async", "ready", 100, result=result)
+
+    def records(job_id):
+        return (
+            {**mock_redis.hgetall(job_key(job_id)), "job_id": None},
+            mock_redis.get(result_key(job_id)),
+            mock_redis.get(f"job:{job_id}:status").replace(job_id, "<id>"),
+        )
+
+    assert records("sync") == records("async")
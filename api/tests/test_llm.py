@@ -0,0 +1,276 @@
+import asyncio
+import json
+import time
+
+import anthropic
+import pytest
+from prometheus_client import REGISTRY
+from workers import generators
+from workers.fake_llm import CACHE_MIN_TOKENS, FAKE_BLUEPRINT, serve_in_thread
+from workers.generators import generate_game_blueprint
+from workers.llm import LLMClient, ToolInput
+
+
+@pytest.fixture
+def fake_llm():
+    server = serve_in_thread(latency_ms=50)
+    yield server
+    server.shutdown()
+
+
+async def test_concurrency_governor_caps_in_flight_calls(fake_llm):
+    """Test no more than max_concurrency calls reach the upstream at once"""
+    async with LLMClient(
+        api_key="test", base_url=fake_llm.base_url, max_concurrency=2
+    ) as llm:
+        await asyncio.gather(
+            *[
+                llm.create_message(
+                    model="fake",
+                    max_tokens=50,
+                    messages=[{"role": "user", "content": f"dream {i}"}],
+                )
+                for i in range(6)
+            ]
+        )
+
+    stats = fake_llm.state.snapshot()
+    assert stats["requests"] == 6
+    assert stats["max_in_flight"] <= 2
+
+
+async def test_image_calls_do_not_wait_behind_a_game_burst(fake_llm):
+    """Test each output type has its own permits, so image latency stays flat"""
+
+    def call(output_type, i):
+        return llm.create_message(
+            output_type,
+            model="fake",
+            max_tokens=50,
+            messages=[{"role": "user", "content": f"dream {i}"}],
+        )
+
+    async def timed_image_call():
+        start = time.perf_counter()
+        await call("image", "alone")
+        return time.perf_counter() - start
+
+    async with LLMClient(
+        api_key="test", base_url=fake_llm.base_url, max_concurrency=2
+    ) as llm:
+        alone = await timed_image_call()
+        # Four rounds of game calls at two at a time
+        burst = asyncio.gather(*[call("game", i) for i in range(8)])
+        await asyncio.sleep(0.01)
+        during_burst = await timed_image_call()
+        await burst
+
+    # Queued behind the burst it would take about four more call latencies
+    assert during_burst < alone + 0.1
+    assert fake_llm.state.snapshot()["max_in_flight"] <= 4
+
+
+async def test_retries_transient_errors_then_raises():
+    """Test overloaded responses are retried up to max_retries"""
+    server = serve_in_thread(error_rate=1.0)
+    try:
+        async with LLMClient(
+            api_key="test", base_url=server.base_url, max_retries=2, backoff_base=0
+        ) as llm:
+            with pytest.raises(anthropic.APIStatusError):
+                await llm.create_message(
+                    model="fake",
+                    max_tokens=50,
+                    messages=[{"role": "user", "content": "dream"}],
+                )
+    finally:
+        server.shutdown()
+
+    assert server.state.snapshot()["requests"] == 3
+
+
+async def test_game_blueprint_against_fake_server(fake_llm):
+    """Test the game generator reads the blueprint from the forced tool call"""
+    labels = {"output_type": "game", "kind": "output"}
+    tokens_before = (
+        REGISTRY.get_sample_value("dreamquest_llm_tokens_count", labels) or 0.0
+    )
+    valid_before = blueprints_with("valid")
+
+    async with LLMClient(api_key="test", base_url=fake_llm.base_url) as llm:
+        blueprint = await generate_game_blueprint(
+            llm, "A forest at night with fog everywhere", "lowpoly", "mystic", "short"
+        )
+
+    # style/mood come from the job so the result validates as a Blueprint
+    assert blueprint == {**FAKE_BLUEPRINT, "style": "lowpoly", "mood": "mystic"}
+    assert (
+        REGISTRY.get_sample_value("dreamquest_llm_tokens_count", labels)
+        == tokens_before + 1
+    )
+    assert blueprints_with("valid") == valid_before + 1
+
+
+def blueprints_with(outcome):
+    return (
+        REGISTRY.get_sample_value(
+            "dreamquest_blueprint_output_tokens_count", {"outcome": outcome}
+        )
+        or 0.0
+    )
+
+
+async def test_truncated_blueprint_is_repaired(fake_llm, monkeypatch):
+    """Test a tool call cut off at max_tokens keeps its complete fields if enough"""
+    monkeypatch.setattr(generators, "BLUEPRINT_MAX_TOKENS", 50)
+    partials = []
+
+    async def on_partial(fields):
+        partials.append(fields["blueprint"])
+
+    async with LLMClient(api_key="test", base_url=fake_llm.base_url) as llm:
+        blueprint = await generate_game_blueprint(
+            llm, "A forest at night", "lowpoly", "mystic", "short", on_partial
+        )
+
+    # The cut fell inside "lighting": everything before it survives, nothing after
+    assert blueprint == {
+        **{
+            key: FAKE_BLUEPRINT[key]
+            for key in ("world", "time", "weather", "goal", "terrain", "characters")
+        },
+        "style": "lowpoly",
+        "mood": "mystic",
+    }
+    assert partials[-1]["characters"] == FAKE_BLUEPRINT["characters"]
+    assert fake_llm.state.snapshot()["requests"] == 1
+
+
+class ScriptedLLM:
+    """Answers stream_tool_input with canned tool input JSON, one per call"""
+
+    def __init__(self, *inputs):
+        self.inputs = list(inputs)
+        self.calls = []
+
+    async def stream_tool_input(self, on_json=None, output_type="other", **kwargs):
+        self.calls.append(kwargs)
+        result = ToolInput()
+        result.id, result.json, result.stop_reason = (
+            f"toolu_{len(self.calls)}",
+            self.inputs.pop(0),
+            "tool_use",
+        )
+        result.usage = type("Usage", (), {"output_tokens": 10})()
+        if on_json is not None:
+            await on_json(result.json)
+        return result
+
+
+async def test_invalid_blueprint_is_retried_then_falls_back():
+    """Test schema errors are sent back once, then the rules parser takes over"""
+    llm = ScriptedLLM('{"world": "forest", "time": 7}', '{"world": "forest"}')
+    fallbacks_before = blueprints_with("fallback")
+
+    blueprint = await generate_game_blueprint(
+        llm, "I was flying over an ocean at sunset", "lowpoly", "calm", "short"
+    )
+
+    assert len(llm.calls) == 2
+    feedback = llm.calls[1]["messages"][-1]["content"][0]
+    assert feedback["is_error"] and feedback["tool_use_id"] == "toolu_1"
+    assert "blueprint.time must be a string" in feedback["content"]
+    assert blueprint["world"] == "ocean" and blueprint["style"] == "lowpoly"
+    assert blueprints_with("fallback") == fallbacks_before + 1
+
+
+async def test_static_prompt_prefix_is_cached():
+    """Test the second call reads the system prompt the first one wrote to the cache"""
+    server = serve_in_thread(cache_min_tokens=50)
+    try:
+        async with LLMClient(api_key="test", base_url=server.base_url) as llm:
+            await generators.generate_image_with_claude(
+                llm, "A forest at night", "toon", "calm"
+            )
+            written = server.state.snapshot()["tokens"]
+            await generators.generate_image_with_claude(
+                llm, "An ocean of feathers", "lowpoly", "tense"
+            )
+            tokens = server.state.snapshot()["tokens"]
+    finally:
+        server.shutdown()
+
+    assert written["cache_write"] > 0 and written["cache_read"] == 0
+    assert tokens["cache_read"] == written["cache_write"]
+    assert tokens["cache_write"] == written["cache_write"]
+    # Only the dream itself is sent uncached
+    assert tokens["input"] - written["input"] < 30
+
+
+async def test_fake_llm_caches_prompt_prefixes_past_the_minimum():
+    """Test a breakpoint prefix is written, then read; shorter ones are not cached"""
+    server = serve_in_thread()
+    system = [
+        {
+            "type": "text",
+            "text": "Static instructions. " * 400,
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
+    labels = {"output_type": "other", "kind": "cache_read"}
+    read_before = REGISTRY.get_sample_value("dreamquest_llm_tokens_sum", labels) or 0.0
+    try:
+        async with LLMClient(api_key="test", base_url=server.base_url) as llm:
+            await generators.generate_image_with_claude(
+                llm, "A forest at night", "toon", "calm"
+            )
+            assert server.state.snapshot()["tokens"]["cache_write"] == 0
+            for dream in ("A forest at night", "An ocean of feathers"):
+                await llm.stream_message(
+                    None,
+                    model="test",
+                    max_tokens=50,
+                    system=system,
+                    messages=[{"role": "user", "content": dream}],
+                )
+            tokens = server.state.snapshot()["tokens"]
+    finally:
+        server.shutdown()
+
+    assert tokens["cache_write"] >= CACHE_MIN_TOKENS
+    assert tokens["cache_read"] == tokens["cache_write"]
+    assert (
+        REGISTRY.get_sample_value("dreamquest_llm_tokens_sum", labels)
+        == read_before + tokens["cache_read"]
+    )
+
+
+class RestartingLLM(ScriptedLLM):
+    """Streams part of the input, then restarts it as a retried call does"""
+
+    async def stream_tool_input(self, on_json=None, output_type="other", **kwargs):
+        text = self.inputs[0]
+        # The failed attempt sampled a different, longer beginning
+        await on_json('{"world": "a desert of glass under two moons", "ti')
+        for end in range(1, len(text) + 1, 25):
+            await on_json(text[:end])
+        return await super().stream_tool_input(on_json, output_type, **kwargs)
+
+
+async def test_restarted_stream_is_parsed_from_the_start():
+    """Test a stream restarted by a retry still yields the blueprint in one call"""
+    llm = RestartingLLM(json.dumps(FAKE_BLUEPRINT))
+    partials = []
+
+    async def on_partial(fields):
+        partials.append(fields["blueprint"])
+
+    blueprint = await generate_game_blueprint(
+        llm, "A forest at night", "toon", "calm", "short", on_partial
+    )
+
+    assert len(llm.calls) == 1
+    assert blueprint == {**FAKE_BLUEPRINT, "style": "toon", "mood": "calm"}
+    assert (
+        partials[0]["world"].startswith("a desert") and partials[-1] == FAKE_BLUEPRINT
+    )
@@ -0,0 +1,89 @@
+from prometheus_client import REGISTRY
+from workers.metrics import stage_timer
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_metrics_endpoint_reports_requests_and_gauges(client, mock_redis):
+    """Test request latency by route template and the Redis-backed gauges"""
+    before = sample(
+        "dreamquest_http_request_duration_seconds_count",
+        method="POST",
+        route="/v1/jobs",
+        status="200",
+    )
+    creates = sample("dreamquest_redis_operations_total", operation="job.create")
+
+    response = client.post(
+        "/v1/jobs",
+        json={
+            "dream_text": (
+                "I was flying over a magical forest at night with glowing trees"
+            ),
+            "output_type": "game",
+            "style": "lowpoly",
+            "mood": "mystic",
+            "length": "short",
+        },
+    )
+    assert response.status_code == 200
+    client.get(f"/v1/jobs/{response.json()['job_id']}")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+
+    assert 'dreamquest_queue_depth{queue="game:short"} 1.0' in body
+    assert 'dreamquest_queue_depth{queue="image:short"} 0.0' in body
+    assert 'dreamquest_jobs{status="queued"} 1.0' in body
+    assert 'dreamquest_jobs{status="analyzing"} 0.0' in body
+    # Route templates, never raw job ids
+    assert 'route="/v1/jobs/{job_id}"' in body
+    assert (
+        sample(
+            "dreamquest_http_request_duration_seconds_count",
+            method="POST",
+            route="/v1/jobs",
+            status="200",
+        )
+        == before + 1
+    )
+    assert (
+        sample("dreamquest_redis_operations_total", operation="job.create")
+        == creates + 1
+    )
+
+
+def test_unmatched_routes_share_one_label(client):
+    """Test 404s on arbitrary paths don't create a series per path"""
+    before = sample(
+        "dreamquest_http_request_duration_seconds_count",
+        method="GET",
+        route="unmatched",
+        status="404",
+    )
+    client.get("/no/such/path/1")
+    client.get("/no/such/path/2")
+    assert (
+        sample(
+            "dreamquest_http_request_duration_seconds_count",
+            method="GET",
+            route="unmatched",
+            status="404",
+        )
+        == before + 2
+    )
+
+
+def test_stage_timer_records_duration():
+    """Test stage_timer observes into the stage histogram"""
+    before = sample("dreamquest_stage_duration_seconds_count", stage="test_stage")
+    with stage_timer("test_stage"):
+        pass
+    assert (
+        sample("dreamquest_stage_duration_seconds_count", stage="test_stage")
+        == before + 1
+    )
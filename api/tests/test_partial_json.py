@@ -0,0 +1,32 @@
+import pytest
+from workers.partial_json import IncrementalJSONParser, parse_partial_json
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ('{"world": "forest", "goal": "expl', {"world": "forest"}),
+        ('{"world": "forest", "goal"', {"world": "forest"}),
+        ('{"a": [1, 2, {"b": tr', {"a": [1, 2, {}]}),
+        ('{"a": 12', {}),
+        ('{"a": "say \\"hi\\"", "b": [', {"a": 'say "hi"', "b": []}),
+        ("", None),
+    ],
+)
+def test_truncated_json_keeps_only_complete_values(text, expected):
+    """Test repair drops the truncated tail instead of guessing it"""
+    assert parse_partial_json(text) == (expected, False)
+
+
+def test_fragments_parse_like_the_whole_document():
+    """Test feeding one character at a time ends at the same value, marked complete"""
+    text = (
+        '{"world": "ocean", '
+        '"characters": [{"type": "guide", "float": false}], "n": -1.5}'
+    )
+    parser = IncrementalJSONParser()
+    for char in text:
+        parser.feed(char)
+
+    assert parser.complete
+    assert parser.snapshot() == parse_partial_json(text)[0]
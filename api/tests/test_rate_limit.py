@@ -0,0 +1,97 @@
+import math
+import time
+
+import fakeredis
+
+import rate_limit
+from rate_limit import check_rate_limit
+
+PAYLOAD = {
+    "dream_text": "I was flying over a magical forest at night. A bird guided me.",
+    "output_type": "game",
+    "style": "lowpoly",
+    "mood": "mystic",
+    "length": "short",
+}
+
+
+def test_anonymous_clients_are_limited_per_ip(client, monkeypatch):
+    """Test the anonymous limit spans /v1/jobs and /v1/generate with a Retry-After"""
+    monkeypatch.setattr(rate_limit, "MAX_JOBS_ANONYMOUS", 3)
+    for path in ("/v1/jobs", "/v1/generate", "/v1/jobs"):
+        assert client.post(path, json=PAYLOAD).status_code == 200
+
+    response = client.post("/v1/generate", json=PAYLOAD)
+
+    assert response.status_code == 429
+    assert (
+        1
+        <= int(response.headers["retry-after"])
+        <= rate_limit.RATE_LIMIT_WINDOW_SECONDS
+    )
+
+
+def test_users_are_limited_separately(client, monkeypatch):
+    """Test a user_id gets its own, larger budget"""
+    monkeypatch.setattr(rate_limit, "MAX_JOBS_AUTHENTICATED", 5)
+    for _ in range(5):
+        assert (
+            client.post("/v1/jobs", json={**PAYLOAD, "user_id": "alice"}).status_code
+            == 200
+        )
+
+    assert (
+        client.post("/v1/jobs", json={**PAYLOAD, "user_id": "alice"}).status_code == 429
+    )
+    assert (
+        client.post("/v1/jobs", json={**PAYLOAD, "user_id": "bob"}).status_code == 200
+    )
+    assert client.post("/v1/jobs", json=PAYLOAD).status_code == 200
+
+
+def test_large_batches_fit_the_default_limits(client, queued_jobs):
+    """Test batches of hundreds are accepted without using the interactive budget"""
+    response = client.post(
+        "/v1/jobs:batch", json={"jobs": [{**PAYLOAD, "user_id": "ingest"}] * 500}
+    )
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 500
+
+    response = client.post("/v1/jobs:batch", json={"jobs": [PAYLOAD] * 20})
+    assert response.status_code == 200
+    assert len(queued_jobs()) == 520
+    assert (
+        client.post("/v1/jobs", json={**PAYLOAD, "user_id": "ingest"}).status_code
+        == 200
+    )
+
+
+def test_batch_larger_than_the_limit_is_refused(client, queued_jobs, monkeypatch):
+    """Test a batch that can never fit gets 413 and a fitting one still passes"""
+    monkeypatch.setattr(rate_limit, "MAX_BATCH_JOBS_ANONYMOUS", 3)
+
+    response = client.post("/v1/jobs:batch", json={"jobs": [PAYLOAD] * 4})
+
+    assert response.status_code == 413
+    assert "retry-after" not in response.headers
+    assert "at most 3" in response.json()["detail"]
+    assert queued_jobs() == []
+    assert (
+        client.post("/v1/jobs:batch", json={"jobs": [PAYLOAD] * 3}).status_code == 200
+    )
+
+
+async def test_window_slides(fake_server, monkeypatch):
+    """Test capacity returns as requests leave the window; batches fit or fail whole"""
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_WINDOW_SECONDS", 1)
+    r = fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+
+    assert await check_rate_limit(r, "client", limit=3, cost=2) == (True, 0)
+    allowed, retry_after = await check_rate_limit(r, "client", limit=3, cost=2)
+    assert not allowed
+    assert 0 < retry_after <= 1
+
+    time.sleep(retry_after + 0.01)
+    assert (await check_rate_limit(r, "client", limit=3, cost=2))[0]
+    assert await r.zcard("client") == 2
+    assert await check_rate_limit(r, "client", limit=3, cost=4) == (False, math.inf)
@@ -0,0 +1,162 @@
+import fakeredis
+import pytest
+from workers import near_duplicates, orchestrator
+from workers.job_store import JobStore
+from workers.near_duplicates import (
+    BUCKET_CAP,
+    find_near_duplicate,
+    index_result,
+    signature,
+    similarity,
+)
+from workers.result_cache import cache_key
+
+
+@pytest.fixture
+def worker_redis(fake_server, mock_redis, monkeypatch):
+    """Point the worker at the same fake Redis as the API"""
+    monkeypatch.setattr(
+        orchestrator,
+        "get_async_redis",
+        lambda: fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True),
+    )
+    return mock_redis
+
+
+def seed_job(r, job_id, **overrides):
+    job_data = {
+        "job_id": job_id,
+        "status": "queued",
+        "progress": 0,
+        "dream_text": "I was flying over a magical forest at night.",
+        "output_type": "image",
+        "style": "lowpoly",
+        "mood": "mystic",
+        "length": "short",
+        **overrides,
+    }
+    JobStore(r).create(job_data)
+
+
+def test_cache_key_ignores_case_and_whitespace():
+    """Test trivially different dream texts share a cache key"""
+    base = {"style": "toon", "mood": "calm", "length": "short"}
+    a = cache_key("image", {**base, "dream_text": "A  Forest at night"})
+    b = cache_key("image", {**base, "dream_text": "a forest at\nnight "})
+    c = cache_key("video", {**base, "dream_text": "a forest at night"})
+
+    assert a == b
+    assert a != c
+
+
+def test_repeat_generation_is_served_from_cache(client, worker_redis, monkeypatch):
+    """Test the second identical job finishes without calling the LLM"""
+    calls = []
+
+    async def fake_stage(ctx, output_type, job_data, dream_text, on_partial=None):
+        calls.append(job_data["job_id"])
+        return {"output_type": output_type, "image_url": "https://example.com/x.png"}
+
+    monkeypatch.setattr(orchestrator, "run_generation_stage", fake_stage)
+
+    seed_job(worker_redis, "job-1")
+    seed_job(
+        worker_redis,
+        "job-2",
+        dream_text="i was flying over a   magical forest at night.",
+    )
+    orchestrator.process_generation("job-1")
+    orchestrator.process_generation("job-2")
+
+    assert calls == ["job-1"]
+    store = JobStore(worker_redis)
+    assert store.get("job-2")["status"] == "ready"
+    assert store.get_result("job-2")["image_url"] == "https://example.com/x.png"
+
+    stats = client.get("/v1/cache/stats").json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_bypass_cache_always_generates(worker_redis, monkeypatch):
+    """Test bypass_cache jobs neither read nor write the cache"""
+    calls = []
+
+    async def fake_stage(ctx, output_type, job_data, dream_text, on_partial=None):
+        calls.append(job_data["job_id"])
+        return {"output_type": output_type}
+
+    monkeypatch.setattr(orchestrator, "run_generation_stage", fake_stage)
+
+    seed_job(worker_redis, "job-1", bypass_cache=True)
+    seed_job(worker_redis, "job-2", bypass_cache=True)
+    orchestrator.process_generation("job-1")
+    orchestrator.process_generation("job-2")
+
+    assert calls == ["job-1", "job-2"]
+
+
+DEMO_DREAM = (
+    "I was flying over a magical forest at night. A glowing bird guided me "
+    "to a floating house by the ocean where feathers fell like rain."
+)
+
+
+def test_near_copy_reuses_the_result_only_with_matching_parameters(
+    client, worker_redis, monkeypatch
+):
+    """Test an edited dream reuses its result unless style, mood or length differ"""
+    calls = []
+
+    async def fake_stage(ctx, output_type, job_data, dream_text, on_partial=None):
+        calls.append(job_data["job_id"])
+        return {
+            "output_type": output_type,
+            "image_url": f"https://example.com/{job_data['job_id']}.png",
+        }
+
+    monkeypatch.setattr(orchestrator, "run_generation_stage", fake_stage)
+    edited = DEMO_DREAM.replace("magical", "enchanted").replace(".", "!")
+    assert signature(edited) != signature(DEMO_DREAM)
+
+    seed_job(worker_redis, "job-1", dream_text=DEMO_DREAM)
+    seed_job(worker_redis, "job-2", dream_text=edited)
+    seed_job(worker_redis, "job-3", dream_text=edited, mood="tense")
+    for job_id in ("job-1", "job-2", "job-3"):
+        orchestrator.process_generation(job_id)
+
+    assert calls == ["job-1", "job-3"]
+    assert (
+        JobStore(worker_redis).get_result("job-2")["image_url"]
+        == "https://example.com/job-1.png"
+    )
+    stats = client.get("/v1/cache/stats").json()
+    # job-2's exact miss is not a miss: its near-duplicate lookup found a result
+    assert (stats["hits"], stats["near_hits"], stats["misses"]) == (0, 1, 2)
+    assert stats["hit_rate"] == 1 / 3
+
+
+async def test_near_duplicate_lookup_stays_bounded(fake_server, monkeypatch):
+    """Test buckets keep BUCKET_CAP entries and unrelated dreams never match"""
+    r = fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    monkeypatch.setattr(near_duplicates, "NEAR_DUPLICATE_THRESHOLD", 0.8)
+    job_data = {"style": "toon", "mood": "calm", "length": "short"}
+    for i in range(BUCKET_CAP + 5):
+        key = cache_key("image", {**job_data, "dream_text": f"{DEMO_DREAM} {i}"})
+        await r.set(key, f'{{"n": {i}}}')
+        await index_result(r, "image", job_data, f"{DEMO_DREAM} {i}", key)
+
+    buckets = [
+        key async for key in r.scan_iter("gencache:near:*") if ":sig:" not in key
+    ]
+    assert max([await r.llen(key) for key in buckets]) == BUCKET_CAP
+
+    # The newest near-copies are still found; a different dream is not
+    found = await find_near_duplicate(r, "image", job_data, f"{DEMO_DREAM} again")
+    assert found is not None and found["n"] >= 5
+    other = (
+        "Running across desert sand at sunset to escape a storm that followed me home"
+    )
+    assert similarity(signature(other), signature(DEMO_DREAM)) < 0.2
+    assert await find_near_duplicate(r, "image", job_data, other) is None
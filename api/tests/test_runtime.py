@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import fakeredis
+from workers import orchestrator, runtime, scheduler
+from workers.job_store import JobStore
+from workers.runtime import WorkerRuntime, parse_classes
+from workers.scheduler import Scheduler, class_key
+
+
+async def enqueue_generation_jobs(
+    fake_server, mock_redis, count, output_type="image", length="short"
+):
+    scheduler = Scheduler(
+        fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    )
+    store = JobStore(mock_redis)
+    for i in range(count):
+        job_id = f"{output_type}-{length}-{i}"
+        store.create(
+            {
+                "job_id": job_id,
+                "status": "queued",
+                "progress": 0,
+                "dream_text": f"Dream number {i} about a forest at night",
+                "output_type": output_type,
+                "style": "lowpoly",
+                "mood": "mystic",
+                "length": length,
+                "bypass_cache": True,
+            }
+        )
+        await scheduler.enqueue(
+            "workers.orchestrator.process_generation", job_id, f"{output_type}:{length}"
+        )
+    return store
+
+
+async def test_runtime_runs_jobs_concurrently(fake_server, mock_redis, monkeypatch):
+    """Test I/O-bound jobs overlap instead of running one at a time"""
+
+    async def slow_stage(ctx, output_type, job_data, dream_text, on_partial=None):
+        await asyncio.sleep(0.2)
+        return {"output_type": output_type, "image_url": job_data["job_id"]}
+
+    monkeypatch.setattr(orchestrator, "run_generation_stage", slow_stage)
+    store = await enqueue_generation_jobs(fake_server, mock_redis, 10)
+
+    runtime = WorkerRuntime(concurrency=10)
+    start = time.perf_counter()
+    await runtime.run(
+        r=fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True),
+        max_jobs=10,
+    )
+    elapsed = time.perf_counter() - start
+
+    # Ten 200 ms jobs back to back would take 2 s
+    assert elapsed < 1.0
+    assert runtime.processed == 10
+    assert mock_redis.zcard("sched:image:short:processing") == 0  # every lease acked
+    assert [store.get_result(f"image-short-{i}")["image_url"] for i in range(10)] == [
+        f"image-short-{i}" for i in range(10)
+    ]
+
+
+async def test_jobs_whose_lease_expires_too_often_are_failed(
+    fake_server, mock_redis, monkeypatch
+):
+    """Test a job held by a crashed worker is marked failed once it can't be requeued"""
+    monkeypatch.setattr(scheduler, "LEASE_SECONDS", 0.05)
+    monkeypatch.setattr(runtime, "LEASE_SECONDS", 0.05)
+    monkeypatch.setattr(scheduler, "MAX_REQUEUES", 0)
+    store = await enqueue_generation_jobs(fake_server, mock_redis, 1)
+    r = fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    await Scheduler(r).take("image:short")  # and its worker dies
+    await asyncio.sleep(0.1)
+
+    worker = WorkerRuntime(classes={"image:short": 1})
+    task = asyncio.create_task(worker.run(r=r))
+    await asyncio.sleep(0.1)
+    worker.stop()
+    await task
+
+    job = store.get("image-short-0")
+    assert (job["status"], job["error"]) == (
+        "failed",
+        "Job was interrupted too many times",
+    )
+    assert mock_redis.zcard(class_key("image:short", "processing")) == 0
+
+
+async def test_runtime_stop_drains_in_flight_jobs(fake_server, mock_redis, monkeypatch):
+    """Test stop() lets running jobs finish and leaves queued ones for later"""
+    runtime = WorkerRuntime(concurrency=2)
+
+    async def slow_stage(ctx, output_type, job_data, dream_text, on_partial=None):
+        runtime.stop()
+        await asyncio.sleep(0.1)
+        return {"output_type": output_type}
+
+    monkeypatch.setattr(orchestrator, "run_generation_stage", slow_stage)
+    store = await enqueue_generation_jobs(fake_server, mock_redis, 5)
+
+    await runtime.run(
+        r=fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    )
+
+    statuses = [store.get(f"image-short-{i}")["status"] for i in range(5)]
+    assert statuses.count("ready") == runtime.processed
+    assert 1 <= runtime.processed <= 2
+    assert statuses.count("queued") == 5 - runtime.processed
+    assert int(mock_redis.hget("sched:depth", "image:short")) == 5 - runtime.processed
+
+
+async def test_busy_class_does_not_block_another(fake_server, mock_redis, monkeypatch):
+    """Test image jobs keep their own slots while every game slot is busy"""
+    finished = []
+
+    async def stage(ctx, output_type, job_data, dream_text, on_partial=None):
+        await asyncio.sleep(0.5 if output_type == "game" else 0.05)
+        finished.append(output_type)
+        return {"output_type": output_type}
+
+    monkeypatch.setattr(orchestrator, "run_generation_stage", stage)
+    await enqueue_generation_jobs(
+        fake_server, mock_redis, 4, output_type="game", length="long"
+    )
+    await enqueue_generation_jobs(fake_server, mock_redis, 4, output_type="image")
+
+    runtime = WorkerRuntime(classes={"game:long": 1, "image:short": 4})
+    await runtime.run(
+        r=fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True),
+        max_jobs=5,
+    )
+
+    # All images finish while the single game slot works through its first build
+    assert finished[:4] == ["image"] * 4
+    assert finished.count("game") == 1
+
+
+def test_parse_classes():
+    """Test WORKER_CLASSES patterns, slot counts and the serve-everything default"""
+    assert parse_classes("image:short=8, game:*=2", 16) == {
+        "image:short": 8,
+        "game:short": 2,
+        "game:long": 2,
+    }
+    assert parse_classes("video:long", 3) == {"video:long": 3}
+    assert len(parse_classes("", 4)) == 6
@@ -0,0 +1,99 @@
+import asyncio
+
+import fakeredis
+from workers import scheduler as scheduler_module
+from workers.scheduler import Scheduler, class_key
+
+FUNC = "workers.orchestrator.process_generation"
+
+
+def scheduler(fake_server):
+    return Scheduler(
+        fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    )
+
+
+async def test_users_take_turns(fake_server):
+    """Test a user with a deep backlog cannot starve a user who queues later"""
+    s = scheduler(fake_server)
+    for i in range(5):
+        await s.enqueue(FUNC, f"heavy-{i}", "image:short", "heavy")
+    await s.enqueue(FUNC, "light-0", "image:short", "light")
+    await s.enqueue(FUNC, "light-1", "image:short", "light")
+
+    order = [(await s.take("image:short"))["job_id"] for _ in range(7)]
+
+    assert order[:4] == ["heavy-0", "light-0", "heavy-1", "light-1"]
+    assert order[4:] == ["heavy-2", "heavy-3", "heavy-4"]
+    assert await s.take("image:short") is None
+
+
+async def test_weights_and_classes(fake_server):
+    """Test weights split turns proportionally and classes are separate queues"""
+    s = scheduler(fake_server)
+    for i in range(4):
+        await s.enqueue(FUNC, f"paid-{i}", "image:short", "paid", weight=2)
+        await s.enqueue(FUNC, f"free-{i}", "image:short", "free")
+    await s.enqueue_many([{"func": FUNC, "job_id": "game-0", "job_class": "game:long"}])
+
+    order = [(await s.take("image:short"))["job_id"] for _ in range(6)]
+
+    assert sum(job_id.startswith("paid") for job_id in order) == 4
+    assert (await s.depths())["image:short"] == 2
+    assert (await s.depths())["game:long"] == 1
+    entry = await s.dequeue("game:long", timeout=0.1)
+    assert (entry["job_id"], entry["job_class"], entry["func"]) == (
+        "game-0",
+        "game:long",
+        FUNC,
+    )
+
+
+async def test_crashed_workers_jobs_are_requeued(fake_server, monkeypatch):
+    """Test a job whose worker died goes back to the front of its user's queue
+
+    Acknowledged jobs are never requeued.
+    """
+    monkeypatch.setattr(scheduler_module, "LEASE_SECONDS", 0.2)
+    s = scheduler(fake_server)
+    for i in range(2):
+        await s.enqueue(FUNC, f"job-{i}", "image:short", "alice", weight=2)
+
+    crashed = await s.take("image:short")  # never acked
+    await asyncio.sleep(0.1)
+    await s.renew([crashed])
+    await asyncio.sleep(0.15)
+    assert await s.reap("image:short") == []
+    assert (await s.depths())["image:short"] == 1  # the renewed lease still holds
+
+    await asyncio.sleep(0.1)
+    assert await s.reap("image:short") == []
+    assert (await s.depths())["image:short"] == 2
+    retried = await s.take("image:short")
+    assert (retried["job_id"], retried["requeues"]) == ("job-0", 1)
+    await s.ack(retried)
+    await asyncio.sleep(0.25)
+    assert await s.reap("image:short") == []
+    assert (await s.take("image:short"))["job_id"] == "job-1"
+    assert await s.r.zcard(class_key("image:short", "processing")) == 1
+
+
+async def test_jobs_requeued_too_often_are_dropped(fake_server, monkeypatch):
+    """Test a job that keeps killing its worker is failed, not requeued forever"""
+    monkeypatch.setattr(scheduler_module, "LEASE_SECONDS", 0.05)
+    monkeypatch.setattr(scheduler_module, "MAX_REQUEUES", 1)
+    s = scheduler(fake_server)
+    await s.enqueue(FUNC, "poison", "game:long")
+
+    await s.take("game:long")
+    await asyncio.sleep(0.1)
+    assert await s.reap("game:long") == []
+    await s.take("game:long")
+    await asyncio.sleep(0.1)
+    dropped = await s.reap("game:long")
+
+    assert [(entry["job_id"], entry["requeues"]) for entry in dropped] == [
+        ("poison", 2)
+    ]
+    assert await s.take("game:long") is None
+    assert (await s.depths())["game:long"] == 0
@@ -0,0 +1,154 @@
+import asyncio
+import threading
+import time
+
+import fakeredis
+import pytest
+from workers.fake_llm import serve_in_thread
+from workers.generators import generate_video_with_claude
+from workers.job_store import JobStore, events_channel, parse_event
+from workers.llm import LLMClient
+from workers.orchestrator import WorkerContext, run_generation_pipeline
+from workers.result_cache import cache_key
+
+
+@pytest.fixture
+def slow_llm(monkeypatch):
+    """Fake LLM that takes 1s per completion but starts streaming after 50ms"""
+    server = serve_in_thread(latency_ms=1000, first_token_ms=50)
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", server.base_url)
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    yield server
+    server.shutdown()
+
+
+async def test_streamed_text_matches_full_completion(slow_llm):
+    """Test streaming forwards growing prefixes and returns the same final text"""
+    seen = []
+
+    async def on_text(text):
+        seen.append(text)
+
+    async with LLMClient.from_env() as llm:
+        streamed = await generate_video_with_claude(
+            llm, "A forest at night", "lowpoly", "mystic", on_text
+        )
+        plain = await generate_video_with_claude(
+            llm, "A forest at night", "lowpoly", "mystic"
+        )
+
+    assert streamed == plain
+    assert len(seen) > 1
+    assert all(later.startswith(earlier) for earlier, later in zip(seen, seen[1:]))
+    assert seen[-1] == streamed["storyboard"]
+
+
+def test_partial_output_is_published_before_the_result(
+    slow_llm, fake_server, mock_redis
+):
+    """Test the first storyboard text reaches subscribers before the job finishes"""
+    JobStore(mock_redis).create(
+        {
+            "job_id": "job-1",
+            "status": "queued",
+            "progress": 0,
+            "dream_text": "I was walking through a forest at night under a huge moon",
+            "output_type": "video",
+            "style": "lowpoly",
+            "mood": "mystic",
+            "length": "short",
+            "bypass_cache": True,
+        }
+    )
+
+    pubsub = fakeredis.FakeRedis(server=fake_server, decode_responses=True).pubsub(
+        ignore_subscribe_messages=True
+    )
+    pubsub.subscribe(events_channel("job-1"))
+
+    async def work():
+        r = fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+        async with WorkerContext(r) as ctx:
+            await run_generation_pipeline(ctx, "job-1")
+
+    # The worker runs on its own loop, like a separate process
+    start = time.perf_counter()
+    worker = threading.Thread(target=asyncio.run, args=(work(),))
+    worker.start()
+
+    first_partial = None
+    while time.perf_counter() - start < 5:
+        message = pubsub.get_message(ignore_subscribe_messages=True, timeout=1)
+        if message is None:
+            continue
+        _, event = parse_event(message["data"])
+        if event.get("partial") and first_partial is None:
+            first_partial = time.perf_counter() - start
+            assert event["partial"]["output_type"] == "video"
+            assert event["partial"]["storyboard"]
+        if event["status"] == "ready":
+            finished = time.perf_counter() - start
+            break
+
+    worker.join()
+    pubsub.close()
+
+    assert first_partial is not None and first_partial < 0.5
+    assert finished >= 0.9
+    # The finished job keeps only the final result
+    job = JobStore(mock_redis).get("job-1")
+    assert "partial" not in job
+    assert (
+        JobStore(mock_redis)
+        .get_result("job-1")["storyboard"]
+        .startswith("Fake completion.")
+    )
+
+
+async def test_multi_output_job_shares_one_analysis(
+    fake_server, mock_redis, monkeypatch
+):
+    """Test one scene call feeds all three outputs, generated concurrently"""
+    server = serve_in_thread(latency_ms=300, first_token_ms=20)
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", server.base_url)
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    JobStore(mock_redis).create(
+        {
+            "job_id": "job-1",
+            "status": "queued",
+            "progress": 0,
+            "dream_text": "I was walking through a forest at night under a huge moon",
+            "output_type": "game",
+            "output_types": "image,video,game",
+            "style": "lowpoly",
+            "mood": "mystic",
+            "length": "short",
+        }
+    )
+
+    start = time.perf_counter()
+    try:
+        async with WorkerContext(
+            fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+        ) as ctx:
+            await run_generation_pipeline(ctx, "job-1")
+    finally:
+        server.shutdown()
+    elapsed = time.perf_counter() - start
+
+    stats = server.state.snapshot()
+    assert stats["requests"] == 4
+    assert stats["max_in_flight"] == 3
+    # Scene, then the three outputs side by side: two LLM latencies, not four
+    assert elapsed < 1.0
+
+    result = JobStore(mock_redis).get_result("job-1")
+    assert result["output_type"] == "game"
+    assert result["output_types"] == ["image", "video", "game"]
+    assert result["image_url"] and result["video_url"] and result["webgl_url"]
+    assert result["blueprint"]["style"] == "lowpoly"
+
+    # Scene-based outputs are cached as such, never as single-output results
+    job_data = JobStore(mock_redis).get("job-1")
+    assert mock_redis.exists(cache_key("image:scene", job_data))
+    assert not mock_redis.exists(cache_key("image", job_data))
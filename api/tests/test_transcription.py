@@ -0,0 +1,258 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import fakeredis
+import httpx
+import pytest
+from workers import orchestrator, transcription
+from workers.job_store import JobStore
+from workers.orchestrator import WorkerContext, run_generation_pipeline
+from workers.transcription import (
+    AudioTooLarge,
+    StubEngine,
+    UnsafeAudioUrl,
+    stream_audio,
+    transcribe_chunks,
+)
+
+import rate_limit
+
+CHUNK = 1024
+AUDIO = bytes(range(256)) * 20  # five chunks
+
+
+@pytest.fixture
+def audio_server(monkeypatch):
+    """Serve audio from memory; records how many body bytes were produced"""
+    served = {"bytes": 0}
+
+    async def body(data):
+        for start in range(0, len(data), CHUNK):
+            served["bytes"] += len(data[start : start + CHUNK])
+            yield data[start : start + CHUNK]
+
+    def handler(request):
+        if "to" in request.url.params:
+            return httpx.Response(302, headers={"Location": request.url.params["to"]})
+        data = AUDIO * int(request.url.params.get("repeat", "1"))
+        # No Content-Length: the limit has to hold while streaming
+        return httpx.Response(200, content=body(data))
+
+    async def resolve_host(host):
+        # audio.test stands in for a public host; literal IPs resolve to themselves
+        return ["93.184.216.34"] if host == "audio.test" else [host]
+
+    monkeypatch.setattr(transcription, "TRANSCRIBE_CHUNK_BYTES", CHUNK)
+    monkeypatch.setattr(transcription, "resolve_host", resolve_host)
+    monkeypatch.setattr(
+        transcription,
+        "open_audio_client",
+        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    return served
+
+
+async def test_chunks_transcribe_in_parallel_and_emit_in_order(monkeypatch):
+    """Test chunks overlap on the pool, and partial text grows in chunk order"""
+
+    class SlowEngine(StubEngine):
+        def transcribe(self, chunk):
+            time.sleep(0.1)
+            return super().transcribe(chunk)
+
+    monkeypatch.setitem(transcription.ENGINES, "slow", SlowEngine)
+    chunks = [AUDIO[i : i + CHUNK] for i in range(0, len(AUDIO), CHUNK)]
+
+    async def stream():
+        for chunk in chunks:
+            yield chunk
+
+    partials = []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    with ThreadPoolExecutor(5) as pool:
+        text = await transcribe_chunks(
+            stream(), pool, on_partial, engine="slow", parallelism=5
+        )
+    elapsed = loop.time() - start
+
+    expected = " ".join(StubEngine().transcribe(chunk) for chunk in chunks)
+    assert text == expected
+    assert partials[-1] == expected
+    assert all(expected.startswith(partial) for partial in partials)
+    # Five 100 ms chunks back to back would take 0.5 s
+    assert elapsed < 0.35
+
+
+async def test_size_limit_is_enforced_while_streaming(audio_server):
+    """Test an oversized upload stops at the limit instead of downloading in full"""
+    chunks = stream_audio("http://audio.test/memo.wav?repeat=100", max_bytes=3 * CHUNK)
+
+    with pytest.raises(AudioTooLarge):
+        async for _ in chunks:
+            pass
+
+    assert audio_server["bytes"] <= 4 * CHUNK
+
+
+def test_transcribe_endpoint(client, audio_server, monkeypatch):
+    """Test /v1/transcribe returns the transcript, streams it and maps errors"""
+    monkeypatch.setattr(rate_limit, "MAX_JOBS_ANONYMOUS", 0)
+    response = client.post(
+        "/v1/transcribe", json={"audio_url": "http://audio.test/memo.wav"}
+    )
+    assert response.status_code == 200
+    text = response.json()["text"]
+    assert len(text.split()) == 5 * transcription.STUB_WORDS_PER_CHUNK
+
+    response = client.post(
+        "/v1/transcribe",
+        json={"audio_url": "http://audio.test/memo.wav"},
+        headers={"Accept": "text/event-stream"},
+    )
+    assert "event: partial" in response.text
+    assert f'event: result\ndata: {{"text": "{text}"}}' in response.text
+
+    monkeypatch.setattr(transcription, "MAX_AUDIO_SIZE_MB", 0)
+    response = client.post(
+        "/v1/transcribe", json={"audio_url": "http://audio.test/memo.wav"}
+    )
+    assert response.status_code == 413
+    response = client.post("/v1/transcribe", json={"audio_url": "file:///etc/passwd"})
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "http://127.0.0.1/memo.wav",
+        "http://10.0.0.5/memo.wav",
+        "http://169.254.169.254/latest/meta-data",
+        "http://[::1]/memo.wav",
+        "http://[::ffff:192.168.1.1]/memo.wav",
+        "http://audio.test/memo.wav?to=http://127.0.0.1:6379/",
+    ],
+)
+async def test_internal_hosts_are_refused(audio_server, url):
+    """Test URLs or redirects to internal addresses are refused before any request"""
+    with pytest.raises(UnsafeAudioUrl):
+        async for _ in stream_audio(url):
+            pass
+
+
+async def test_requests_go_to_the_checked_address(monkeypatch):
+    """Test a host that re-resolves to an internal address is still fetched from the
+    public one it was checked against, under its own name"""
+    answers = iter([["93.184.216.34"], ["127.0.0.1"]])
+    requests = []
+
+    async def rebinding_resolve_host(host):
+        return next(answers)
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, content=AUDIO)
+
+    monkeypatch.setattr(transcription, "resolve_host", rebinding_resolve_host)
+    monkeypatch.setattr(
+        transcription,
+        "open_audio_client",
+        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+
+    chunks = [c async for c in stream_audio("https://rebind.test:8443/memo.wav")]
+
+    assert b"".join(chunks) == AUDIO
+    [request] = requests
+    assert request.url == "https://93.184.216.34:8443/memo.wav"
+    assert request.headers["host"] == "rebind.test:8443"
+    assert request.extensions["sni_hostname"] == "rebind.test"
+    # The second, rebound answer was never asked for
+    assert next(answers) == ["127.0.0.1"]
+
+
+async def test_public_redirects_are_followed_up_to_a_limit(audio_server):
+    """Test a redirect to a public host is followed, and a loop stops at the limit"""
+    redirected = [
+        c
+        async for c in stream_audio("http://audio.test/?to=http://audio.test/memo.wav")
+    ]
+    assert b"".join(redirected) == AUDIO
+
+    loop = "http://audio.test/?to=http://audio.test/?to=http://audio.test/?to=http://audio.test/?to=/"
+    with pytest.raises(httpx.TooManyRedirects):
+        async for _ in stream_audio(loop):
+            pass
+
+
+def test_transcribe_endpoint_is_rate_limited(client, audio_server, monkeypatch):
+    """Test /v1/transcribe has its own budget, apart from job creation"""
+    monkeypatch.setattr(rate_limit, "MAX_JOBS_ANONYMOUS", 1)
+    payload = {"audio_url": "http://audio.test/memo.wav"}
+
+    assert client.post("/v1/transcribe", json=payload).status_code == 200
+    response = client.post("/v1/transcribe", json=payload)
+
+    assert response.status_code == 429
+    assert "transcriptions" in response.json()["detail"]
+    assert "retry-after" in response.headers
+
+
+def test_engines_are_built_once_across_threads(monkeypatch):
+    """Test concurrent first use of an engine builds it once"""
+    built = []
+
+    def factory():
+        built.append(1)
+        time.sleep(0.05)
+        return StubEngine()
+
+    monkeypatch.setitem(transcription.ENGINES, "counted", factory)
+    monkeypatch.setattr(transcription, "_loaded", {})
+    with ThreadPoolExecutor(8) as pool:
+        engines = list(
+            pool.map(lambda _: transcription.load_engine("counted"), range(8))
+        )
+
+    assert len(built) == 1
+    assert all(engine is engines[0] for engine in engines)
+
+
+async def test_audio_jobs_generate_from_the_transcript(
+    fake_server, mock_redis, audio_server, monkeypatch
+):
+    """Test an audio-only generation job runs its stage on the transcribed text"""
+    seen = {}
+
+    async def stage(ctx, output_type, job_data, dream_text, on_partial=None):
+        seen["dream_text"] = dream_text
+        return {"output_type": output_type}
+
+    monkeypatch.setattr(orchestrator, "run_generation_stage", stage)
+    store = JobStore(mock_redis)
+    store.create(
+        {
+            "job_id": "audio-1",
+            "status": "queued",
+            "progress": 0,
+            "audio_url": "http://audio.test/memo.wav",
+            "output_type": "image",
+            "style": "lowpoly",
+            "mood": "mystic",
+            "length": "short",
+        }
+    )
+
+    r = fakeredis.FakeAsyncRedis(server=fake_server, decode_responses=True)
+    async with WorkerContext(r) as ctx:
+        await run_generation_pipeline(ctx, "audio-1")
+
+    assert store.get("audio-1")["status"] == "ready"
+    assert seen["dream_text"] == await transcription.transcribe_url(
+        "http://audio.test/memo.wav"
+    )
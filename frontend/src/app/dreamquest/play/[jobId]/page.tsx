@@ -2,8 +2,10 @@ import { notFound } from 'next/navigation'
 import Link from 'next/link'
 import { Button } from '@/components/ui/button'
 import { WebGLViewer } from '@/components/WebGLViewer'
+import { PendingWorld } from '@/components/PendingWorld'
 import { ShareButton } from '@/components/ShareButton'
 import { ArrowLeft } from 'lucide-react'
+import { api, DEMO_WEBGL_URL, isJobNotFound, type JobResponse } from '@/lib/api'
 
 interface PlayPageProps {
   params: Promise<{
@@ -14,13 +16,29 @@ interface PlayPageProps {
 export default async function PlayPage({ params }: PlayPageProps) {
   const { jobId } = await params
 
-  // In production, you'd fetch the job data from the API
-  // For now, we'll just render the viewer with a constructed URL
-
   if (!jobId) {
     notFound()
   }
 
+  // Builds are shared between jobs with the same world, so the viewer URL
+  // comes from the job result rather than from the job id
+  let job: JobResponse
+  try {
+    job = await api.getJob(jobId)
+  } catch (error) {
+    if (isJobNotFound(error)) {
+      notFound()
+    }
+    throw error
+  }
+  // Without a backend there is no build to show, only the demo world;
+  // a real job that is still running shows its progress until it is built
+  const webglUrl = job.mock ? DEMO_WEBGL_URL : job.result?.webglUrl
+  if (job.status === 'ready' && !webglUrl) {
+    // A finished image or video job has no world to play
+    notFound()
+  }
+
   return (
     <div className="min-h-screen bg-gradient-to-b from-background to-muted/20">
       <div className="container mx-auto px-4 py-8">
@@ -42,7 +60,11 @@ export default async function PlayPage({ params }: PlayPageProps) {
           </div>
         </div>
 
-        <WebGLViewer webglUrl={`/webgl/${jobId}/index.html`} jobId={jobId} />
+        {webglUrl ? (
+          <WebGLViewer webglUrl={webglUrl} jobId={jobId} />
+        ) : (
+          <PendingWorld jobId={jobId} />
+        )}
       </div>
     </div>
   )
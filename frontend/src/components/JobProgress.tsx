@@ -1,6 +1,6 @@
 'use client'
 
-import { useEffect, useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import Lottie from 'lottie-react'
 import { CheckCircle2, XCircle, Loader2 } from 'lucide-react'
 import { api, type JobResponse } from '@/lib/api'
@@ -25,6 +25,7 @@ const loadingAnimation = {
 
 interface JobProgressProps {
   jobId: string
+  onReady?: (job: JobResponse) => void
 }
 
 const STATUS_MESSAGES = {
@@ -36,9 +37,12 @@ const STATUS_MESSAGES = {
   failed: 'Failed to generate dream world',
 }
 
-export function JobProgress({ jobId }: JobProgressProps) {
+export function JobProgress({ jobId, onReady }: JobProgressProps) {
   const [job, setJob] = useState<JobResponse | null>(null)
   const updateJob = useDreamQuestStore((state) => state.updateJob)
+  // Kept in a ref so a new callback each render does not restart polling
+  const onReadyRef = useRef(onReady)
+  onReadyRef.current = onReady
 
   useEffect(() => {
     let cancelled = false
@@ -50,6 +54,9 @@ export function JobProgress({ jobId }: JobProgressProps) {
 
           setJob(update)
           updateJob(jobId, update)
+          if (update.status === 'ready') {
+            onReadyRef.current?.(update)
+          }
 
           if (update.status === 'ready' || update.status === 'failed') {
             break
@@ -0,0 +1,20 @@
+'use client'
+
+import { useState } from 'react'
+import { JobProgress } from '@/components/JobProgress'
+import { WebGLViewer } from '@/components/WebGLViewer'
+
+interface PendingWorldProps {
+  jobId: string
+}
+
+// Shows the job's progress until its world is built, then the world itself
+export function PendingWorld({ jobId }: PendingWorldProps) {
+  const [webglUrl, setWebglUrl] = useState<string | undefined>()
+
+  if (webglUrl) {
+    return <WebGLViewer webglUrl={webglUrl} jobId={jobId} />
+  }
+
+  return <JobProgress jobId={jobId} onReady={(job) => setWebglUrl(job.result?.webglUrl)} />
+}
@@ -20,6 +20,26 @@ export interface JobResponse {
   progress: number
   result?: JobResult
   error?: string
+  // Simulated locally because the backend is not configured or unreachable
+  mock?: boolean
+}
+
+// Playable world shown for mock jobs
+export const DEMO_WEBGL_URL = '/webgl/demo/index.html'
+
+export class ApiError extends Error {
+  constructor(
+    message: string,
+    public status: number
+  ) {
+    super(message)
+    this.name = 'ApiError'
+  }
+}
+
+// The backend answers 404 for unknown jobs and 422 for ids that are not UUIDs
+export function isJobNotFound(error: unknown): boolean {
+  return error instanceof ApiError && (error.status === 404 || error.status === 422)
 }
 
 export interface JobResult {
@@ -27,6 +47,7 @@ export interface JobResult {
   imageUrl?: string
   videoUrl?: string
   webglUrl?: string
+  buildId?: string
   blueprint?: Record<string, unknown>
   prompt?: string
   storyboard?: string
@@ -67,11 +88,15 @@ class ApiClient {
 
       if (!response.ok) {
         const error = await response.json().catch(() => ({ detail: 'Unknown error' }))
-        throw new Error(error.detail || `HTTP ${response.status}`)
+        throw new ApiError(error.detail || `HTTP ${response.status}`, response.status)
       }
 
       return response.json()
     } catch (error) {
+      // The backend answered; only a failed fetch means it is unavailable
+      if (error instanceof ApiError) {
+        throw error
+      }
       // If fetch fails, automatically switch to mock mode
       console.warn('API unavailable, using mock data')
       this.useMock = true
@@ -125,10 +150,21 @@ class ApiClient {
         jobId: response.job_id,
         status: response.status,
         progress: response.progress,
-        result: response.result,
+        result: response.result && {
+          outputType: response.result.output_type,
+          imageUrl: response.result.image_url,
+          videoUrl: response.result.video_url,
+          webglUrl: response.result.webgl_url,
+          buildId: response.result.build_id,
+          blueprint: response.result.blueprint,
+        },
         error: response.error,
       }
-    } catch {
+    } catch (error) {
+      // A job the backend does not know is not replaced by a mock one
+      if (isJobNotFound(error)) {
+        throw error
+      }
       // Fallback to mock
       return this.getMockJobStatus(jobId)
     }
@@ -173,6 +209,7 @@ class ApiClient {
       jobId,
       status,
       progress: Math.round(progress),
+      mock: true,
     }
 
     if (status === 'ready') {
@@ -184,7 +221,7 @@ class ApiClient {
         outputType,
         imageUrl: outputType === 'image' ? 'https://placehold.co/1024x1024/1a1a2e/white?text=Dream+Image' : undefined,
         videoUrl: outputType === 'video' ? 'https://placehold.co/1920x1080/1a1a2e/white?text=Dream+Video' : undefined,
-        webglUrl: outputType === 'game' ? '/webgl/demo/index.html' : undefined,
+        webglUrl: outputType === 'game' ? DEMO_WEBGL_URL : undefined,
         blueprint: outputType === 'game' ? {
           world: 'forest',
           time: 'night',
@@ -241,11 +278,20 @@ class ApiClient {
   }
 }
 
+interface BackendJobResult {
+  output_type: JobResult['outputType']
+  image_url?: string
+  video_url?: string
+  webgl_url?: string
+  build_id?: string
+  blueprint?: Record<string, unknown>
+}
+
 interface BackendJobResponse {
   job_id: string
   status: JobResponse['status']
   progress: number
-  result?: JobResult
+  result?: BackendJobResult
   error?: string
 }
 
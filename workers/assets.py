@@ -0,0 +1,209 @@
+"""
+Shared asset generation layer
+Assets (terrain, character models, ambient audio) are keyed by their
+generation parameters, so every job that needs `terrain` for a forest world
+reuses one generated file instead of producing its own.
+
+- Generated bytes live in a content-addressed store on the shared volume
+  (ASSET_STORE_DIR/<sha256[:2]>/<sha256>.<ext>), written atomically.
+- The assets:index hash maps parameter key -> stored asset, for all workers.
+- Concurrent requests for the same asset collapse into one generation:
+  in-process via a shared task, across workers via a short Redis lock.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from workers.metrics import ASSET_REQUESTS, redis_operation
+
+ASSET_STORE_DIR = os.getenv("ASSET_STORE_DIR", "/frontend/public/assets")
+ASSET_URL_PREFIX = "/assets"
+
+INDEX_KEY = "assets:index"  # hash: asset key -> stored asset JSON
+LOCK_PREFIX = "assets:lock:"
+LOCK_TTL_MS = 60_000  # a crashed generator releases its assets after this
+WAIT_POLL_SECONDS = 0.05
+
+# Bump to regenerate every asset after a generator change
+GENERATOR_VERSION = 1
+
+# Only delete the lock if we still own it
+RELEASE_LOCK_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+AssetGenerator = Callable[[dict[str, Any]], Awaitable[bytes]]
+
+
+def asset_specs(blueprint: dict[str, Any]) -> list[dict[str, Any]]:
+    """Assets a blueprint needs, as (category, type, generation params) specs"""
+    specs = [
+        {
+            "category": "models",
+            "type": character["type"],
+            "params": {"model": character["type"]},
+        }
+        for character in blueprint.get("characters", [])
+    ]
+    specs.append(
+        {
+            "category": "models",
+            "type": "terrain",
+            "params": {"terrain": blueprint["world"]},
+        }
+    )
+    specs.append(
+        {
+            "category": "audio",
+            "type": "ambient",
+            "params": {"ambient": blueprint["mood"]},
+        }
+    )
+    return specs
+
+
+def asset_key(spec: dict[str, Any]) -> str:
+    """Stable key for a spec's generation parameters"""
+    material = json.dumps(
+        [GENERATOR_VERSION, spec["category"], spec["type"], spec["params"]],
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+async def generate_placeholder(spec: dict[str, Any]) -> bytes:
+    """Stand-in for the real model/audio generators (SDXL, procedural, ...)"""
+    return json.dumps(
+        {"placeholder": spec["type"], "params": spec["params"]}, sort_keys=True
+    ).encode()
+
+
+# Category -> (generator, file extension)
+ASSET_GENERATORS: dict[str, tuple[AssetGenerator, str]] = {
+    "models": (generate_placeholder, "glb"),
+    "textures": (generate_placeholder, "png"),
+    "audio": (generate_placeholder, "mp3"),
+}
+
+
+class ContentStore:
+    """Files named by the SHA-256 of their bytes; identical content is stored once"""
+
+    def __init__(
+        self, root: str | None = None, url_prefix: str = ASSET_URL_PREFIX
+    ) -> None:
+        self.root = root or ASSET_STORE_DIR
+        self.url_prefix = url_prefix
+
+    def relative_path(self, digest: str, ext: str) -> str:
+        return f"{digest[:2]}/{digest}.{ext}"
+
+    def put(self, data: bytes, ext: str) -> dict[str, Any]:
+        """Write data if not already present (temp file + rename: never seen partial)"""
+        digest = hashlib.sha256(data).hexdigest()
+        relative = self.relative_path(digest, ext)
+        path = os.path.join(self.root, relative)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+        return {
+            "hash": digest,
+            "file": f"{self.url_prefix}/{relative}",
+            "bytes": len(data),
+        }
+
+
+class AssetService:
+    """Deduplicated, concurrent asset generation shared by every job in a worker"""
+
+    def __init__(
+        self,
+        r: Any,
+        store: ContentStore | None = None,
+        generators: dict[str, tuple[AssetGenerator, str]] = ASSET_GENERATORS,
+    ) -> None:
+        self.r = r
+        self.store = store or ContentStore()
+        self.generators = generators
+        self._in_flight: dict[str, asyncio.Task[dict[str, Any]]] = {}
+        self._release_lock = r.register_script(RELEASE_LOCK_LUA)
+
+    async def generate_for_blueprint(self, blueprint: dict[str, Any]) -> dict[str, Any]:
+        """All of a blueprint's assets, generated concurrently, grouped by category"""
+        specs = asset_specs(blueprint)
+        refs = await asyncio.gather(*(self.get(spec) for spec in specs))
+
+        assets: dict[str, Any] = {"models": [], "textures": [], "audio": []}
+        for spec, ref in zip(specs, refs):
+            assets[spec["category"]].append({"type": spec["type"], **ref})
+        return assets
+
+    async def get(self, spec: dict[str, Any]) -> dict[str, Any]:
+        """Stored asset for a spec, generating it at most once across workers"""
+        key = asset_key(spec)
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            ASSET_REQUESTS.labels("joined").inc()
+        else:
+            task = asyncio.ensure_future(self._resolve(key, spec))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # One caller giving up must not cancel the generation for the others
+        return await asyncio.shield(task)
+
+    @redis_operation("asset.lookup")
+    async def lookup(self, key: str) -> dict[str, Any] | None:
+        payload = await self.r.hget(INDEX_KEY, key)
+        return json.loads(payload) if payload else None
+
+    async def _resolve(self, key: str, spec: dict[str, Any]) -> dict[str, Any]:
+        lock_key = LOCK_PREFIX + key
+        token = uuid.uuid4().hex
+
+        while True:
+            ref = await self.lookup(key)
+            if ref is not None:
+                ASSET_REQUESTS.labels("hit").inc()
+                return ref
+
+            if await self.r.set(lock_key, token, nx=True, px=LOCK_TTL_MS):
+                try:
+                    # Another worker may have finished between lookup and lock
+                    ref = await self.lookup(key)
+                    if ref is None:
+                        ref = await self._generate(key, spec)
+                    return ref
+                finally:
+                    await self._release_lock(keys=[lock_key], args=[token])
+
+            # Another worker is generating it: wait for the index entry
+            await asyncio.sleep(WAIT_POLL_SECONDS)
+
+    async def _generate(self, key: str, spec: dict[str, Any]) -> dict[str, Any]:
+        generator, ext = self.generators[spec["category"]]
+        data = await generator(spec)
+        ref = await asyncio.to_thread(self.store.put, data, ext)
+        await self.r.hset(INDEX_KEY, key, json.dumps(ref))
+        ASSET_REQUESTS.labels("generated").inc()
+        return ref
@@ -0,0 +1,63 @@
+"""
+Blueprint documents
+A ready job's blueprint never changes, so it is encoded once, when the job
+finishes, into the exact bytes the API sends:
+
+- json:    canonical JSON (sorted keys, compact separators)
+- gzip:    the canonical JSON precompressed (base64 in Redis)
+- msgpack: compact binary encoding (base64)
+- etag:    the SHA-256 of the canonical JSON. It equals the build id of
+           the world's content-addressed WebGL build, and is the strong ETag
+           of the json variant; the others append their name (see variant_etag).
+
+The document lives in the job:{id}:blueprint hash next to the job record.
+"""
+
+import base64
+import gzip
+import hashlib
+import json
+from typing import Any
+
+import msgpack
+
+# Variant -> (content type, content encoding)
+VARIANTS = {
+    "json": ("application/json", None),
+    "gzip": ("application/json", "gzip"),
+    "msgpack": ("application/msgpack", None),
+}
+BINARY_VARIANTS = {"gzip", "msgpack"}
+
+
+def canonical_blueprint(blueprint: dict[str, Any]) -> bytes:
+    """Byte-stable encoding: equal blueprints encode identically in any key order"""
+    return json.dumps(
+        blueprint, sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    ).encode()
+
+
+def blueprint_key(job_id: Any) -> str:
+    return f"job:{job_id}:blueprint"
+
+
+def encode_document(blueprint: dict[str, Any]) -> dict[str, str]:
+    """Hash fields for job:{id}:blueprint"""
+    data = canonical_blueprint(blueprint)
+    return {
+        "etag": hashlib.sha256(data).hexdigest(),
+        "json": data.decode(),
+        # mtime=0 keeps the compressed bytes reproducible
+        "gzip": base64.b64encode(gzip.compress(data, mtime=0)).decode(),
+        "msgpack": base64.b64encode(msgpack.packb(json.loads(data))).decode(),
+    }
+
+
+def variant_etag(etag: str, variant: str) -> str:
+    """Strong ETag of one variant: each representation has its own bytes and tag"""
+    return etag if variant == "json" else f"{etag}-{variant}"
+
+
+def variant_body(variant: str, value: str) -> bytes:
+    """Stored field value -> response bytes"""
+    return base64.b64decode(value) if variant in BINARY_VARIANTS else value.encode()
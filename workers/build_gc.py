@@ -0,0 +1,305 @@
+"""
+Garbage collection for WebGL builds
+Runs beside the workers and keeps WEBGL_OUTPUT_DIR bounded:
+
+1. Builds whose last referencing job has expired are removed.
+2. If the remaining builds exceed BUILD_DISK_BUDGET_MB, the least recently
+   used are evicted until they fit.
+3. Untracked leftovers are removed once older than BUILD_GC_GRACE_SECONDS:
+   per-job directories from before builds were shared (named by job UUID,
+   once their job has expired; anything else in the tree, such as checked-in
+   fixtures, is never touched), temporary directories from crashed builders and build
+   directories Redis has no record of.
+
+    python -m workers.build_gc           # every BUILD_GC_INTERVAL_SECONDS
+    python -m workers.build_gc --once
+
+Metrics are served on BUILD_GC_METRICS_PORT (default 9101, 0 disables).
+
+Workers are never blocked on a sweep. Each removal is claimed in Redis first
+and only succeeds if the build was not used since the GC looked at it; the
+directory is then renamed out of the way (atomic) and deleted in a thread.
+A worker needing that exact build waits only for the rename.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Any
+
+from prometheus_client import start_http_server
+
+from workers.builds import (
+    BUILDS_DIR,
+    BYTES_KEY,
+    EVICTING_PREFIX,
+    EXPIRES_KEY,
+    LAST_USED_KEY,
+    directory_size,
+)
+from workers.job_store import job_key
+from workers.metrics import BUILD_BYTES, BUILD_GC_RECLAIMED_BYTES
+
+logger = logging.getLogger(__name__)
+
+DISK_BUDGET_MB = int(os.getenv("BUILD_DISK_BUDGET_MB", "10240"))  # 0 = no budget
+GC_INTERVAL_SECONDS = int(os.getenv("BUILD_GC_INTERVAL_SECONDS", "300"))
+GC_GRACE_SECONDS = int(os.getenv("BUILD_GC_GRACE_SECONDS", "300"))
+EVICTING_TTL_MS = 60_000  # a crashed GC releases its claims after this
+
+# KEYS: last used zset, expires zset, bytes hash, evicting marker
+# ARGV: build id, last use the GC saw (ms, 0 = untracked), marker ttl (ms)
+# Returns 0 if a worker used the build since
+CLAIM_BUILD_LUA = """
+local last_used = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if last_used and tonumber(last_used) > tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('SET', KEYS[4], '1', 'PX', ARGV[3])
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('HDEL', KEYS[3], ARGV[1])
+return 1
+"""
+
+
+def is_job_id(name: str) -> bool:
+    """Whether a directory name has the shape of a job id (a UUID)"""
+    try:
+        return str(uuid.UUID(name)) == name
+    except ValueError:
+        return False
+
+
+class BuildGC:
+    """One sweep at a time over a WebGL output directory"""
+
+    def __init__(
+        self,
+        r: Any,
+        root: str,
+        budget_bytes: int = DISK_BUDGET_MB * 1024 * 1024,
+        grace_seconds: int = GC_GRACE_SECONDS,
+    ) -> None:
+        self.r = r
+        self.root = root
+        self.builds_root = os.path.join(root, BUILDS_DIR)
+        self.budget_bytes = budget_bytes
+        self.grace_seconds = grace_seconds
+        self._claim = r.register_script(CLAIM_BUILD_LUA)
+
+    async def collect(self) -> dict[str, int]:
+        """Run one sweep and report what it removed"""
+        report = {
+            "expired": 0,
+            "evicted": 0,
+            "orphaned": 0,
+            "bytes_reclaimed": 0,
+            "bytes_in_use": 0,
+        }
+        now_ms = int(time.time() * 1000)
+        grace_ms = self.grace_seconds * 1000
+
+        pipe = self.r.pipeline(transaction=False)
+        pipe.zrange(LAST_USED_KEY, 0, -1, withscores=True)
+        pipe.zrange(EXPIRES_KEY, 0, -1, withscores=True)
+        pipe.hgetall(BYTES_KEY)
+        last_used_scores, expires_scores, sizes = await pipe.execute()
+        last_used = {build: int(score) for build, score in last_used_scores}
+        expires = {build: int(score) for build, score in expires_scores}
+
+        on_disk = await asyncio.to_thread(self._list_builds)
+
+        # Builds a worker wrote before its size was recorded (or crashed in between)
+        sizes = {build: int(size) for build, size in sizes.items()}
+        for build in on_disk & (last_used.keys() - sizes.keys()):
+            sizes[build] = await asyncio.to_thread(
+                directory_size, os.path.join(self.builds_root, build)
+            )
+            await self.r.hset(BYTES_KEY, build, sizes[build])
+
+        # 1. Expired: no live job points at the build any more
+        for build in sorted(last_used, key=last_used.__getitem__):
+            if expires.get(build, 0) + grace_ms < now_ms:
+                if await self._remove(
+                    build, last_used[build], sizes.get(build, 0), "expired", report
+                ):
+                    del last_used[build]
+                    on_disk.discard(build)
+
+        # 2. Untracked build directories (Redis lost them, or never knew)
+        for build in on_disk - last_used.keys():
+            path = os.path.join(self.builds_root, build)
+            if await asyncio.to_thread(self._older_than, path, now_ms - grace_ms):
+                size = await asyncio.to_thread(directory_size, path)
+                await self._remove(build, 0, size, "orphaned", report)
+
+        # 3. Over budget: least recently used first
+        in_use = sum(sizes.get(build, 0) for build in last_used)
+        if self.budget_bytes:
+            for build in sorted(last_used, key=last_used.__getitem__):
+                if in_use <= self.budget_bytes:
+                    break
+                size = sizes.get(build, 0)
+                if await self._remove(build, last_used[build], size, "evicted", report):
+                    in_use -= size
+        report["bytes_in_use"] = in_use
+
+        report["bytes_reclaimed"] += await asyncio.to_thread(
+            self._sweep_leftovers, now_ms - grace_ms, report
+        )
+        report["orphaned"] += await self._sweep_job_dirs(now_ms - grace_ms, report)
+
+        BUILD_BYTES.set(in_use)
+        return report
+
+    async def _remove(
+        self,
+        build: str,
+        seen_last_used: int,
+        size: int,
+        reason: str,
+        report: dict[str, int],
+    ) -> bool:
+        claimed = await self._claim(
+            keys=[LAST_USED_KEY, EXPIRES_KEY, BYTES_KEY, EVICTING_PREFIX + build],
+            args=[build, seen_last_used, EVICTING_TTL_MS],
+        )
+        if not claimed:
+            return False  # a job just started using it
+
+        try:
+            trash = await asyncio.to_thread(
+                self._move_to_trash, os.path.join(self.builds_root, build)
+            )
+        finally:
+            await self.r.delete(EVICTING_PREFIX + build)
+        if trash is not None:
+            await asyncio.to_thread(shutil.rmtree, trash, True)
+
+        report[reason] += 1
+        report["bytes_reclaimed"] += size
+        BUILD_GC_RECLAIMED_BYTES.labels(reason).inc(size)
+        return True
+
+    async def _sweep_job_dirs(self, cutoff_ms: int, report: dict[str, int]) -> int:
+        """Per-job directories from before builds were shared, once their job expired"""
+        candidates = await asyncio.to_thread(self._list_job_dirs, cutoff_ms)
+        if not candidates:
+            return 0
+
+        pipe = self.r.pipeline(transaction=False)
+        for name in candidates:
+            pipe.exists(job_key(name))
+        alive = await pipe.execute()
+
+        removed = 0
+        for name, exists in zip(candidates, alive):
+            if exists:
+                continue
+            path = os.path.join(self.root, name)
+            size = await asyncio.to_thread(directory_size, path)
+            await asyncio.to_thread(shutil.rmtree, path, True)
+            report["bytes_reclaimed"] += size
+            BUILD_GC_RECLAIMED_BYTES.labels("orphaned").inc(size)
+            removed += 1
+        return removed
+
+    def _list_builds(self) -> set[str]:
+        try:
+            return {
+                name
+                for name in os.listdir(self.builds_root)
+                if not name.startswith(".")
+            }
+        except FileNotFoundError:
+            return set()
+
+    def _list_job_dirs(self, cutoff_ms: int) -> list[str]:
+        """Legacy per-job directories (named by job UUID) older than cutoff_ms"""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        return [
+            name
+            for name in names
+            if is_job_id(name)
+            and os.path.isdir(os.path.join(self.root, name))
+            and self._older_than(os.path.join(self.root, name), cutoff_ms)
+        ]
+
+    def _sweep_leftovers(self, cutoff_ms: int, report: dict[str, int]) -> int:
+        """Temporary and trash directories left by crashed builders or sweeps"""
+        reclaimed = 0
+        try:
+            names = os.listdir(self.builds_root)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            path = os.path.join(self.builds_root, name)
+            if name.startswith(".") and self._older_than(path, cutoff_ms):
+                reclaimed += directory_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+                report["orphaned"] += 1
+        BUILD_GC_RECLAIMED_BYTES.labels("orphaned").inc(reclaimed)
+        return reclaimed
+
+    def _move_to_trash(self, path: str) -> str | None:
+        trash = os.path.join(self.builds_root, f".trash-{uuid.uuid4().hex}")
+        try:
+            os.rename(path, trash)
+        except FileNotFoundError:
+            return None
+        return trash
+
+    @staticmethod
+    def _older_than(path: str, cutoff_ms: int) -> bool:
+        try:
+            return os.stat(path).st_mtime * 1000 < cutoff_ms
+        except FileNotFoundError:
+            return False
+
+
+async def run_forever(gc: BuildGC, interval: float = GC_INTERVAL_SECONDS) -> None:
+    while True:
+        try:
+            report = await gc.collect()
+            logger.info("build gc %s", " ".join(f"{k}={v}" for k, v in report.items()))
+        except Exception:
+            logger.exception("build gc sweep failed")
+        await asyncio.sleep(interval)
+
+
+async def main(argv: list[str] | None = None) -> None:
+    from workers.orchestrator import WEBGL_OUTPUT_DIR, get_async_redis
+
+    parser = argparse.ArgumentParser(
+        description="Remove expired and least recently used WebGL builds"
+    )
+    parser.add_argument("--once", action="store_true", help="run one sweep and exit")
+    args = parser.parse_args(argv)
+
+    r = get_async_redis()
+    try:
+        gc = BuildGC(r, WEBGL_OUTPUT_DIR)
+        if args.once:
+            print(await gc.collect())
+        else:
+            metrics_port = int(os.getenv("BUILD_GC_METRICS_PORT", "9101"))
+            if metrics_port:
+                start_http_server(metrics_port)
+            await run_forever(gc)
+    finally:
+        await r.aclose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s"
+    )
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+"""
+Content-addressed WebGL builds
+A build depends only on its blueprint, so builds are keyed by the SHA-256 of
+the canonical blueprint JSON and live once under WEBGL_OUTPUT_DIR/builds/<id>/.
+Jobs with identical blueprints point at the same build: disk usage and build
+time scale with distinct worlds, not with job count.
+
+A build is assembled in a temporary directory next to its final location and
+renamed into place, so the frontend never serves a half-written build and
+concurrent builders of the same world simply discard the loser's copy.
+
+BuildRegistry tracks each build's size, last use and the expiry of the latest
+job pointing at it, for the garbage collector in workers/build_gc.py.
+"""
+
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from typing import Any
+
+from workers.blueprints import canonical_blueprint
+from workers.job_store import JOB_TTL_SECONDS
+from workers.metrics import redis_operation
+
+BUILDS_DIR = "builds"
+WEBGL_URL_PREFIX = "/webgl"
+
+LAST_USED_KEY = "builds:last_used"  # zset: build id -> last use (ms)
+EXPIRES_KEY = (
+    "builds:expires"  # zset: build id -> expiry of the latest job using it (ms)
+)
+BYTES_KEY = "builds:bytes"  # hash: build id -> size on disk
+EVICTING_PREFIX = "builds:evicting:"  # set while the GC removes a build
+EVICTION_WAIT_SECONDS = 0.05
+
+# KEYS: last used zset, expires zset, evicting marker
+# ARGV: build id, now (ms), job expiry (ms)
+# Returns 0 while the build is being evicted
+USE_BUILD_LUA = """
+if redis.call('EXISTS', KEYS[3]) == 1 then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+local expires = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if not expires or tonumber(expires) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+end
+return 1
+"""
+
+
+def build_id(blueprint: dict[str, Any]) -> str:
+    return hashlib.sha256(canonical_blueprint(blueprint)).hexdigest()
+
+
+def build_url(build: str) -> str:
+    return f"{WEBGL_URL_PREFIX}/{BUILDS_DIR}/{build}/index.html"
+
+
+def write_build_files(build_dir: str, blueprint_bytes: bytes) -> None:
+    """
+    Populate one build directory
+    In production the Unity WebGL export (index.html, Build/*.wasm, *.data,
+    *.framework.js, *.loader.js) is produced here; the stub only writes the
+    blueprint Unity loads from StreamingAssets.
+    """
+    with open(os.path.join(build_dir, "blueprint.json"), "wb") as f:
+        f.write(blueprint_bytes)
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def publish_build(root: str, blueprint: dict[str, Any]) -> tuple[str, int]:
+    """Build a blueprint once; returns (build id, bytes written or 0 if it existed)"""
+    data = canonical_blueprint(blueprint)
+    build = hashlib.sha256(data).hexdigest()
+    builds_root = os.path.join(root, BUILDS_DIR)
+    final_dir = os.path.join(builds_root, build)
+
+    if os.path.isdir(final_dir):
+        return build, 0
+
+    os.makedirs(builds_root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=builds_root, prefix=".tmp-")
+    try:
+        os.chmod(tmp_dir, 0o755)  # mkdtemp is owner-only; the frontend serves it
+        write_build_files(tmp_dir, data)
+        os.rename(tmp_dir, final_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        # A concurrent builder renamed the same world into place first
+        if os.path.isdir(final_dir):
+            return build, 0
+        raise
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    return build, directory_size(final_dir)
+
+
+class BuildRegistry:
+    """Build usage bookkeeping in Redis, shared by workers and the GC"""
+
+    def __init__(self, r: Any, job_ttl: int = JOB_TTL_SECONDS) -> None:
+        self.r = r
+        self.job_ttl = job_ttl
+        self._use = r.register_script(USE_BUILD_LUA)
+
+    async def use(self, build: str) -> None:
+        """
+        Mark a build as used by a job, before it is built or reused
+        If the GC is removing it right now, wait for that to finish (milliseconds)
+        so the job rebuilds it instead of pointing at a directory about to vanish.
+        """
+        while not await self._mark_used(build):
+            await asyncio.sleep(EVICTION_WAIT_SECONDS)
+
+    @redis_operation("build.use")
+    async def _mark_used(self, build: str) -> bool:
+        now_ms = int(time.time() * 1000)
+        return bool(
+            await self._use(
+                keys=[LAST_USED_KEY, EXPIRES_KEY, EVICTING_PREFIX + build],
+                args=[build, now_ms, now_ms + self.job_ttl * 1000],
+            )
+        )
+
+    @redis_operation("build.record_size")
+    async def record_size(self, build: str, nbytes: int) -> None:
+        await self.r.hset(BYTES_KEY, build, nbytes)
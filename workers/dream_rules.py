@@ -0,0 +1,166 @@
+"""
+Deterministic dream parser
+Keyword rules live in a declarative table that is compiled once into a
+word -> hits lookup. Parsing a dream is one C-level tokenizing pass
+(bytes.translate + split), a set intersection with the known keywords and a
+dict hit per matched word. Rules match whole words ("sun" does not fire on
+"sunset").
+"""
+
+from collections.abc import Iterable
+from typing import Any
+
+# field -> ordered (value, words) rules; the first rule listed wins on conflicts
+DREAM_RULES: dict[str, list[tuple[str, tuple[str, ...]]]] = {
+    "world": [
+        ("forest", ("forest", "forests", "tree", "trees", "woods")),
+        ("city", ("city", "cities", "urban", "street", "streets")),
+        ("ocean", ("ocean", "oceans", "sea", "seas", "water", "waters")),
+        ("desert", ("desert", "deserts", "sand", "sands", "sandy")),
+        ("space", ("space", "star", "stars", "galaxy", "galaxies")),
+    ],
+    "time": [
+        (
+            "night",
+            ("night", "nights", "nighttime", "dark", "darkness", "moon", "moonlight"),
+        ),
+        (
+            "day",
+            (
+                "day",
+                "days",
+                "daytime",
+                "daylight",
+                "sun",
+                "sunny",
+                "sunlight",
+                "sunshine",
+                "bright",
+            ),
+        ),
+        ("sunset", ("sunset", "sunsets", "dusk")),
+        ("dawn", ("dawn", "sunrise", "sunrises")),
+    ],
+    "weather": [
+        (
+            "feathers_rain",
+            ("rain", "rains", "raining", "rained", "feather", "feathers"),
+        ),
+        ("fog", ("fog", "foggy", "mist", "misty")),
+        ("storm", ("storm", "storms", "stormy")),
+    ],
+    "goal": [
+        ("follow_bird_to_flying_house", ("follow", "follows", "followed", "following")),
+        (
+            "find_hidden_object",
+            ("find", "finds", "finding", "search", "searches", "searched", "searching"),
+        ),
+        (
+            "escape_danger",
+            (
+                "escape",
+                "escapes",
+                "escaped",
+                "escaping",
+                "run",
+                "runs",
+                "running",
+                "ran",
+            ),
+        ),
+    ],
+    # Presence flags used to assemble characters
+    "flag": [
+        ("bird", ("bird", "birds")),
+        ("house", ("house", "houses")),
+        ("floating", ("float", "floats", "floated", "floating", "flying")),
+        ("person", ("person", "people", "figure", "figures", "someone")),
+    ],
+}
+
+DEFAULTS = {
+    "world": "forest",
+    "time": "night",
+    "weather": "clear",
+    "goal": "explore_world",
+}
+
+# Byte table: ASCII letters -> lowercase, everything else -> word separator
+_TOKEN_TABLE = bytes(
+    b + 32 if 65 <= b <= 90 else b if 97 <= b <= 122 else 32 for b in range(256)
+)
+
+
+def compile_rules(
+    rules: dict[str, list[tuple[str, tuple[str, ...]]]],
+) -> dict[str, tuple[tuple[str, int, str], ...]]:
+    """Compile a rule table into word -> ((field, priority, value), ...)"""
+    lookup: dict[str, list[tuple[str, int, str]]] = {}
+    for field, field_rules in rules.items():
+        for priority, (value, words) in enumerate(field_rules):
+            for word in words:
+                lookup.setdefault(word, []).append((field, priority, value))
+    return {word: tuple(hits) for word, hits in lookup.items()}
+
+
+class DreamParser:
+    """Blueprint parser backed by a compiled rule table"""
+
+    def __init__(
+        self,
+        rules: dict[str, list[tuple[str, tuple[str, ...]]]] = DREAM_RULES,
+        defaults: dict[str, str] = DEFAULTS,
+    ) -> None:
+        self._lookup = {
+            word.encode(): hits for word, hits in compile_rules(rules).items()
+        }
+        self._keywords = frozenset(self._lookup)
+        self._defaults = defaults
+
+    def parse(self, dream_text: str, style: str, mood: str) -> dict[str, Any]:
+        """Parse one dream into a blueprint"""
+        lookup = self._lookup
+        best: dict[str, tuple[int, str]] = {}
+        flags: set[str] = set()
+
+        words = dream_text.encode().translate(_TOKEN_TABLE).split()
+        for word in self._keywords.intersection(words):
+            for field, priority, value in lookup[word]:
+                if field == "flag":
+                    flags.add(value)
+                elif field not in best or priority < best[field][0]:
+                    best[field] = (priority, value)
+
+        characters: list[dict[str, Any]] = []
+        if "bird" in flags:
+            characters.append({"type": "bird", "role": "guide"})
+        if "house" in flags:
+            characters.append({"type": "house", "float": "floating" in flags})
+        if "person" in flags:
+            characters.append({"type": "person", "role": "mysterious"})
+
+        defaults = self._defaults
+        return {
+            "world": best["world"][1] if "world" in best else defaults["world"],
+            "time": best["time"][1] if "time" in best else defaults["time"],
+            "weather": best["weather"][1] if "weather" in best else defaults["weather"],
+            "goal": best["goal"][1] if "goal" in best else defaults["goal"],
+            "characters": characters,
+            "style": style,
+            "mood": mood,
+        }
+
+    def parse_many(
+        self, dreams: Iterable[tuple[str, str, str]]
+    ) -> list[dict[str, Any]]:
+        """Parse a batch of (dream_text, style, mood) tuples"""
+        parse = self.parse
+        return [parse(dream_text, style, mood) for dream_text, style, mood in dreams]
+
+
+DREAM_PARSER = DreamParser()
+
+
+def parse_many(dreams: Iterable[tuple[str, str, str]]) -> list[dict[str, Any]]:
+    """Parse a batch of (dream_text, style, mood) tuples with the default rules"""
+    return DREAM_PARSER.parse_many(dreams)
@@ -0,0 +1,506 @@
+"""
+Local fake Anthropic Messages API
+Lets the generators and load tests run offline with a configurable latency:
+
+    python -m workers.fake_llm --port 8089 --latency-ms 800
+
+Requests with "stream": true get Server-Sent Events like the real API: the
+first text delta after --first-token-ms, the rest spread over the latency.
+    ANTHROPIC_BASE_URL=http://localhost:8089 python -m workers.runtime
+
+Requests forcing a tool (tool_choice {"type": "tool"}) get a tool_use block
+whose input is FAKE_BLUEPRINT, streamed as input_json_delta fragments and cut
+off (stop_reason "max_tokens") when it does not fit max_tokens.
+
+Prompt caching is mirrored: a prompt prefix ending at a cache_control
+breakpoint (tools, then system, then messages) is written on first use and
+read for CACHE_TTL_SECONDS after its last use, reported in usage as
+cache_creation_input_tokens / cache_read_input_tokens like the real API.
+Prefixes under --cache-min-tokens are not cached. With --prefill-ms-per-1k
+the time to first token grows with the uncached prompt, cached tokens costing
+a tenth, so prompt caching savings show up in benchmarks.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+
+FAKE_BLUEPRINT = {
+    "world": "forest",
+    "time": "night",
+    "weather": "fog",
+    "goal": "explore_freely",
+    "terrain": {"type": "organic", "elevation": "medium"},
+    "characters": [{"type": "guide", "role": "friendly"}],
+    "lighting": {"ambient": 0.3, "directional": 0.6, "fog_density": 0.4},
+    "interactive_elements": ["glowing_mushrooms", "ancient_tree"],
+    "special_effects": ["fireflies", "light_beams"],
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def prompt_text(payload: dict[str, Any]) -> str:
+    """Flatten the system prompt and message contents of a request"""
+    parts: list[str] = []
+    system = payload.get("system")
+    blocks: list[Any] = [system] if isinstance(system, str) else list(system or [])
+    for message in payload.get("messages", []):
+        content = message.get("content", "")
+        blocks.extend([content] if isinstance(content, str) else content)
+    for block in blocks:
+        parts.append(block if isinstance(block, str) else block.get("text", ""))
+    return "\n".join(parts)
+
+
+CACHE_TTL_SECONDS = 300
+CACHE_MIN_TOKENS = 1024  # smallest cacheable prefix for Sonnet-class models
+CACHE_READ_PREFILL_FACTOR = 0.1
+
+
+def prompt_segments(payload: dict[str, Any]) -> list[tuple[str, bool]]:
+    """Request content in cache order (tools, system, messages): (text, breakpoint)"""
+    blocks: list[Any] = list(payload.get("tools") or [])
+    system = payload.get("system")
+    blocks.extend([system] if isinstance(system, str) else list(system or []))
+    for message in payload.get("messages", []):
+        content = message.get("content", "")
+        blocks.extend([content] if isinstance(content, str) else content)
+
+    segments = []
+    for block in blocks:
+        if isinstance(block, str):
+            segments.append((block, False))
+        else:
+            text = (
+                block["text"] if "text" in block else json.dumps(block, sort_keys=True)
+            )
+            segments.append((text, "cache_control" in block))
+    return segments
+
+
+def prompt_usage(
+    payload: dict[str, Any], cached: Callable[[str], bool], min_tokens: int
+) -> tuple[dict[str, int], list[str]]:
+    """(input token usage, cache keys to write) for a request
+
+    cached(key) says whether a prefix is in the cache. The longest cached
+    breakpoint is read; everything after it up to the last breakpoint is written.
+    """
+    segments = prompt_segments(payload)
+    total = estimate_tokens("".join(text for text, _ in segments))
+    prefixes: list[tuple[int, str]] = []
+    text = payload.get("model", "")
+    for segment, breakpoint in segments:
+        text += segment
+        tokens = estimate_tokens(text)
+        if breakpoint and tokens >= min_tokens:
+            prefixes.append((tokens, hashlib.sha256(text.encode()).hexdigest()))
+
+    read = next((tokens for tokens, key in reversed(prefixes) if cached(key)), 0)
+    written = prefixes[-1][0] - read if prefixes else 0
+    usage = {
+        "input_tokens": max(1, total - read - written),
+        "cache_creation_input_tokens": written,
+        "cache_read_input_tokens": read,
+    }
+    return usage, [key for tokens, key in prefixes if tokens > read]
+
+
+def fake_completion(payload: dict[str, Any]) -> str:
+    """Deterministic stand-in for the model's answer"""
+    prompt = prompt_text(payload)
+    if "JSON" in prompt:
+        return json.dumps(FAKE_BLUEPRINT)
+
+    lines = [line for line in prompt.splitlines() if line.strip()]
+    budget = int(payload.get("max_tokens", 500)) * 4
+    text = "Fake completion. " + " ".join(lines)
+    return text[:budget]
+
+
+def forced_tool(payload: dict[str, Any]) -> str | None:
+    """Name of the tool the request forces, if any"""
+    choice = payload.get("tool_choice") or {}
+    return choice.get("name") if choice.get("type") == "tool" else None
+
+
+def fake_tool_input(payload: dict[str, Any]) -> tuple[str, str]:
+    """(input JSON, stop reason) for a forced tool call, truncated to max_tokens"""
+    text = json.dumps(FAKE_BLUEPRINT)
+    budget = int(payload.get("max_tokens", 500)) * 4
+    if len(text) > budget:
+        return text[:budget], "max_tokens"
+    return text, "tool_use"
+
+
+STREAM_CHUNK_CHARS = 24  # roughly a few tokens per text delta
+
+
+def stream_events(
+    payload: dict[str, Any],
+    text: str,
+    message_id: str,
+    stop_reason: str = "end_turn",
+    usage: dict[str, int] | None = None,
+) -> list[tuple[str, dict[str, Any]]]:
+    """Messages API stream events for a completed text (or tool input JSON)"""
+    chunks = [
+        text[i : i + STREAM_CHUNK_CHARS]
+        for i in range(0, len(text), STREAM_CHUNK_CHARS)
+    ]
+    tool = forced_tool(payload)
+    if tool:
+        block = {
+            "type": "tool_use",
+            "id": f"toolu_fake_{message_id[-12:]}",
+            "name": tool,
+            "input": {},
+        }
+        deltas = [
+            {"type": "input_json_delta", "partial_json": chunk} for chunk in chunks
+        ]
+    else:
+        block = {"type": "text", "text": ""}
+        deltas = [{"type": "text_delta", "text": chunk} for chunk in chunks]
+    events: list[tuple[str, dict[str, Any]]] = [
+        (
+            "message_start",
+            {
+                "type": "message_start",
+                "message": {
+                    "id": message_id,
+                    "type": "message",
+                    "role": "assistant",
+                    "model": payload.get("model", "fake"),
+                    "content": [],
+                    "stop_reason": None,
+                    "stop_sequence": None,
+                    "usage": {
+                        **(
+                            usage
+                            or {"input_tokens": estimate_tokens(prompt_text(payload))}
+                        ),
+                        "output_tokens": 1,
+                    },
+                },
+            },
+        ),
+        (
+            "content_block_start",
+            {
+                "type": "content_block_start",
+                "index": 0,
+                "content_block": block,
+            },
+        ),
+    ]
+    events.extend(
+        (
+            "content_block_delta",
+            {"type": "content_block_delta", "index": 0, "delta": delta},
+        )
+        for delta in deltas
+    )
+    events.extend(
+        [
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            (
+                "message_delta",
+                {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                    "usage": {"output_tokens": estimate_tokens(text)},
+                },
+            ),
+            ("message_stop", {"type": "message_stop"}),
+        ]
+    )
+    return events
+
+
+class FakeLLMState:
+    """Counters shared across handler threads"""
+
+    def __init__(
+        self,
+        latency_ms: float,
+        jitter_ms: float,
+        error_rate: float,
+        first_token_ms: float | None = None,
+        prefill_ms_per_1k: float = 0,
+        cache_min_tokens: int = CACHE_MIN_TOKENS,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.prefill_ms_per_1k = prefill_ms_per_1k
+        self.cache_min_tokens = cache_min_tokens
+        self.first_token_ms = (
+            latency_ms / 10 if first_token_ms is None else first_token_ms
+        )
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.tokens = {"input": 0, "cache_read": 0, "cache_write": 0, "output": 0}
+        # Prompt cache: prefix hash -> expiry (monotonic)
+        self.prompt_cache: dict[str, float] = {}
+
+    def is_cached(self, key: str) -> bool:
+        """Whether a prefix is cached; a hit refreshes its TTL (hold the lock)"""
+        now = time.monotonic()
+        if self.prompt_cache.get(key, 0) <= now:
+            return False
+        self.prompt_cache[key] = now + CACHE_TTL_SECONDS
+        return True
+
+    def plan_prompt(self, payload: dict[str, Any]) -> tuple[dict[str, int], list[str]]:
+        with self.lock:
+            return prompt_usage(payload, self.is_cached, self.cache_min_tokens)
+
+    def record_success(
+        self, usage: dict[str, int], cache_keys: list[str], output_tokens: int
+    ) -> None:
+        """Write the prompt's new cache entries and count its tokens"""
+        with self.lock:
+            expiry = time.monotonic() + CACHE_TTL_SECONDS
+            for key in cache_keys:
+                self.prompt_cache[key] = expiry
+            self.tokens["input"] += usage["input_tokens"]
+            self.tokens["cache_read"] += usage["cache_read_input_tokens"]
+            self.tokens["cache_write"] += usage["cache_creation_input_tokens"]
+            self.tokens["output"] += output_tokens
+
+    def prefill_ms(self, usage: dict[str, int]) -> float:
+        """Extra time to first token for processing the prompt"""
+        uncached = usage["input_tokens"] + usage["cache_creation_input_tokens"]
+        weighted = (
+            uncached + usage["cache_read_input_tokens"] * CACHE_READ_PREFILL_FACTOR
+        )
+        return weighted / 1000 * self.prefill_ms_per_1k
+
+    def snapshot(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "tokens": dict(self.tokens),
+            }
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client pooling is exercised
+    server: "FakeLLMServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send_json(self, status: int, body: dict[str, Any]) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(
+        self, events: list[tuple[str, dict[str, Any]]], spread_seconds: float
+    ) -> None:
+        """Chunked text/event-stream response, text deltas spread over spread_seconds"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        deltas = sum(1 for name, _ in events if name == "content_block_delta")
+        pause = spread_seconds / deltas if deltas else 0
+        seen_delta = False
+        for name, data in events:
+            if name == "content_block_delta":
+                # First delta goes out right away, the rest are paced
+                if seen_delta and pause:
+                    time.sleep(pause)
+                seen_delta = True
+            frame = f"event: {name}\ndata: {json.dumps(data)}\n\n".encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path == "/stats":
+            self._send_json(200, self.server.state.snapshot())
+        else:
+            self._send_json(
+                404,
+                {
+                    "type": "error",
+                    "error": {"type": "not_found_error", "message": "Not found"},
+                },
+            )
+
+    def do_POST(self) -> None:  # noqa: N802
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        if self.path.rstrip("/") != "/v1/messages":
+            self._send_json(
+                404,
+                {
+                    "type": "error",
+                    "error": {"type": "not_found_error", "message": "Not found"},
+                },
+            )
+            return
+
+        state = self.server.state
+        with state.lock:
+            state.requests += 1
+            state.in_flight += 1
+            state.max_in_flight = max(state.max_in_flight, state.in_flight)
+
+        try:
+            usage, cache_keys = state.plan_prompt(payload)
+            prefill = state.prefill_ms(usage)
+            delay = state.latency_ms + random.uniform(0, state.jitter_ms) + prefill
+            first_token = (
+                min(state.first_token_ms + prefill, delay)
+                if payload.get("stream")
+                else delay
+            )
+            time.sleep(first_token / 1000)
+
+            if random.random() < state.error_rate:
+                with state.lock:
+                    state.errors += 1
+                self._send_json(
+                    529,
+                    {
+                        "type": "error",
+                        "error": {"type": "overloaded_error", "message": "Overloaded"},
+                    },
+                )
+                return
+
+            tool = forced_tool(payload)
+            if tool:
+                text, stop_reason = fake_tool_input(payload)
+            else:
+                text, stop_reason = fake_completion(payload), "end_turn"
+            message_id = f"msg_fake_{uuid.uuid4().hex[:24]}"
+            state.record_success(usage, cache_keys, estimate_tokens(text))
+            if payload.get("stream"):
+                self._send_stream(
+                    stream_events(payload, text, message_id, stop_reason, usage),
+                    (delay - first_token) / 1000,
+                )
+                return
+
+            if tool:
+                content = [
+                    {
+                        "type": "tool_use",
+                        "id": f"toolu_fake_{message_id[-12:]}",
+                        "name": tool,
+                        "input": json.loads(text) if stop_reason == "tool_use" else {},
+                    }
+                ]
+            else:
+                content = [{"type": "text", "text": text}]
+            self._send_json(
+                200,
+                {
+                    "id": message_id,
+                    "type": "message",
+                    "role": "assistant",
+                    "model": payload.get("model", "fake"),
+                    "content": content,
+                    "stop_reason": stop_reason,
+                    "stop_sequence": None,
+                    "usage": {**usage, "output_tokens": estimate_tokens(text)},
+                },
+            )
+        finally:
+            with state.lock:
+                state.in_flight -= 1
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], state: FakeLLMState) -> None:
+        super().__init__(address, FakeLLMHandler)
+        self.state = state
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def serve_in_thread(
+    port: int = 0,
+    latency_ms: float = 0,
+    jitter_ms: float = 0,
+    error_rate: float = 0,
+    first_token_ms: float | None = None,
+    prefill_ms_per_1k: float = 0,
+    cache_min_tokens: int = CACHE_MIN_TOKENS,
+) -> FakeLLMServer:
+    """Start a fake server on a background thread (port 0 picks a free port)"""
+    state = FakeLLMState(
+        latency_ms,
+        jitter_ms,
+        error_rate,
+        first_token_ms,
+        prefill_ms_per_1k,
+        cache_min_tokens,
+    )
+    server = FakeLLMServer(("127.0.0.1", port), state)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Anthropic Messages API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument(
+        "--first-token-ms", type=float, help="streaming only (default: latency / 10)"
+    )
+    parser.add_argument(
+        "--prefill-ms-per-1k",
+        type=float,
+        default=0,
+        help="added per 1k uncached prompt tokens",
+    )
+    parser.add_argument("--cache-min-tokens", type=int, default=CACHE_MIN_TOKENS)
+    args = parser.parse_args()
+
+    state = FakeLLMState(
+        args.latency_ms,
+        args.jitter_ms,
+        args.error_rate,
+        args.first_token_ms,
+        args.prefill_ms_per_1k,
+        args.cache_min_tokens,
+    )
+    server = FakeLLMServer((args.host, args.port), state)
+    print(f"Fake LLM listening on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,483 @@
+"""
+LLM generation stages
+Turns a dream description into an image prompt, a video storyboard or a game blueprint
+
+Jobs asking for several outputs first get a shared scene description
+(generate_scene_description); each stage then works from that same reading
+of the dream, so the outputs agree with each other.
+
+Completions are streamed: stages take an optional on_partial callback that
+receives the result fields generated so far (e.g. {"storyboard": "..."}).
+Game blueprints are structured output: a forced tool call whose input JSON is
+parsed incrementally and checked against BLUEPRINT_SCHEMA.
+
+The static instructions live in system prompts marked for prompt caching;
+only the dream, style and mood change between calls, in the user turn.
+Prefixes under the model's minimum are not cached (see docs/ARCHITECTURE.md),
+so the breakpoints cost nothing until the instructions grow past it.
+"""
+
+import logging
+import os
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from workers.dream_rules import DREAM_PARSER
+from workers.llm import DEFAULT_MODEL, LLMClient
+from workers.metrics import record_blueprint
+from workers.partial_json import IncrementalJSONParser
+
+logger = logging.getLogger(__name__)
+
+TextCallback = Callable[[str], Awaitable[None]]
+PartialCallback = Callable[[dict[str, Any]], Awaitable[None]]
+
+
+# Send the static instructions as cached system prompts (0 to disable, e.g. to compare)
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "1") != "0"
+
+
+IMAGE_SYSTEM = """You turn dream descriptions into detailed visual prompts for an AI
+image generator.
+
+Create a vivid, detailed prompt that captures the essence, atmosphere, and visual
+details of the dream, in the requested style and mood. Focus on composition, lighting,
+colors, and key elements. Answer with the prompt only, as one paragraph."""
+
+VIDEO_SYSTEM = """You turn dream descriptions into detailed video storyboards with 5-8
+key scenes.
+
+For each scene, describe:
+- Visual composition
+- Camera movement
+- Lighting and atmosphere
+- Key elements and actions
+- Duration (in seconds)
+- Transitions
+
+Number the scenes ("Scene 1: ..."). Open on the setting, build toward the most
+striking moment of the dream, and end on an image that lingers. Create a cinematic
+experience that brings the dream to life, in the requested style and mood."""
+
+
+SCENE_SYSTEM = """You read dream descriptions and write the scene description that an
+image prompt writer, a video storyboard writer and a game designer will all work from,
+so their outputs agree.
+
+In one compact paragraph of at most 80 words, describe the setting and time of day, the
+weather and light, the characters and what they do, the key objects, and what the
+dreamer wants or fears. Keep every concrete detail from the dream and add nothing that
+contradicts it, and describe it in the requested style and mood."""
+
+
+def cached_system(text: str) -> str | list[dict[str, Any]]:
+    """System prompt marked as a cache breakpoint, so its prefix is reused"""
+    if not PROMPT_CACHE:
+        return text
+    return [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+
+
+def dream_prompt(dream_text: str, style: str, mood: str, **extra: str) -> str:
+    """The per-job part of a prompt"""
+    lines = [f"Dream: {dream_text}", f"Style: {style}", f"Mood: {mood}"]
+    lines += [f"{name.capitalize()}: {value}" for name, value in extra.items()]
+    return "\n".join(lines)
+
+
+def forward_text(on_partial: PartialCallback | None, field: str) -> TextCallback | None:
+    """Adapt a partial-result callback to the LLM client's streamed-text callback"""
+    if on_partial is None:
+        return None
+
+    async def on_text(text: str) -> None:
+        await on_partial({field: text})
+
+    return on_text
+
+
+async def generate_image_with_claude(
+    llm: LLMClient,
+    dream_text: str,
+    style: str,
+    mood: str,
+    on_text: TextCallback | None = None,
+) -> dict[str, Any]:
+    """Generate an image URL using Claude and image generation API"""
+    # Use Claude to create a detailed image prompt
+    prompt_response = await llm.stream_message(
+        on_text,
+        output_type="image",
+        model=DEFAULT_MODEL,
+        max_tokens=500,
+        system=cached_system(IMAGE_SYSTEM),
+        messages=[{"role": "user", "content": dream_prompt(dream_text, style, mood)}],
+    )
+
+    image_prompt = prompt_response.content[0].text
+
+    # In production, integrate with DALL-E, Midjourney, or Stable Diffusion
+    # For now, return a placeholder that includes the prompt
+    image_data = {
+        "prompt": image_prompt,
+        "placeholder": "https://placehold.co/1024x1024/1a1a2e/white?text=Dream+Image",
+    }
+
+    return image_data
+
+
+async def generate_video_with_claude(
+    llm: LLMClient,
+    dream_text: str,
+    style: str,
+    mood: str,
+    on_text: TextCallback | None = None,
+) -> dict[str, Any]:
+    """Generate a video concept using Claude"""
+    # Use Claude to create a detailed video storyboard
+    storyboard_response = await llm.stream_message(
+        on_text,
+        output_type="video",
+        model=DEFAULT_MODEL,
+        max_tokens=1000,
+        system=cached_system(VIDEO_SYSTEM),
+        messages=[{"role": "user", "content": dream_prompt(dream_text, style, mood)}],
+    )
+
+    storyboard = storyboard_response.content[0].text
+
+    # In production, integrate with RunwayML, Pika, or similar video generation API
+    # For now, return a placeholder
+    video_data = {
+        "storyboard": storyboard,
+        "placeholder": "https://placehold.co/1920x1080/1a1a2e/white?text=Dream+Video",
+    }
+
+    return video_data
+
+
+async def generate_scene_description(
+    llm: LLMClient,
+    dream_text: str,
+    style: str,
+    mood: str,
+    on_text: TextCallback | None = None,
+) -> str:
+    """One shared reading of the dream, for jobs that generate several outputs"""
+    response = await llm.stream_message(
+        on_text,
+        output_type="scene",
+        model=DEFAULT_MODEL,
+        # A bounded digest, so the stages waiting on it can start soon
+        max_tokens=200,
+        system=cached_system(SCENE_SYSTEM),
+        messages=[{"role": "user", "content": dream_prompt(dream_text, style, mood)}],
+    )
+    return response.content[0].text
+
+
+BLUEPRINT_MAX_TOKENS = 2000
+# Attempts per blueprint before falling back to the rules parser (1 = no retry)
+BLUEPRINT_MAX_ATTEMPTS = int(os.getenv("BLUEPRINT_MAX_ATTEMPTS", "2"))
+
+# Tool input schema: api/schemas.Blueprint minus style/mood (those are job inputs),
+# plus the optional scene details the builder can use
+BLUEPRINT_SCHEMA: dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "world": {
+            "type": "string",
+            "description": "Environment: forest, city, ocean, space, desert, ...",
+        },
+        "time": {
+            "type": "string",
+            "description": "Time of day: dawn, day, dusk or night",
+        },
+        "weather": {"type": "string", "description": "clear, rain, snow, fog or storm"},
+        "goal": {
+            "type": "string",
+            "description": (
+                "explore_freely, find_object, escape, reach_destination or solve_puzzle"
+            ),
+        },
+        "characters": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {
+                        "type": "string",
+                        "description": "guide, friend, mysterious, creature, ...",
+                    },
+                    "role": {
+                        "type": "string",
+                        "description": "friendly, neutral or mysterious",
+                    },
+                    "float": {"type": "boolean"},
+                },
+                "required": ["type"],
+            },
+        },
+        "terrain": {
+            "type": "object",
+            "properties": {
+                "type": {"type": "string", "enum": ["organic", "geometric"]},
+                "elevation": {
+                    "type": "string",
+                    "enum": ["flat", "medium", "mountainous"],
+                },
+            },
+        },
+        "lighting": {
+            "type": "object",
+            "properties": {
+                "ambient": {"type": "number"},
+                "directional": {"type": "number"},
+                "fog_density": {"type": "number"},
+            },
+        },
+        "interactive_elements": {"type": "array", "items": {"type": "string"}},
+        "special_effects": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["world", "time", "weather", "goal", "characters"],
+}
+
+BLUEPRINT_TOOL = {
+    "name": "emit_blueprint",
+    "description": "Record the game world blueprint for the dream.",
+    "input_schema": BLUEPRINT_SCHEMA,
+}
+
+_JSON_TYPES: dict[str, tuple[type, ...]] = {
+    "object": (dict,),
+    "array": (list,),
+    "string": (str,),
+    "boolean": (bool,),
+    "number": (int, float),
+}
+
+
+def schema_errors(
+    value: Any, schema: dict[str, Any], path: str = "blueprint"
+) -> list[str]:
+    """Where value breaks schema (the subset BLUEPRINT_SCHEMA uses); empty if it fits"""
+    expected = _JSON_TYPES[schema["type"]]
+    if not isinstance(value, expected) or (
+        schema["type"] == "number" and isinstance(value, bool)
+    ):
+        return [f"{path} must be a {schema['type']}"]
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path} must be one of {', '.join(schema['enum'])}"]
+
+    errors: list[str] = []
+    if schema["type"] == "object":
+        errors += [
+            f"{path}.{name} is required"
+            for name in schema.get("required", [])
+            if name not in value
+        ]
+        for name, field_schema in schema.get("properties", {}).items():
+            if value.get(name) is not None:
+                errors += schema_errors(value[name], field_schema, f"{path}.{name}")
+    elif schema["type"] == "array":
+        for index, item in enumerate(value):
+            errors += schema_errors(item, schema["items"], f"{path}[{index}]")
+    return errors
+
+
+BLUEPRINT_SYSTEM = """You design small explorable game worlds from dream descriptions
+and record each one with the emit_blueprint tool.
+
+Fill in the world, time of day, weather, the player's goal and the characters the
+player meets. Add terrain, lighting (values from 0 to 1), interactive elements and
+special effects where the dream suggests them. Prefer the listed values; use another
+single lowercase word only when none fits. A short game has one goal and at most three
+characters; a long one may have up to six. Match the requested style and mood."""
+
+
+async def generate_game_blueprint(
+    llm: LLMClient,
+    dream_text: str,
+    style: str,
+    mood: str,
+    length: str,
+    on_partial: PartialCallback | None = None,
+) -> dict[str, Any]:
+    """Generate a game blueprint using Claude
+
+    The model must answer through the emit_blueprint tool. Its input is
+    parsed incrementally (on_partial gets {"blueprint": ...} with the complete
+    fields so far); output cut off at max_tokens is repaired locally and kept
+    if it still fits the schema. Otherwise the model is told what was wrong,
+    up to BLUEPRINT_MAX_ATTEMPTS calls in all, before the deterministic
+    rules parser provides the blueprint instead.
+    """
+    messages: list[dict[str, Any]] = [
+        {
+            "role": "user",
+            "content": dream_prompt(dream_text, style, mood, length=length),
+        }
+    ]
+    output_tokens = 0
+
+    for attempt in range(BLUEPRINT_MAX_ATTEMPTS):
+        parser = IncrementalJSONParser()
+
+        async def on_json(text: str) -> None:
+            nonlocal parser
+            if not text.startswith(parser.text):
+                # A retried call streams again from the start
+                parser = IncrementalJSONParser()
+            parser.feed(text[len(parser.text) :])
+            if on_partial is not None:
+                try:
+                    snapshot = parser.snapshot()
+                except ValueError:
+                    return
+                if isinstance(snapshot, dict):
+                    await on_partial({"blueprint": snapshot})
+
+        response = await llm.stream_tool_input(
+            on_json,
+            output_type="game",
+            model=DEFAULT_MODEL,
+            max_tokens=BLUEPRINT_MAX_TOKENS,
+            # Tools precede the system prompt, so its breakpoint caches them too
+            system=cached_system(BLUEPRINT_SYSTEM),
+            tools=[BLUEPRINT_TOOL],
+            tool_choice={"type": "tool", "name": BLUEPRINT_TOOL["name"]},
+            messages=messages,
+        )
+        output_tokens += response.usage.output_tokens
+        if parser.text != response.json:
+            parser = IncrementalJSONParser()
+            parser.feed(response.json)
+
+        blueprint: Any = None
+        try:
+            blueprint = parser.snapshot()
+        except ValueError as e:
+            errors = [f"the tool input is not valid JSON ({e})"]
+        else:
+            errors = schema_errors(blueprint, BLUEPRINT_SCHEMA)
+        if response.stop_reason == "max_tokens" and errors:
+            errors.append(
+                f"the output was cut off at {BLUEPRINT_MAX_TOKENS} tokens, "
+                "keep it shorter"
+            )
+
+        if not errors:
+            if not parser.complete:
+                outcome = "repaired"
+            else:
+                outcome = "valid" if attempt == 0 else "retried"
+            record_blueprint(outcome, output_tokens)
+            # The job's style/mood are inputs, not something the model should invent
+            return {**blueprint, "style": style, "mood": mood}
+
+        # Hand the problems back as the tool's result and ask for another call
+        messages = messages + [
+            {
+                "role": "assistant",
+                "content": [
+                    {
+                        "type": "tool_use",
+                        "id": response.id,
+                        "name": BLUEPRINT_TOOL["name"],
+                        "input": blueprint if isinstance(blueprint, dict) else {},
+                    }
+                ],
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "tool_result",
+                        "tool_use_id": response.id,
+                        "is_error": True,
+                        "content": "Invalid blueprint: "
+                        + "; ".join(errors)
+                        + ". Call emit_blueprint again.",
+                    }
+                ],
+            },
+        ]
+
+    logger.warning(
+        "blueprint fell back to rules after %d attempts: %s",
+        BLUEPRINT_MAX_ATTEMPTS,
+        errors,
+    )
+    record_blueprint("fallback", output_tokens)
+    return DREAM_PARSER.parse(dream_text, style, mood)
+
+
+async def generate_image_stage(
+    llm: LLMClient,
+    job_data: dict[str, Any],
+    dream_text: str,
+    on_partial: PartialCallback | None = None,
+) -> dict[str, Any]:
+    """Image branch: Claude image prompt + placeholder URL"""
+    result_data = await generate_image_with_claude(
+        llm,
+        dream_text,
+        job_data["style"],
+        job_data["mood"],
+        forward_text(on_partial, "prompt"),
+    )
+    return {
+        "output_type": "image",
+        "image_url": result_data.get("placeholder"),
+        "prompt": result_data.get("prompt"),
+    }
+
+
+async def generate_video_stage(
+    llm: LLMClient,
+    job_data: dict[str, Any],
+    dream_text: str,
+    on_partial: PartialCallback | None = None,
+) -> dict[str, Any]:
+    """Video branch: Claude storyboard + placeholder URL"""
+    result_data = await generate_video_with_claude(
+        llm,
+        dream_text,
+        job_data["style"],
+        job_data["mood"],
+        forward_text(on_partial, "storyboard"),
+    )
+    return {
+        "output_type": "video",
+        "video_url": result_data.get("placeholder"),
+        "storyboard": result_data.get("storyboard"),
+    }
+
+
+async def generate_game_stage(
+    llm: LLMClient,
+    job_data: dict[str, Any],
+    dream_text: str,
+    on_partial: PartialCallback | None = None,
+) -> dict[str, Any]:
+    """Game branch: Claude blueprint + WebGL demo URL"""
+    blueprint = await generate_game_blueprint(
+        llm,
+        dream_text,
+        job_data["style"],
+        job_data["mood"],
+        job_data["length"],
+        on_partial,
+    )
+    return {
+        "output_type": "game",
+        "webgl_url": "/webgl/demo/index.html",
+        "blueprint": blueprint,
+    }
+
+
+# Output type -> generation stage
+GENERATION_STAGES = {
+    "image": generate_image_stage,
+    "video": generate_video_stage,
+    "game": generate_game_stage,
+}
@@ -0,0 +1,495 @@
+"""
+Shared job store
+Job state lives in a Redis hash (job:{id}) so status/progress ticks are
+atomic per-field writes instead of read-modify-write of one JSON blob.
+Result payloads are stored separately (job:{id}:result) and only read when needed.
+A ready game's blueprint is also stored pre-encoded (job:{id}:blueprint, see
+workers/blueprints.py) in the same write that marks the job ready.
+
+The GET /v1/jobs/{id} response is pre-rendered too (job:{id}:status, JSON
+bytes): every write that changes what the endpoint would show re-renders it
+in the same script, so polling is a single GET with no parsing or
+validation. Writers encode the result's public fields once with orjson
+(status_result below mirrors api/schemas.JobResult); the scripts splice in
+the error and partial output that live on the hash.
+
+Each non-terminal status has an index (jobs:live:{status}, a sorted set of
+job ids scored by when the job's record expires), updated in the same atomic
+writes, for the /metrics gauges. A job that expires before finishing leaves
+its index entry behind, so readers trim entries past their expiry first
+(count_live_jobs) instead of trusting a counter that would only grow.
+
+Every transition bumps a per-job version and is published on job:{id}:events
+as "<version>|<json>", so subscribers (the SSE endpoint) get pushed updates and
+can resume from the last version they saw. Streamed LLM output is published
+the same way (a "partial" field on the hash and the event) until the job
+finishes.
+
+JobStore wraps a sync client (workers), AsyncJobStore an asyncio one (API).
+Both expect decode_responses=True. They only differ in awaiting: the commands
+and script arguments come from the shared helpers below (queue_create,
+status_args, partial_args), so the two cannot drift apart.
+"""
+
+import json
+import time
+from typing import Any
+
+import orjson
+
+from workers.blueprints import blueprint_key, encode_document
+from workers.metrics import redis_operation
+
+JOB_TTL_SECONDS = 86400  # 24h expiration
+
+INT_FIELDS = {"progress", "version"}
+TERMINAL_STATUSES = {"ready", "failed"}
+# api/schemas.JobStatusEnum without the terminal statuses
+LIVE_STATUSES = ["queued", "analyzing", "generating", "building"]
+BOOL_FIELDS = {"bypass_cache"}
+LIVE_INDEX_PREFIX = "jobs:live:"
+
+# KEYS: job hash, result key, events channel, blueprint hash, status document,
+#       then one live index per non-terminal status (named jobs:live:{status})
+# ARGV: status, progress, ttl, result JSON ("" = unchanged), error ("" = unchanged),
+#       event JSON to publish, job id JSON, status result JSON ("" = none),
+#       error JSON ("" = none given), then blueprint document field/value pairs (if any)
+SET_STATUS_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+local terminal = {ready = true, failed = true}
+local live = {}
+for i = 6, #KEYS do
+    live[string.match(KEYS[i], '[^:]+$')] = KEYS[i]
+end
+local job_id = cjson.decode(ARGV[7])
+local previous = redis.call('HGET', KEYS[1], 'status')
+if previous ~= ARGV[1] and live[previous] then
+    redis.call('ZREM', live[previous], job_id)
+end
+if live[ARGV[1]] then
+    -- Scored by the expiry set below, so an abandoned job ages out of the index
+    local time = redis.call('TIME')
+    redis.call('ZADD', live[ARGV[1]], tonumber(time[1]) + tonumber(ARGV[3]), job_id)
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[1], 'progress', ARGV[2])
+if terminal[ARGV[1]] then
+    redis.call('HDEL', KEYS[1], 'partial')
+end
+if ARGV[5] ~= '' then
+    redis.call('HSET', KEYS[1], 'error', ARGV[5])
+end
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+if ARGV[4] ~= '' then
+    redis.call('SET', KEYS[2], ARGV[4], 'EX', ARGV[3])
+end
+if #ARGV > 9 then
+    redis.call('HSET', KEYS[4], unpack(ARGV, 10))
+    redis.call('EXPIRE', KEYS[4], ARGV[3])
+end
+
+-- Same fields and order as api/schemas.GetJobResponse
+local result, error, partial = 'null', 'null', 'null'
+if ARGV[1] == 'ready' and ARGV[8] ~= '' then
+    result = ARGV[8]
+end
+if ARGV[1] == 'failed' then
+    if ARGV[9] ~= '' then
+        error = ARGV[9]
+    else
+        local stored = redis.call('HGET', KEYS[1], 'error')
+        if stored then
+            error = cjson.encode(stored)
+        end
+    end
+end
+if not terminal[ARGV[1]] then
+    partial = redis.call('HGET', KEYS[1], 'partial') or 'null'
+end
+redis.call('SET', KEYS[5], '{"job_id":' .. ARGV[7] .. ',"status":"' .. ARGV[1]
+    .. '","progress":' .. ARGV[2] .. ',"result":' .. result .. ',"error":' .. error
+    .. ',"partial":' .. partial .. '}', 'EX', ARGV[3])
+
+redis.call('PUBLISH', KEYS[3], version .. '|' .. ARGV[6])
+return version
+"""
+
+# KEYS: job hash, events channel, status document
+# ARGV: partial JSON, event JSON to publish, job id JSON
+SET_PARTIAL_LUA = """
+local status = redis.call('HGET', KEYS[1], 'status')
+if not status or status == 'ready' or status == 'failed' then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'partial', ARGV[1])
+local progress = redis.call('HGET', KEYS[1], 'progress') or '0'
+redis.call('SET', KEYS[3], '{"job_id":' .. ARGV[3] .. ',"status":"' .. status
+    .. '","progress":' .. progress
+    .. ',"result":null,"error":null,"partial":' .. ARGV[1]
+    .. '}', 'KEEPTTL')
+local version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+redis.call('PUBLISH', KEYS[2], version .. '|' .. ARGV[2])
+return version
+"""
+
+
+def job_key(job_id: Any) -> str:
+    return f"job:{job_id}"
+
+
+def result_key(job_id: Any) -> str:
+    return f"job:{job_id}:result"
+
+
+def events_channel(job_id: Any) -> str:
+    return f"job:{job_id}:events"
+
+
+def status_document_key(job_id: Any) -> str:
+    return f"job:{job_id}:status"
+
+
+def status_result(result: dict[str, Any]) -> dict[str, Any]:
+    """A result's public fields, as GET /v1/jobs/{id} shows them (schemas.JobResult)"""
+    blueprint = result.get("blueprint")
+    if blueprint is not None:
+        blueprint = {
+            "world": blueprint["world"],
+            "time": blueprint["time"],
+            "weather": blueprint["weather"],
+            "goal": blueprint["goal"],
+            "characters": [
+                {
+                    "type": character["type"],
+                    "role": character.get("role"),
+                    "float": character.get("float"),
+                }
+                for character in blueprint["characters"]
+            ],
+            "style": blueprint["style"],
+            "mood": blueprint["mood"],
+        }
+    return {
+        "output_type": result["output_type"],
+        "output_types": result.get("output_types"),
+        "webgl_url": result.get("webgl_url"),
+        "build_id": result.get("build_id"),
+        "image_url": result.get("image_url"),
+        "video_url": result.get("video_url"),
+        "blueprint": blueprint,
+    }
+
+
+def render_status_document(job_data: dict[str, Any]) -> bytes:
+    """Status document for a job record being created (the scripts render later ones)"""
+    status = job_data.get("status", "queued")
+    result = job_data.get("result") if status == "ready" else None
+    return orjson.dumps(
+        {
+            "job_id": job_data["job_id"],
+            "status": status,
+            "progress": job_data.get("progress", 0),
+            "result": status_result(result) if result else None,
+            "error": job_data.get("error") if status == "failed" else None,
+            "partial": None,
+        }
+    )
+
+
+def live_index_key(status: str) -> str:
+    return f"{LIVE_INDEX_PREFIX}{status}"
+
+
+def status_keys(job_id: Any) -> list[str]:
+    """KEYS for SET_STATUS_LUA"""
+    return [
+        job_key(job_id),
+        result_key(job_id),
+        events_channel(job_id),
+        blueprint_key(job_id),
+        status_document_key(job_id),
+        *map(live_index_key, LIVE_STATUSES),
+    ]
+
+
+def parse_event(message: str) -> tuple[int, dict[str, Any]]:
+    """Split a published "<version>|<json>" event"""
+    version, payload = message.split("|", 1)
+    return int(version), json.loads(payload)
+
+
+def encode_fields(job_data: dict[str, Any]) -> dict[str, str]:
+    """Flatten job data into hash fields (None dropped, result stored separately)"""
+    fields = {}
+    for name, value in job_data.items():
+        if value is None or name == "result":
+            continue
+        if isinstance(value, bool):
+            fields[name] = "1" if value else "0"
+        else:
+            fields[name] = str(value)
+    return fields
+
+
+def decode_fields(fields: dict[str, str]) -> dict[str, Any]:
+    """Inverse of encode_fields"""
+    job_data: dict[str, Any] = dict(fields)
+    for name in INT_FIELDS & job_data.keys():
+        job_data[name] = int(job_data[name])
+    for name in BOOL_FIELDS & job_data.keys():
+        job_data[name] = job_data[name] == "1"
+    return job_data
+
+
+def status_args(
+    job_id: Any,
+    status: str,
+    progress: int,
+    result: dict[str, Any] | None,
+    error: str | None,
+    ttl: int,
+) -> list[Any]:
+    event = json.dumps({"status": status, "progress": progress, "error": error})
+    args = [
+        status,
+        progress,
+        ttl,
+        json.dumps(result) if result else "",
+        error or "",
+        event,
+        orjson.dumps(str(job_id)),
+        orjson.dumps(status_result(result)) if result else "",
+        orjson.dumps(error) if error else "",
+    ]
+    # Ready-to-serve blueprint, encoded once here instead of on every request
+    if result and result.get("blueprint"):
+        for field, value in encode_document(result["blueprint"]).items():
+            args += [field, value]
+    return args
+
+
+def partial_keys(job_id: Any) -> list[str]:
+    """KEYS for SET_PARTIAL_LUA"""
+    return [job_key(job_id), events_channel(job_id), status_document_key(job_id)]
+
+
+def partial_args(
+    job_id: Any, status: str, progress: int, partial: dict[str, Any]
+) -> list[Any]:
+    event = json.dumps(
+        {"status": status, "progress": progress, "error": None, "partial": partial}
+    )
+    return [json.dumps(partial), event, orjson.dumps(str(job_id))]
+
+
+def queue_create(pipe: Any, job_data: dict[str, Any], ttl: int) -> None:
+    """Queue the writes that create a job record on a (sync or async) pipeline"""
+    job_id = job_data["job_id"]
+    pipe.hset(job_key(job_id), mapping=encode_fields(job_data))
+    pipe.expire(job_key(job_id), ttl)
+    pipe.set(status_document_key(job_id), render_status_document(job_data), ex=ttl)
+    if job_data.get("result"):
+        pipe.set(result_key(job_id), json.dumps(job_data["result"]), ex=ttl)
+        if job_data["result"].get("blueprint"):
+            pipe.hset(
+                blueprint_key(job_id),
+                mapping=encode_document(job_data["result"]["blueprint"]),
+            )
+            pipe.expire(blueprint_key(job_id), ttl)
+    if job_data.get("status") not in TERMINAL_STATUSES:
+        index = live_index_key(job_data.get("status", "queued"))
+        pipe.zadd(index, {str(job_id): int(time.time()) + ttl})
+
+
+@redis_operation("job.count_live")
+async def count_live_jobs(r: Any) -> dict[str, int]:
+    """Jobs per non-terminal status, dropping index entries whose job has expired"""
+    now = int(time.time())
+    pipe = r.pipeline(transaction=False)
+    for status in LIVE_STATUSES:
+        pipe.zremrangebyscore(live_index_key(status), "-inf", now)
+        pipe.zcard(live_index_key(status))
+    replies = await pipe.execute()
+    return dict(zip(LIVE_STATUSES, replies[1::2]))
+
+
+def check_updated(updated: Any, job_id: Any) -> None:
+    """SET_STATUS_LUA returns 0 for a job that does not exist"""
+    if not updated:
+        raise ValueError(f"Job {job_id} not found")
+
+
+def decode_result(payload: str | None) -> dict[str, Any] | None:
+    return json.loads(payload) if payload else None
+
+
+class BaseJobStore:
+    """Client, TTL and scripts shared by the sync and async stores"""
+
+    def __init__(self, r: Any, ttl: int = JOB_TTL_SECONDS) -> None:
+        self.r = r
+        self.ttl = ttl
+        self._set_status = r.register_script(SET_STATUS_LUA)
+        self._set_partial = r.register_script(SET_PARTIAL_LUA)
+
+
+class JobStore(BaseJobStore):
+    """Job state on a synchronous Redis client"""
+
+    @redis_operation("job.create")
+    def create(self, job_data: dict[str, Any]) -> None:
+        pipe = self.r.pipeline()
+        queue_create(pipe, job_data, self.ttl)
+        pipe.execute()
+
+    @redis_operation("job.get")
+    def get(self, job_id: Any) -> dict[str, Any] | None:
+        """Job fields (without the result payload), or None if missing"""
+        fields = self.r.hgetall(job_key(job_id))
+        return decode_fields(fields) if fields else None
+
+    @redis_operation("job.get_result")
+    def get_result(self, job_id: Any) -> dict[str, Any] | None:
+        return decode_result(self.r.get(result_key(job_id)))
+
+    @redis_operation("job.set_status")
+    def set_status(
+        self,
+        job_id: Any,
+        status: str,
+        progress: int,
+        result: dict[str, Any] | None = None,
+        error: str | None = None,
+    ) -> None:
+        """Atomically move a job to a new status/progress (plus result/error)"""
+        updated = self._set_status(
+            keys=status_keys(job_id),
+            args=status_args(job_id, status, progress, result, error, self.ttl),
+        )
+        check_updated(updated, job_id)
+
+    @redis_operation("job.set_partial")
+    def set_partial(
+        self,
+        job_id: Any,
+        status: str,
+        progress: int,
+        partial: dict[str, Any],
+    ) -> bool:
+        """Store and publish partial output; False once the job has finished"""
+        updated = self._set_partial(
+            keys=partial_keys(job_id),
+            args=partial_args(job_id, status, progress, partial),
+        )
+        return bool(updated)
+
+
+class AsyncJobStore(BaseJobStore):
+    """Job state on a redis.asyncio client"""
+
+    @redis_operation("job.create")
+    async def create(self, job_data: dict[str, Any]) -> None:
+        pipe = self.r.pipeline()
+        queue_create(pipe, job_data, self.ttl)
+        await pipe.execute()
+
+    @redis_operation("job.get")
+    async def get(self, job_id: Any) -> dict[str, Any] | None:
+        """Job fields (without the result payload), or None if missing"""
+        fields = await self.r.hgetall(job_key(job_id))
+        return decode_fields(fields) if fields else None
+
+    @redis_operation("job.get_result")
+    async def get_result(self, job_id: Any) -> dict[str, Any] | None:
+        return decode_result(await self.r.get(result_key(job_id)))
+
+    @redis_operation("job.create_many")
+    async def create_many(self, jobs: list[dict[str, Any]]) -> None:
+        """Write many job records in a single pipeline round trip"""
+        pipe = self.r.pipeline(transaction=False)
+        for job_data in jobs:
+            queue_create(pipe, job_data, self.ttl)
+        await pipe.execute()
+
+    @redis_operation("job.fail_many")
+    async def fail_many(self, job_ids: list[Any], error: str) -> None:
+        """Mark many jobs failed in a single pipeline round trip"""
+        pipe = self.r.pipeline(transaction=False)
+        for job_id in job_ids:
+            await self._set_status(
+                keys=status_keys(job_id),
+                args=status_args(job_id, "failed", 0, None, error, self.ttl),
+                client=pipe,
+            )
+        await pipe.execute()
+
+    @redis_operation("job.get_status")
+    async def get_status(
+        self, job_id: Any
+    ) -> tuple[dict[str, Any] | None, dict[str, Any] | None]:
+        """(status/progress/error/version/partial fields, result) in one round trip"""
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hmget(job_key(job_id), "status", "progress", "error", "version", "partial")
+        pipe.get(result_key(job_id))
+        (status, progress, error, version, partial), payload = await pipe.execute()
+
+        if status is None:
+            return None, None
+
+        fields = {
+            "status": status,
+            "progress": int(progress or 0),
+            "error": error,
+            "version": int(version or 0),
+            "partial": json.loads(partial) if partial else None,
+        }
+        return fields, decode_result(payload)
+
+    @redis_operation("job.get_status_document")
+    async def get_status_document(self, job_id: Any) -> str | None:
+        """Pre-rendered GET /v1/jobs/{id} body, or None (missing or pre-document job)"""
+        return await self.r.get(status_document_key(job_id))
+
+    @redis_operation("job.get_blueprint")
+    async def get_blueprint(
+        self, job_id: Any, variant: str = "json"
+    ) -> tuple[str | None, dict[str, Any]]:
+        """(job status, blueprint etag, requested variant and json) in one round trip"""
+        pipe = self.r.pipeline(transaction=False)
+        pipe.hget(job_key(job_id), "status")
+        pipe.hmget(blueprint_key(job_id), "etag", variant, "json")
+        status, (etag, encoded, plain) = await pipe.execute()
+        return status, {"etag": etag, "json": plain, variant: encoded}
+
+    @redis_operation("job.set_status")
+    async def set_status(
+        self,
+        job_id: Any,
+        status: str,
+        progress: int,
+        result: dict[str, Any] | None = None,
+        error: str | None = None,
+    ) -> None:
+        """Atomically move a job to a new status/progress (plus result/error)"""
+        updated = await self._set_status(
+            keys=status_keys(job_id),
+            args=status_args(job_id, status, progress, result, error, self.ttl),
+        )
+        check_updated(updated, job_id)
+
+    @redis_operation("job.set_partial")
+    async def set_partial(
+        self,
+        job_id: Any,
+        status: str,
+        progress: int,
+        partial: dict[str, Any],
+    ) -> bool:
+        """Store and publish partial output; False once the job has finished"""
+        updated = await self._set_partial(
+            keys=partial_keys(job_id),
+            args=partial_args(job_id, status, progress, partial),
+        )
+        return bool(updated)
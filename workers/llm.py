@@ -0,0 +1,235 @@
+"""
+Shared Anthropic client
+One pooled AsyncAnthropic per worker process, with a cap on in-flight calls
+per output type, per-call timeouts and jittered retries.
+
+Each output type (image, video, scene, game) has its own permits, so a burst
+of long game-blueprint streams cannot hold every permit while image prompts,
+which the worker runs in their own slots, wait behind them.
+
+Point ANTHROPIC_BASE_URL at workers/fake_llm.py to run everything offline.
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import anthropic
+
+from workers.metrics import record_first_token, record_llm_call
+
+DEFAULT_MODEL = "claude-3-5-sonnet-20241022"
+
+# HTTP statuses worth retrying (timeouts, conflicts, rate limits, overload)
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether an LLM call error is transient"""
+    if isinstance(error, asyncio.TimeoutError | anthropic.APIConnectionError):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+class ToolInput:
+    """A streamed tool call: raw input JSON, stop reason and token usage"""
+
+    def __init__(self) -> None:
+        self.id = ""
+        self.name = ""
+        self.json = ""
+        self.stop_reason: str | None = None
+        self.usage: Any = None
+
+
+class LLMClient:
+    """
+    Async Anthropic client with keep-alive pooling and a concurrency governor
+
+    max_concurrency caps the in-flight calls of each output type.
+
+    Use as an async context manager so the connection pool is closed with the
+    owning event loop.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        base_url: str | None = None,
+        max_concurrency: int = 8,
+        timeout: float = 60.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        max_connections: int = 32,
+        keepalive_expiry: float = 30.0,
+    ) -> None:
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+
+        # Limits type comes from whichever httpx flavour the SDK is built on
+        limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._http_client = anthropic.DefaultAsyncHttpxClient(limits=limits)
+
+        # Retries are ours (jittered, outside the governor), so the SDK's are off
+        self.client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self._http_client,
+            max_retries=0,
+            timeout=timeout,
+        )
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    @classmethod
+    def from_env(cls) -> "LLMClient":
+        """Build a client from LLM_* / ANTHROPIC_* environment variables"""
+        return cls(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            base_url=os.getenv("ANTHROPIC_BASE_URL") or None,
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            timeout=float(os.getenv("LLM_TIMEOUT_SECONDS", "60")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "32")),
+        )
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (0-based)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    async def create_message(self, output_type: str = "other", **kwargs: Any) -> Any:
+        """messages.create, governed, timed out and retried
+
+        output_type only labels the latency/token metrics.
+        """
+        return await self._call(
+            output_type, lambda: self.client.messages.create(**kwargs)
+        )
+
+    async def stream_message(
+        self,
+        on_text: Callable[[str], Awaitable[None]] | None = None,
+        output_type: str = "other",
+        **kwargs: Any,
+    ) -> Any:
+        """Streamed messages.create: on_text gets the text so far after every delta
+
+        Returns the same final Message as create_message. A retried call
+        streams again from the start, so on_text may see the text restart.
+        """
+
+        async def consume() -> Any:
+            start = time.perf_counter()
+            text = ""
+            async with self.client.messages.stream(**kwargs) as stream:
+                async for delta in stream.text_stream:
+                    if not text:
+                        record_first_token(output_type, time.perf_counter() - start)
+                    text += delta
+                    if on_text is not None:
+                        await on_text(text)
+                return await stream.get_final_message()
+
+        return await self._call(output_type, consume)
+
+    async def stream_tool_input(
+        self,
+        on_json: Callable[[str], Awaitable[None]] | None = None,
+        output_type: str = "other",
+        **kwargs: Any,
+    ) -> "ToolInput":
+        """Streamed messages.create forcing one tool call; on_json gets its JSON so far
+
+        The raw input JSON is returned unparsed (possibly truncated at
+        max_tokens), so callers can repair it instead of losing the call to
+        the SDK's parser.
+        """
+
+        async def consume() -> ToolInput:
+            start = time.perf_counter()
+            result = ToolInput()
+            async with await self.client.messages.create(
+                stream=True, **kwargs
+            ) as stream:
+                async for event in stream:
+                    if event.type == "message_start":
+                        result.usage = event.message.usage
+                    elif (
+                        event.type == "content_block_start"
+                        and event.content_block.type == "tool_use"
+                    ):
+                        result.id, result.name = (
+                            event.content_block.id,
+                            event.content_block.name,
+                        )
+                    elif event.type == "message_delta":
+                        result.stop_reason = event.delta.stop_reason
+                        result.usage.output_tokens = event.usage.output_tokens
+                    elif (
+                        event.type == "content_block_delta"
+                        and event.delta.type == "input_json_delta"
+                    ):
+                        if not result.json:
+                            record_first_token(output_type, time.perf_counter() - start)
+                        result.json += event.delta.partial_json
+                        if on_json is not None:
+                            await on_json(result.json)
+            return result
+
+        return await self._call(output_type, consume)
+
+    def permits(self, output_type: str) -> asyncio.Semaphore:
+        """The governor for one output type's calls"""
+        if output_type not in self._semaphores:
+            self._semaphores[output_type] = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphores[output_type]
+
+    async def _call(
+        self, output_type: str, request: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Run request() under its type's governor with a timeout and retries"""
+        attempt = 0
+        while True:
+            try:
+                async with self.permits(output_type):
+                    start = time.perf_counter()
+                    try:
+                        response = await asyncio.wait_for(
+                            request(), timeout=self.timeout
+                        )
+                    except Exception:
+                        record_llm_call(
+                            output_type, "error", time.perf_counter() - start
+                        )
+                        raise
+                    record_llm_call(
+                        output_type, "ok", time.perf_counter() - start, response.usage
+                    )
+                    return response
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+            # Sleep without holding a concurrency slot
+            await asyncio.sleep(self.backoff_delay(attempt))
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+    async def __aenter__(self) -> "LLMClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
@@ -0,0 +1,218 @@
+"""
+Prometheus metrics shared by the API and the workers
+The API serves them on GET /metrics; the worker runtime serves its own
+registry over HTTP (WORKER_METRICS_PORT). Everything on the hot path is an
+in-process counter/histogram update (about a microsecond), so the metrics can
+stay on in production. Queue depth and job-status gauges are read from Redis
+at scrape time instead of being tracked per request.
+"""
+
+import functools
+import inspect
+import time
+from collections.abc import Callable
+from typing import Any, TypeVar
+
+from prometheus_client import Counter, Gauge, Histogram
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Jobs take milliseconds (cache hits) to minutes (LLM + build)
+STAGE_BUCKETS = (
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+)
+REDIS_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.5,
+)
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "dreamquest_http_request_duration_seconds",
+    "API latency to the start of the response, by route template",
+    ["method", "route", "status"],
+)
+
+STAGE_SECONDS = Histogram(
+    "dreamquest_stage_duration_seconds",
+    "Pipeline stage duration",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "dreamquest_llm_request_duration_seconds",
+    "Upstream LLM call latency per attempt (excludes governor wait and backoff)",
+    ["output_type", "outcome"],
+    buckets=STAGE_BUCKETS,
+)
+
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "dreamquest_llm_time_to_first_token_seconds",
+    "Time from sending a streamed LLM request to its first text delta",
+    ["output_type"],
+    buckets=STAGE_BUCKETS,
+)
+
+LLM_TOKENS = Histogram(
+    "dreamquest_llm_tokens",
+    "Tokens per successful LLM call (kind: input, output, cache_read, cache_write)",
+    ["output_type", "kind"],
+    buckets=TOKEN_BUCKETS,
+)
+
+REDIS_OPERATIONS = Counter(
+    "dreamquest_redis_operations_total",
+    "Logical Redis operations (each may make several round trips)",
+    ["operation"],
+)
+
+REDIS_OPERATION_SECONDS = Histogram(
+    "dreamquest_redis_operation_duration_seconds",
+    "Latency of logical Redis operations, all their round trips included",
+    ["operation"],
+    buckets=REDIS_BUCKETS,
+)
+
+JOBS_COMPLETED = Counter(
+    "dreamquest_jobs_completed_total",
+    "Jobs finished by a worker",
+    ["pipeline", "status"],
+)
+
+BLUEPRINT_OUTPUT_TOKENS = Histogram(
+    "dreamquest_blueprint_output_tokens",
+    "LLM output tokens spent per game blueprint (all attempts), by outcome "
+    "(valid, repaired, retried, fallback)",
+    ["outcome"],
+    buckets=TOKEN_BUCKETS,
+)
+
+ASSET_REQUESTS = Counter(
+    "dreamquest_asset_requests_total",
+    "Asset requests by outcome "
+    "(hit = already stored, joined = shared an in-flight generation)",
+    ["outcome"],
+)
+
+BUILD_GC_RECLAIMED_BYTES = Counter(
+    "dreamquest_build_gc_reclaimed_bytes_total",
+    "Bytes of WebGL builds removed by the GC, by reason (expired, evicted, orphaned)",
+    ["reason"],
+)
+
+BUILD_BYTES = Gauge(
+    "dreamquest_build_bytes",
+    "Size of the tracked WebGL builds as of the last GC sweep",
+)
+
+WORKER_JOBS_IN_FLIGHT = Gauge(
+    "dreamquest_worker_jobs_in_flight",
+    "Jobs currently running in this worker process",
+)
+
+QUEUE_DEPTH = Gauge(
+    "dreamquest_queue_depth",
+    "Jobs waiting in each scheduler class",
+    ["queue"],
+)
+
+QUEUE_WAIT_SECONDS = Histogram(
+    "dreamquest_queue_wait_seconds",
+    "Time from enqueue to a worker picking the job up, by scheduler class",
+    ["queue"],
+    buckets=STAGE_BUCKETS,
+)
+
+JOBS_BY_STATUS = Gauge(
+    "dreamquest_jobs",
+    "Jobs currently in each non-terminal status",
+    ["status"],
+)
+
+
+def stage_timer(stage: str) -> Any:
+    """Context manager timing one pipeline stage"""
+    return STAGE_SECONDS.labels(stage).time()
+
+
+def record_llm_call(
+    output_type: str, outcome: str, seconds: float, usage: Any = None
+) -> None:
+    """Record one LLM attempt and, when present, its token usage"""
+    LLM_REQUEST_SECONDS.labels(output_type, outcome).observe(seconds)
+    if usage is not None:
+        LLM_TOKENS.labels(output_type, "input").observe(usage.input_tokens)
+        LLM_TOKENS.labels(output_type, "output").observe(usage.output_tokens)
+        # Prompt caching: input_tokens above excludes both of these
+        LLM_TOKENS.labels(output_type, "cache_read").observe(
+            usage.cache_read_input_tokens or 0
+        )
+        LLM_TOKENS.labels(output_type, "cache_write").observe(
+            usage.cache_creation_input_tokens or 0
+        )
+
+
+def record_blueprint(outcome: str, output_tokens: int) -> None:
+    """Record one game blueprint generation and the output tokens it cost"""
+    BLUEPRINT_OUTPUT_TOKENS.labels(outcome).observe(output_tokens)
+
+
+def record_first_token(output_type: str, seconds: float) -> None:
+    LLM_FIRST_TOKEN_SECONDS.labels(output_type).observe(seconds)
+
+
+def redis_operation(operation: str) -> Callable[[F], F]:
+    """Count and time one logical Redis operation (sync or async), in any round trips"""
+    count = REDIS_OPERATIONS.labels(operation)
+    latency = REDIS_OPERATION_SECONDS.labels(operation)
+
+    def decorator(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    count.inc()
+                    latency.observe(time.perf_counter() - start)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                count.inc()
+                latency.observe(time.perf_counter() - start)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
@@ -0,0 +1,215 @@
+"""
+Near-duplicate dream index
+The result cache only matches dreams that normalize to the same text; demo
+text with a word changed, or pasted with different punctuation, misses it.
+This index finds cached results for dreams that are merely similar.
+
+Each dream gets a MinHash signature over its word bigrams (NUM_HASHES
+minimums, one per hash function), so the fraction of equal minimums estimates
+the Jaccard similarity of two dreams. The signature is cut into BANDS bands
+of ROWS values and each band is an LSH bucket: dreams sharing any bucket are
+candidates, and only candidates are compared. Buckets are scoped by kind,
+style, mood and length, so a match always has the same job parameters.
+
+Redis layout:
+    gencache:near:{scope}:{band}:{band hash}   list  cache key digests, newest first
+    gencache:near:sig:{digest}                  the entry's signature (hex)
+
+Buckets are capped at BUCKET_CAP entries, so a lookup reads at most
+BANDS * BUCKET_CAP members in one script call whatever the index size, then
+fetches the signatures of the candidates sharing the most bands in one
+pipeline and compares MAX_CANDIDATES of them. Entries point at result cache
+keys; one evicted from the cache (signature gone) is simply skipped.
+
+lookup_result combines this with the exact lookup, and counts a cache miss
+only when neither finds a result.
+"""
+
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+from functools import lru_cache
+from typing import Any
+
+from workers.metrics import redis_operation
+from workers.result_cache import (
+    CACHE_TTL_SECONDS,
+    INDEX_KEY,
+    KEY_PREFIX,
+    SIGNATURE_PREFIX,
+    STATS_KEY,
+    cache_key,
+    get_cached_result,
+    normalize_text,
+    record_miss,
+    signature_key,
+)
+
+# Estimated Jaccard similarity needed to reuse a result (0 disables the index)
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+NEAR_PREFIX = KEY_PREFIX + "near:"
+
+BANDS = 16
+ROWS = 4
+NUM_HASHES = BANDS * ROWS
+BUCKET_CAP = 16
+MAX_CANDIDATES = 8
+MIN_SHINGLES = 4  # shorter dreams are left to the exact cache
+
+_SIGNATURE_FORMAT = f"<{NUM_HASHES}I"
+
+# KEYS: the dream's bucket lists
+# ARGV: max members to return
+# Returns the digests sharing the most buckets, most shared first
+RANK_LUA = """
+local counts, members = {}, {}
+for _, key in ipairs(KEYS) do
+    for _, member in ipairs(redis.call('LRANGE', key, 0, -1)) do
+        if not counts[member] then
+            counts[member] = 0
+            members[#members + 1] = member
+        end
+        counts[member] = counts[member] + 1
+    end
+end
+table.sort(members, function(a, b) return counts[a] > counts[b] end)
+local ranked = {}
+for i = 1, math.min(#members, tonumber(ARGV[1])) do
+    ranked[i] = members[i]
+end
+return ranked
+"""
+
+
+def shingles(text: str) -> set[str]:
+    """Word bigrams of the normalized text, punctuation ignored"""
+    words = re.findall(r"\w+", normalize_text(text))
+    return {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+@lru_cache(maxsize=1024)
+def signature(text: str) -> tuple[int, ...] | None:
+    """MinHash signature of a dream, or None if it is too short to compare"""
+    grams = shingles(text)
+    if len(grams) < MIN_SHINGLES:
+        return None
+    # One extendable-output hash gives each bigram NUM_HASHES independent 32-bit values
+    rows = [
+        struct.unpack(
+            _SIGNATURE_FORMAT, hashlib.shake_128(gram.encode()).digest(4 * NUM_HASHES)
+        )
+        for gram in grams
+    ]
+    return tuple(map(min, zip(*rows)))
+
+
+def similarity(a: tuple[int, ...], b: tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+def bucket_keys(kind: str, job_data: dict[str, Any], sig: tuple[int, ...]) -> list[str]:
+    scope = hashlib.sha256(
+        json.dumps(
+            [
+                kind,
+                job_data.get("style"),
+                job_data.get("mood"),
+                job_data.get("length"),
+            ]
+        ).encode()
+    ).hexdigest()[:16]
+    keys = []
+    for band in range(BANDS):
+        rows = struct.pack(f"<{ROWS}I", *sig[band * ROWS : (band + 1) * ROWS])
+        digest = hashlib.blake2b(rows, digest_size=8).hexdigest()
+        keys.append(f"{NEAR_PREFIX}{scope}:{band}:{digest}")
+    return keys
+
+
+@redis_operation("cache.near_get")
+async def find_near_duplicate(
+    r: Any, kind: str, job_data: dict[str, Any], dream_text: str
+) -> dict[str, Any] | None:
+    """A cached result for a dream similar enough to dream_text, same parameters"""
+    sig = signature(dream_text) if NEAR_DUPLICATE_THRESHOLD > 0 else None
+    if sig is None:
+        return None
+
+    rank = r.register_script(RANK_LUA)
+    # Twice the candidates, as some may have been evicted from the result cache
+    ranked = await rank(
+        keys=bucket_keys(kind, job_data, sig), args=[2 * MAX_CANDIDATES]
+    )
+    if not ranked:
+        return None
+    pipe = r.pipeline(transaction=False)
+    for digest in ranked:
+        pipe.get(SIGNATURE_PREFIX + digest)
+    found = [
+        (digest, stored)
+        for digest, stored in zip(ranked, await pipe.execute())
+        if stored
+    ]
+
+    best, best_score = None, NEAR_DUPLICATE_THRESHOLD
+    for digest, stored in found[:MAX_CANDIDATES]:
+        score = similarity(sig, struct.unpack(_SIGNATURE_FORMAT, bytes.fromhex(stored)))
+        if score >= best_score:
+            best, best_score = digest, score
+    if best is None:
+        return None
+
+    key = KEY_PREFIX + best
+    payload = await r.get(key)
+    if payload is None:
+        return None
+    pipe = r.pipeline(transaction=False)
+    pipe.hincrby(STATS_KEY, "near_hits", 1)
+    pipe.zadd(INDEX_KEY, {key: time.time()})
+    await pipe.execute()
+    return json.loads(payload)
+
+
+async def lookup_result(
+    r: Any, kind: str, job_data: dict[str, Any], dream_text: str
+) -> dict[str, Any] | None:
+    """The cached result for these inputs, else a near-duplicate's
+
+    A miss is only counted when both lookups fail.
+    """
+    key = cache_key(kind, {**job_data, "dream_text": dream_text})
+    cached = await get_cached_result(
+        r, key, count_miss=False
+    ) or await find_near_duplicate(r, kind, job_data, dream_text)
+    if cached is None:
+        await record_miss(r)
+    return cached
+
+
+@redis_operation("cache.near_index")
+async def index_result(
+    r: Any, kind: str, job_data: dict[str, Any], dream_text: str, key: str
+) -> None:
+    """Make the result stored under cache key findable by similar dreams"""
+    sig = signature(dream_text) if NEAR_DUPLICATE_THRESHOLD > 0 else None
+    if sig is None:
+        return
+
+    digest = key[len(KEY_PREFIX) :]
+    pipe = r.pipeline(transaction=False)
+    pipe.set(
+        signature_key(key),
+        struct.pack(_SIGNATURE_FORMAT, *sig).hex(),
+        ex=CACHE_TTL_SECONDS,
+    )
+    for bucket in bucket_keys(kind, job_data, sig):
+        pipe.lrem(bucket, 0, digest)
+        pipe.lpush(bucket, digest)
+        pipe.ltrim(bucket, 0, BUCKET_CAP - 1)
+        pipe.expire(bucket, CACHE_TTL_SECONDS)
+    await pipe.execute()
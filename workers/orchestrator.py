@@ -1,15 +1,50 @@
 """
 Dream-to-world orchestration pipeline
-Handles the multi-step process of converting a dream description into a playable WebGL world
+Handles the multi-step process of converting a dream description into a playable
+WebGL world
+
+The pipelines are coroutines over a WorkerContext (pooled async Redis, one LLM
+client, optional process pool for CPU-bound stages). process_dream and
+process_generation run one job synchronously (tests, scripts); workers/runtime.py
+runs the same coroutines many at a time per process, dispatching the scheduler's
+entries through PIPELINES.
 """
 
+import asyncio
 import json
+import logging
 import os
-import random
+import time
+from collections.abc import Awaitable, Callable
+from concurrent.futures import Executor
 from typing import Any
-from uuid import UUID
 
 import redis
+import redis.asyncio as aioredis
+
+from workers.assets import AssetService
+from workers.builds import BuildRegistry, build_id, build_url, publish_build
+from workers.dream_rules import DREAM_PARSER, parse_many  # noqa: F401 (re-exported)
+from workers.generators import (
+    GENERATION_STAGES,
+    PartialCallback,
+    forward_text,
+    generate_scene_description,
+)
+from workers.job_store import AsyncJobStore, JobStore
+from workers.llm import LLMClient
+from workers.metrics import stage_timer
+from workers.near_duplicates import index_result, lookup_result
+from workers.result_cache import cache_key, store_result
+from workers.transcription import transcribe_url
+
+logger = logging.getLogger(__name__)
+
+# Root of the shared WebGL builds (served by the frontend under /webgl)
+WEBGL_OUTPUT_DIR = os.getenv("WEBGL_OUTPUT_DIR", "/frontend/public/webgl")
+
+# Minimum gap between partial-output writes while an LLM response streams
+PARTIAL_UPDATE_SECONDS = float(os.getenv("PARTIAL_UPDATE_SECONDS", "0.1"))
 
 
 def get_redis() -> redis.Redis:
@@ -18,230 +53,462 @@ def get_redis() -> redis.Redis:
     return redis.from_url(redis_url, decode_responses=True)
 
 
+def get_async_redis() -> aioredis.Redis:
+    """Get pooled asyncio Redis client (one per event loop)"""
+    redis_url = os.getenv("REDIS_URL", "redis://localhost:6379")
+    return aioredis.from_url(redis_url, decode_responses=True)
+
+
+class WorkerContext:
+    """Connections shared by every job a worker process runs"""
+
+    def __init__(self, r: Any, cpu_pool: Executor | None = None) -> None:
+        self.r = r
+        self.store = AsyncJobStore(r)
+        self.cpu_pool = cpu_pool
+        self._llm: LLMClient | None = None
+        self._assets: AssetService | None = None
+        self._builds: BuildRegistry | None = None
+
+    @property
+    def llm(self) -> LLMClient:
+        # Created on first use, so LLM-free pipelines need no API key
+        if self._llm is None:
+            self._llm = LLMClient.from_env()
+        return self._llm
+
+    @property
+    def assets(self) -> AssetService:
+        # One service per worker, so concurrent jobs share in-flight generations
+        if self._assets is None:
+            self._assets = AssetService(self.r)
+        return self._assets
+
+    @property
+    def builds(self) -> BuildRegistry:
+        if self._builds is None:
+            self._builds = BuildRegistry(self.r)
+        return self._builds
+
+    async def run_cpu(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run a CPU-bound stage on the process pool (inline without one)"""
+        if self.cpu_pool is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.cpu_pool, func, *args
+        )
+
+    async def aclose(self) -> None:
+        if self._llm is not None:
+            await self._llm.aclose()
+        await self.r.aclose()
+
+    async def __aenter__(self) -> "WorkerContext":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+
+class PartialUpdates:
+    """Forward streamed output to the job record, at most every PARTIAL_UPDATE_SECONDS
+
+    The first chunk is written immediately so clients see content as soon as
+    the model starts answering; later chunks are coalesced. Fields accumulate,
+    so stages streaming concurrently into one instance all stay visible.
+    """
+
+    def __init__(
+        self,
+        ctx: WorkerContext,
+        job_id: str,
+        output_type: str,
+        status: str,
+        progress: int,
+    ) -> None:
+        self.ctx = ctx
+        self.job_id = job_id
+        self.output_type = output_type
+        self.status = status
+        self.progress = progress
+        self.fields: dict[str, Any] = {}
+        self._last_write = 0.0
+
+    async def __call__(self, partial: dict[str, Any]) -> None:
+        self.fields.update(partial)
+        now = time.monotonic()
+        if now - self._last_write < PARTIAL_UPDATE_SECONDS:
+            return
+        self._last_write = now
+        await self.ctx.store.set_partial(
+            self.job_id,
+            self.status,
+            self.progress,
+            {"output_type": self.output_type, **self.fields},
+        )
+
+
+async def resolve_dream_text(
+    ctx: WorkerContext,
+    job_id: str,
+    job_data: dict[str, Any],
+    output_type: str,
+    progress: int,
+) -> str:
+    """The job's dream text, transcribing its audio_url when it has none
+
+    Chunks are transcribed on the CPU pool; the transcript so far is published
+    as partial output ({"transcript": ...}) while the audio streams in.
+    """
+    if job_data.get("dream_text") or not job_data.get("audio_url"):
+        return job_data.get("dream_text", "")
+
+    partial = PartialUpdates(ctx, job_id, output_type, "analyzing", progress)
+
+    async def on_transcript(text: str) -> None:
+        await partial({"transcript": text})
+
+    with stage_timer("transcribe"):
+        return await transcribe_url(job_data["audio_url"], ctx.cpu_pool, on_transcript)
+
+
 def update_job_status(
     r: redis.Redis,
     job_id: str,
     status: str,
     progress: int,
     result: dict[str, Any] | None = None,
-    error: str | None = None
+    error: str | None = None,
 ) -> None:
-    """Update job status in Redis"""
-    job_key = f"job:{job_id}"
-    job_data_str = r.get(job_key)
-
-    if not job_data_str:
-        raise ValueError(f"Job {job_id} not found")
-
-    job_data = json.loads(job_data_str)
-    job_data["status"] = status
-    job_data["progress"] = progress
-
-    if result:
-        job_data["result"] = result
+    """Update job status in Redis (atomic per-field write, see workers/job_store.py)"""
+    JobStore(r).set_status(job_id, status, progress, result=result, error=error)
 
-    if error:
-        job_data["error"] = error
 
-    r.set(job_key, json.dumps(job_data), ex=86400)
+async def mark_failed(ctx: WorkerContext, job_id: str, error: Exception) -> None:
+    """Record a pipeline failure on the job, without hiding it if that fails too"""
+    try:
+        await ctx.store.set_status(job_id, "failed", 0, error=str(error))
+    except Exception:
+        # e.g. the job record is gone; the caller re-raises the original error
+        logger.exception("could not mark job %s failed", job_id)
 
 
 def parse_dream_to_blueprint(dream_text: str, style: str, mood: str) -> dict[str, Any]:
     """
     Step A: Parse dream text into a blueprint JSON
-    This is a deterministic stub - replace with LLM call (OpenAI/Anthropic/HF) in production
+    Deterministic fast path: whole-word keyword rules from workers/dream_rules.py,
+    compiled once into a single-pass lookup. Use parse_many() for batches.
     """
 
-    # Deterministic parsing based on keywords
-    world_type = "forest"
-    time_of_day = "night"
-    weather = "clear"
-    goal = "explore"
-    characters = []
-
-    # Simple keyword detection
-    text_lower = dream_text.lower()
-
-    # World detection
-    if "forest" in text_lower or "tree" in text_lower or "woods" in text_lower:
-        world_type = "forest"
-    elif "city" in text_lower or "urban" in text_lower or "street" in text_lower:
-        world_type = "city"
-    elif "ocean" in text_lower or "sea" in text_lower or "water" in text_lower:
-        world_type = "ocean"
-    elif "desert" in text_lower or "sand" in text_lower:
-        world_type = "desert"
-    elif "space" in text_lower or "stars" in text_lower or "galaxy" in text_lower:
-        world_type = "space"
-
-    # Time detection
-    if "night" in text_lower or "dark" in text_lower or "moon" in text_lower:
-        time_of_day = "night"
-    elif "day" in text_lower or "sun" in text_lower or "bright" in text_lower:
-        time_of_day = "day"
-    elif "sunset" in text_lower or "dusk" in text_lower:
-        time_of_day = "sunset"
-    elif "dawn" in text_lower or "sunrise" in text_lower:
-        time_of_day = "dawn"
-
-    # Weather detection
-    if "rain" in text_lower or "feather" in text_lower:
-        weather = "feathers_rain"
-    elif "fog" in text_lower or "mist" in text_lower:
-        weather = "fog"
-    elif "storm" in text_lower:
-        weather = "storm"
-
-    # Characters detection
-    if "bird" in text_lower:
-        characters.append({"type": "bird", "role": "guide"})
-
-    if "house" in text_lower and ("float" in text_lower or "flying" in text_lower):
-        characters.append({"type": "house", "float": True})
-    elif "house" in text_lower:
-        characters.append({"type": "house", "float": False})
-
-    if "person" in text_lower or "figure" in text_lower or "someone" in text_lower:
-        characters.append({"type": "person", "role": "mysterious"})
-
-    # Goal detection
-    if "follow" in text_lower:
-        goal = "follow_bird_to_flying_house"
-    elif "find" in text_lower or "search" in text_lower:
-        goal = "find_hidden_object"
-    elif "escape" in text_lower or "run" in text_lower:
-        goal = "escape_danger"
-    else:
-        goal = "explore_world"
-
-    blueprint = {
-        "world": world_type,
-        "time": time_of_day,
-        "weather": weather,
-        "goal": goal,
-        "characters": characters,
-        "style": style,
-        "mood": mood
-    }
-
-    return blueprint
+    return DREAM_PARSER.parse(dream_text, style, mood)
 
 
-def generate_assets_mock(blueprint: dict[str, Any]) -> dict[str, Any]:
+async def generate_assets_mock(
+    ctx: WorkerContext, blueprint: dict[str, Any]
+) -> dict[str, Any]:
     """
-    Step B: Generate asset placeholders
-    In production, this would call SDXL for images, procedural generators, etc.
+    Step B: Generate assets
+    Terrain, character models and ambient audio come from the shared asset
+    service, so jobs needing the same asset reuse one generated file.
+    In production the generators behind it would call SDXL, procedural tools, etc.
     """
-
-    assets = {
-        "models": [],
-        "textures": [],
-        "audio": []
-    }
-
-    # Mock asset generation based on blueprint
-    for character in blueprint.get("characters", []):
-        assets["models"].append({
-            "type": character["type"],
-            "file": f"/assets/models/{character['type']}.glb"
-        })
-
-    # Environment assets
-    assets["models"].append({
-        "type": "terrain",
-        "file": f"/assets/models/terrain_{blueprint['world']}.glb"
-    })
-
-    # Audio
-    assets["audio"].append({
-        "type": "ambient",
-        "file": f"/assets/audio/ambient_{blueprint['mood']}.mp3"
-    })
-
-    return assets
+    return await ctx.assets.generate_for_blueprint(blueprint)
 
 
-def build_webgl_world(job_id: str, blueprint: dict[str, Any]) -> str:
+def build_webgl_world(blueprint: dict[str, Any]) -> dict[str, Any]:
     """
     Step C: Build WebGL world
-    In a real implementation, this would:
-    1. Write blueprint.json to Unity StreamingAssets or pass via URL
-    2. Trigger Unity Cloud Build or local build
-    3. Export WebGL to /frontend/public/webgl/{job_id}/
+    In a real implementation, this would write blueprint.json to Unity
+    StreamingAssets and trigger a Unity (Cloud) Build exporting WebGL.
 
-    For this stub, we create a mock structure
+    Builds are content-addressed (see workers/builds.py): a blueprint that was
+    already built is reused, and the job only records which build it points at.
     """
 
-    # Create directory structure (in production, this would be handled by Unity build)
-    webgl_dir = f"/frontend/public/webgl/{job_id}"
-    os.makedirs(webgl_dir, exist_ok=True)
+    build, written = publish_build(WEBGL_OUTPUT_DIR, blueprint)
+    return {"build_id": build, "webgl_url": build_url(build), "bytes": written}
 
-    # Write blueprint
-    with open(f"{webgl_dir}/blueprint.json", "w") as f:
-        json.dump(blueprint, f, indent=2)
 
-    # In production, Unity would generate:
-    # - index.html
-    # - Build/Build.wasm
-    # - Build/Build.data
-    # - Build/Build.framework.js
-    # - Build/Build.loader.js
-
-    # For now, return the URL
-    webgl_url = f"/webgl/{job_id}/index.html"
-
-    return webgl_url
-
-
-def process_dream(job_id: str) -> None:
+async def run_dream_pipeline(ctx: WorkerContext, job_id: str) -> None:
     """
-    Main orchestration function
+    Main orchestration pipeline
     Processes a dream through all pipeline stages
     """
 
-    r = get_redis()
-
     try:
         # Get job data
-        job_data_str = r.get(f"job:{job_id}")
-        if not job_data_str:
+        job_data = await ctx.store.get(job_id)
+        if not job_data:
             raise ValueError(f"Job {job_id} not found")
 
-        job_data = json.loads(job_data_str)
-
-        dream_text = job_data.get("dream_text", "")
         style = job_data.get("style", "lowpoly")
         mood = job_data.get("mood", "mystic")
 
-        # Step A: Analyzing - Parse dream to blueprint
-        update_job_status(r, job_id, "analyzing", 25)
-
-        blueprint = parse_dream_to_blueprint(dream_text, style, mood)
+        # Step A: Analyzing - Transcribe audio if needed, parse dream to blueprint
+        await ctx.store.set_status(job_id, "analyzing", 25)
+        dream_text = await resolve_dream_text(ctx, job_id, job_data, "game", 25)
+
+        use_cache = bool(dream_text) and not job_data.get("bypass_cache")
+        # Keyed on the text actually parsed: audio jobs share it with their transcript
+        blueprint_key = cache_key("blueprint", {**job_data, "dream_text": dream_text})
+        blueprint = None
+        if use_cache:
+            blueprint = await lookup_result(ctx.r, "blueprint", job_data, dream_text)
+
+        if blueprint is None:
+            # Microseconds per dream: cheaper inline than any executor handoff
+            with stage_timer("parse_dream"):
+                blueprint = parse_dream_to_blueprint(dream_text, style, mood)
+            if use_cache and await store_result(ctx.r, blueprint_key, blueprint):
+                await index_result(
+                    ctx.r, "blueprint", job_data, dream_text, blueprint_key
+                )
 
         # Step B: Generating - Generate assets
-        update_job_status(r, job_id, "generating", 50)
+        await ctx.store.set_status(job_id, "generating", 50)
 
-        assets = generate_assets_mock(blueprint)
+        with stage_timer("generate_assets"):
+            await generate_assets_mock(ctx, blueprint)
 
         # Step C: Building - Build WebGL world
-        update_job_status(r, job_id, "building", 75)
+        await ctx.store.set_status(job_id, "building", 75)
 
-        webgl_url = build_webgl_world(job_id, blueprint)
+        with stage_timer("build_webgl"):
+            # Registered before building so the GC never removes it under us
+            await ctx.builds.use(build_id(blueprint))
+            build = await ctx.run_cpu(build_webgl_world, blueprint)
+            if build["bytes"]:
+                await ctx.builds.record_size(build["build_id"], build["bytes"])
 
         # Step D: Ready - Job complete
         result = {
-            "webgl_url": webgl_url,
-            "blueprint": blueprint
+            "output_type": "game",
+            "webgl_url": build["webgl_url"],
+            "build_id": build["build_id"],
+            "blueprint": blueprint,
         }
 
-        update_job_status(r, job_id, "ready", 100, result=result)
+        await ctx.store.set_status(job_id, "ready", 100, result=result)
 
     except Exception as e:
-        # Handle errors
-        update_job_status(r, job_id, "failed", 0, error=str(e))
+        await mark_failed(ctx, job_id, e)
         raise
 
 
+async def run_generation_stage(
+    ctx: WorkerContext,
+    output_type: str,
+    job_data: dict[str, Any],
+    dream_text: str,
+    on_partial: PartialCallback | None = None,
+) -> dict[str, Any]:
+    """Run one generation stage on the context's shared LLM client"""
+    stage = GENERATION_STAGES[output_type]
+    return await stage(ctx.llm, job_data, dream_text, on_partial)
+
+
+async def run_generation_pipeline(ctx: WorkerContext, job_id: str) -> None:
+    """
+    Generation orchestration pipeline (enqueued by POST /v1/generate)
+    Runs the image, video or game stage for the job's output_type, or every
+    stage of a multi-output job (output_types)
+    """
+
+    try:
+        # Get job data
+        job_data = await ctx.store.get(job_id)
+        if not job_data:
+            raise ValueError(f"Job {job_id} not found")
+
+        output_type = job_data.get("output_type", "game")
+        if output_type not in GENERATION_STAGES:
+            raise ValueError(f"Unknown output_type: {output_type}")
+
+        if job_data.get("output_types"):
+            await run_multi_output_pipeline(ctx, job_id, job_data)
+            return
+
+        # Cache hit: finish without touching the LLM
+        use_cache = bool(job_data.get("dream_text")) and not job_data.get(
+            "bypass_cache"
+        )
+        result_key = cache_key(output_type, job_data)
+        if use_cache:
+            # An exact repeat, else a near-copy with the same style, mood and length
+            cached = await lookup_result(
+                ctx.r, output_type, job_data, job_data["dream_text"]
+            )
+            if cached is not None:
+                await ctx.store.set_status(job_id, "ready", 100, result=cached)
+                return
+
+        # Step A: Analyzing - Get final dream text (transcribe audio if needed)
+        await ctx.store.set_status(job_id, "analyzing", 10)
+
+        dream_text = (
+            await resolve_dream_text(ctx, job_id, job_data, output_type, 10)
+            or "A mysterious dream world"
+        )
+
+        # Step B: Generating - Run the output-specific stage
+        await ctx.store.set_status(job_id, "generating", 30)
+
+        # Streamed output reaches the job record / event stream as it arrives
+        partial = PartialUpdates(ctx, job_id, output_type, "generating", 30)
+        with stage_timer(f"generate_{output_type}"):
+            result = await run_generation_stage(
+                ctx, output_type, job_data, dream_text, partial
+            )
+
+        if use_cache and await store_result(ctx.r, result_key, result):
+            await index_result(
+                ctx.r, output_type, job_data, job_data["dream_text"], result_key
+            )
+
+        # Step C: Ready - Job complete
+        await ctx.store.set_status(job_id, "ready", 100, result=result)
+
+    except Exception as e:
+        await mark_failed(ctx, job_id, e)
+        raise
+
+
+def merge_results(
+    output_type: str, output_types: list[str], results: dict[str, dict[str, Any]]
+) -> dict[str, Any]:
+    """One job result with every output's fields (image_url, video_url, webgl_url...)"""
+    merged: dict[str, Any] = {"output_type": output_type, "output_types": output_types}
+    for name in output_types:
+        merged.update(
+            {
+                field: value
+                for field, value in results[name].items()
+                if field != "output_type"
+            }
+        )
+    return merged
+
+
+def scene_output_kind(output_type: str) -> str:
+    """Cache kind of an output generated from the shared scene, not the raw dream"""
+    return f"{output_type}:scene"
+
+
+async def run_multi_output_pipeline(
+    ctx: WorkerContext, job_id: str, job_data: dict[str, Any]
+) -> None:
+    """
+    Several outputs for one job: one shared analysis, then every stage at once
+    Outputs already cached for these inputs are reused; the others are
+    generated concurrently from the same scene description and cached one by one.
+    They are cached apart from single-output results (scene_output_kind), which
+    are generated from the dream itself.
+    """
+    output_types = job_data["output_types"].split(",")
+    use_cache = bool(job_data.get("dream_text")) and not job_data.get("bypass_cache")
+
+    results: dict[str, dict[str, Any]] = {}
+    if use_cache:
+        for output_type in output_types:
+            kind = scene_output_kind(output_type)
+            cached = await lookup_result(ctx.r, kind, job_data, job_data["dream_text"])
+            if cached is not None:
+                results[output_type] = cached
+    missing = [
+        output_type for output_type in output_types if output_type not in results
+    ]
+
+    if missing:
+        # Step A: Analyzing - Final dream text, then the scene every output works from
+        await ctx.store.set_status(job_id, "analyzing", 10)
+        dream_text = (
+            await resolve_dream_text(ctx, job_id, job_data, job_data["output_type"], 10)
+            or "A mysterious dream world"
+        )
+        partial = PartialUpdates(ctx, job_id, job_data["output_type"], "analyzing", 10)
+        with stage_timer("analyze_scene"):
+            scene = await generate_scene_description(
+                ctx.llm,
+                dream_text,
+                job_data["style"],
+                job_data["mood"],
+                forward_text(partial, "scene"),
+            )
+
+        # Step B: Generating - Every missing output concurrently, into one partial
+        await ctx.store.set_status(job_id, "generating", 30)
+        partial = PartialUpdates(ctx, job_id, job_data["output_type"], "generating", 30)
+
+        async def generate(output_type: str) -> dict[str, Any]:
+            with stage_timer(f"generate_{output_type}"):
+                return await run_generation_stage(
+                    ctx, output_type, job_data, scene, partial
+                )
+
+        tasks = [
+            asyncio.ensure_future(generate(output_type)) for output_type in missing
+        ]
+        try:
+            generated = await asyncio.gather(*tasks)
+        except BaseException:
+            # One failed output fails the job: stop paying for the others
+            for task in tasks:
+                task.cancel()
+            raise
+
+        for output_type, result in zip(missing, generated):
+            results[output_type] = result
+            kind = scene_output_kind(output_type)
+            result_key = cache_key(kind, job_data)
+            if use_cache and await store_result(ctx.r, result_key, result):
+                await index_result(
+                    ctx.r, kind, job_data, job_data["dream_text"], result_key
+                )
+
+    # Step C: Ready - One result with every output
+    await ctx.store.set_status(
+        job_id,
+        "ready",
+        100,
+        result=merge_results(job_data["output_type"], output_types, results),
+    )
+
+
+# Enqueued function path -> pipeline coroutine (used by workers/runtime.py)
+PIPELINES: dict[str, Callable[[WorkerContext, str], Awaitable[None]]] = {
+    "workers.orchestrator.process_dream": run_dream_pipeline,
+    "workers.orchestrator.process_generation": run_generation_pipeline,
+}
+
+
+def run_pipeline_once(
+    pipeline: Callable[[WorkerContext, str], Awaitable[None]], job_id: str
+) -> None:
+    """Run one pipeline on a fresh event loop and context (one job per process)"""
+
+    async def run() -> None:
+        async with WorkerContext(get_async_redis()) as ctx:
+            await pipeline(ctx, job_id)
+
+    asyncio.run(run())
+
+
+def process_dream(job_id: str) -> None:
+    """
+    Main orchestration function (queued by POST /v1/jobs)
+    Processes a dream through all pipeline stages
+    """
+    run_pipeline_once(run_dream_pipeline, job_id)
+
+
+def process_generation(job_id: str) -> None:
+    """
+    Generation orchestration function (queued by POST /v1/generate)
+    Runs the image, video or game stage for the job's output_type
+    """
+    run_pipeline_once(run_generation_pipeline, job_id)
+
+
 # For testing
 if __name__ == "__main__":
     test_job_id = "test-job-123"
@@ -252,17 +519,23 @@ if __name__ == "__main__":
         "job_id": test_job_id,
         "status": "queued",
         "progress": 0,
-        "dream_text": "I was flying over a magical forest at night. A glowing bird appeared and guided me to a floating house. Feathers were falling from the sky like rain.",
+        "dream_text": (
+            "I was flying over a magical forest at night. A glowing bird appeared "
+            "and guided me to a floating house. Feathers were falling from the sky "
+            "like rain."
+        ),
         "style": "lowpoly",
         "mood": "mystic",
-        "length": "short"
+        "length": "short",
     }
 
-    r.set(f"job:{test_job_id}", json.dumps(test_job))
+    store = JobStore(r)
+    store.create(test_job)
 
     # Process it
     process_dream(test_job_id)
 
     # Check result
-    result = r.get(f"job:{test_job_id}")
-    print(json.dumps(json.loads(result), indent=2))
+    job = store.get(test_job_id)
+    job["result"] = store.get_result(test_job_id)
+    print(json.dumps(job, indent=2))
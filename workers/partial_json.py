@@ -0,0 +1,102 @@
+"""
+Incremental JSON parsing for streamed LLM output
+Structured output arrives as JSON fragments (tool input deltas). The parser
+scans each fragment once, remembering where the last complete value ended
+and which containers were open there, so at any point the text can be
+repaired locally: cut back to that point and close the open containers.
+
+Only complete values survive a repair. A truncated string, number or
+literal, or a key without its value, is dropped rather than guessed, so
+"goal": "expl never becomes a goal of "expl".
+"""
+
+import json
+from typing import Any
+
+_CLOSERS = {"{": "}", "[": "]"}
+_VALUE_END = set(",}] \t\r\n")
+
+
+class IncrementalJSONParser:
+    """Feed fragments of one JSON document; snapshot() repairs what has arrived"""
+
+    def __init__(self) -> None:
+        self.text = ""
+        self._stack: list[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_is_key = False
+        self._expect_key = False
+        self._in_scalar = False
+        self._cut = 0
+        self._cut_closers = ""
+        self.complete = False
+
+    def feed(self, fragment: str) -> None:
+        start = len(self.text)
+        self.text += fragment
+        for offset, char in enumerate(fragment):
+            self._scan(start + offset, char)
+
+    def _mark_complete(self, end: int) -> None:
+        """A value ended at text[:end]: a repair may cut here"""
+        self._cut = end
+        self._cut_closers = "".join(
+            _CLOSERS[opener] for opener in reversed(self._stack)
+        )
+        if not self._stack:
+            self.complete = True
+
+    def _scan(self, index: int, char: str) -> None:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if not self._string_is_key:
+                    self._mark_complete(index + 1)
+            return
+
+        if self._in_scalar:
+            if char not in _VALUE_END:
+                return
+            self._in_scalar = False
+            self._mark_complete(index)
+
+        if char == '"':
+            self._in_string = True
+            self._string_is_key = self._expect_key
+            self._expect_key = False
+        elif char in "{[":
+            self._stack.append(char)
+            self._expect_key = char == "{"
+            self._mark_complete(index + 1)
+        elif char in "}]":
+            if self._stack:
+                self._stack.pop()
+            self._expect_key = False
+            self._mark_complete(index + 1)
+        elif char == ",":
+            self._expect_key = bool(self._stack) and self._stack[-1] == "{"
+        elif char not in ": \t\r\n":
+            self._in_scalar = True
+
+    def snapshot(self) -> Any:
+        """The document so far without incomplete trailing values (None before any)"""
+        if self.complete and not self._in_scalar:
+            return json.loads(self.text)
+        if self._in_scalar and not self._stack:
+            # A bare top-level number/literal is complete at the end of input
+            return json.loads(self.text)
+        if not self._cut:
+            return None
+        return json.loads(self.text[: self._cut] + self._cut_closers)
+
+
+def parse_partial_json(text: str) -> tuple[Any, bool]:
+    """(value, complete) for possibly truncated JSON; ValueError if it is malformed"""
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    return parser.snapshot(), parser.complete
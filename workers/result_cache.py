@@ -0,0 +1,128 @@
+"""
+Content-addressed generation result cache
+Results are keyed by a hash of the normalized job inputs, so repeated dreams
+(demo traffic, client retries) finish without another LLM call or parse.
+Lookups and stores take the worker's redis.asyncio client.
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Any
+
+from workers.metrics import redis_operation
+
+KEY_PREFIX = "gencache:"
+INDEX_KEY = "gencache:index"  # sorted set: cache key -> last access time
+STATS_KEY = "gencache:stats"  # hash: hits / misses / near_hits / stores / skipped
+# Near-duplicate signatures (workers/near_duplicates.py), removed with their entry
+SIGNATURE_PREFIX = "gencache:near:sig:"
+
+CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 86400)))
+CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000"))
+CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(64 * 1024)))
+
+
+def normalize_text(text: str) -> str:
+    """Case-fold and collapse whitespace so trivial edits share a key"""
+    return " ".join(text.split()).casefold()
+
+
+def signature_key(key: str) -> str:
+    """Near-duplicate signature key for a cache key"""
+    return SIGNATURE_PREFIX + key[len(KEY_PREFIX) :]
+
+
+def cache_key(kind: str, job_data: dict[str, Any]) -> str:
+    """Cache key for a job's inputs; kind is the output_type or pipeline stage"""
+    material = json.dumps(
+        [
+            kind,
+            normalize_text(job_data.get("dream_text") or ""),
+            job_data.get("style"),
+            job_data.get("mood"),
+            job_data.get("length"),
+        ]
+    )
+    return KEY_PREFIX + hashlib.sha256(material.encode()).hexdigest()
+
+
+@redis_operation("cache.get")
+async def get_cached_result(
+    r: Any, key: str, count_miss: bool = True
+) -> dict[str, Any] | None:
+    """Look up a cached result, counting the hit (and the miss, unless told not to)"""
+    payload = await r.get(key)
+    if payload is None:
+        if count_miss:
+            await r.hincrby(STATS_KEY, "misses", 1)
+        return None
+
+    pipe = r.pipeline(transaction=False)
+    pipe.hincrby(STATS_KEY, "hits", 1)
+    pipe.zadd(INDEX_KEY, {key: time.time()})
+    await pipe.execute()
+    return json.loads(payload)
+
+
+@redis_operation("cache.miss")
+async def record_miss(r: Any) -> None:
+    await r.hincrby(STATS_KEY, "misses", 1)
+
+
+@redis_operation("cache.store")
+async def store_result(r: Any, key: str, result: dict[str, Any]) -> bool:
+    """Cache a result, evicting least recently used entries over the budget"""
+    payload = json.dumps(result)
+    if len(payload) > CACHE_MAX_ENTRY_BYTES:
+        await r.hincrby(STATS_KEY, "skipped", 1)
+        return False
+
+    pipe = r.pipeline(transaction=False)
+    pipe.set(key, payload, ex=CACHE_TTL_SECONDS)
+    pipe.zadd(INDEX_KEY, {key: time.time()})
+    pipe.hincrby(STATS_KEY, "stores", 1)
+    pipe.zcard(INDEX_KEY)
+    entries = (await pipe.execute())[-1]
+
+    if entries > CACHE_MAX_ENTRIES:
+        popped = await r.zpopmin(INDEX_KEY, entries - CACHE_MAX_ENTRIES)
+        evicted = [member for member, _ in popped]
+        if evicted:
+            await r.delete(*evicted, *(signature_key(key) for key in evicted))
+
+    return True
+
+
+def stats_pipeline(r: Any) -> Any:
+    """Queue the stats reads on a pipeline (works for sync and asyncio clients)"""
+    pipe = r.pipeline(transaction=False)
+    pipe.hgetall(STATS_KEY)
+    pipe.zcard(INDEX_KEY)
+    return pipe
+
+
+def format_stats(results: list[Any]) -> dict[str, Any]:
+    """Turn stats_pipeline results into counters and a hit rate"""
+    counters, entries = results
+    counters = {
+        (k.decode() if isinstance(k, bytes) else k): int(v)
+        for k, v in (counters or {}).items()
+    }
+    hits = counters.get("hits", 0)
+    misses = counters.get("misses", 0)
+    near_hits = counters.get("near_hits", 0)
+    lookups = hits + near_hits + misses
+
+    return {
+        "hits": hits,
+        "misses": misses,
+        "near_hits": near_hits,
+        "stores": counters.get("stores", 0),
+        "skipped": counters.get("skipped", 0),
+        "entries": entries,
+        "hit_rate": (hits + near_hits) / lookups if lookups else 0.0,
+        "max_entries": CACHE_MAX_ENTRIES,
+        "ttl_seconds": CACHE_TTL_SECONDS,
+    }
@@ -0,0 +1,235 @@
+"""
+Concurrent worker runtime
+Consumes the per-class job queues (workers/scheduler.py) and runs many jobs
+at once per process: I/O-bound stages (Redis, LLM calls) are coroutines on one
+event loop sharing pooled connections, CPU-bound stages go to a process pool.
+
+    python -m workers.runtime
+
+Each class gets dedicated slots, so a class that is busy (game builds) never
+takes capacity from another (image prompts). WORKER_CLASSES lists the classes
+this process serves and their slots, e.g. "image:short=8,image:long=4,game:*=2"
+(`*` matches any length); by default it serves every class with
+WORKER_SLOTS_PER_CLASS slots each (this replaced WORKER_CONCURRENCY, which
+capped the whole process). Separate deployments can dedicate whole workers to
+a class this way. WORKER_CPU_PROCESSES sizes the process pool (0 runs CPU
+stages inline). SIGTERM/SIGINT stop pulling new jobs and wait for in-flight
+ones to finish. Prometheus metrics are served on WORKER_METRICS_PORT (default
+9100, 0 disables).
+
+Taken jobs are leased (see workers/scheduler.py): the runtime renews the
+leases of its in-flight jobs and acks each one when it ends, and reaps the
+expired leases of the classes it serves, so jobs held by a crashed worker are
+queued again. A job requeued too often is marked failed.
+"""
+
+import asyncio
+import fnmatch
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+from prometheus_client import start_http_server
+
+from workers.metrics import JOBS_COMPLETED, QUEUE_WAIT_SECONDS, WORKER_JOBS_IN_FLIGHT
+from workers.orchestrator import PIPELINES, WorkerContext, get_async_redis
+from workers.scheduler import CLASSES, LEASE_SECONDS, Scheduler
+
+logger = logging.getLogger(__name__)
+
+DEQUEUE_TIMEOUT_SECONDS = 1  # how often an idle consumer re-checks for shutdown
+
+
+def parse_classes(spec: str, default_slots: int) -> dict[str, int]:
+    """Slots per class from "image:short=8,game:*=2" (empty: every class, default)"""
+    if not spec.strip():
+        return {job_class: default_slots for job_class in CLASSES}
+
+    slots: dict[str, int] = {}
+    for item in spec.split(","):
+        pattern, _, count = item.strip().partition("=")
+        matched = fnmatch.filter(CLASSES, pattern.strip())
+        if not matched:
+            raise ValueError(f"WORKER_CLASSES: no job class matches {pattern!r}")
+        for job_class in matched:
+            slots[job_class] = int(count) if count else default_slots
+    return slots
+
+
+class WorkerRuntime:
+    """Runs pipeline jobs concurrently on one event loop, with slots per class"""
+
+    def __init__(
+        self,
+        concurrency: int = 16,
+        cpu_processes: int = 0,
+        classes: dict[str, int] | None = None,
+    ) -> None:
+        self.classes = classes or {job_class: concurrency for job_class in CLASSES}
+        self.cpu_processes = cpu_processes
+        self.processed = 0
+        self.failed = 0
+        self.started = 0
+        self._stopping = asyncio.Event()
+        self._held: dict[
+            str, dict[str, Any]
+        ] = {}  # lease -> entry, for jobs in flight here
+
+    @classmethod
+    def from_env(cls) -> "WorkerRuntime":
+        concurrency = int(os.getenv("WORKER_SLOTS_PER_CLASS", "16"))
+        return cls(
+            concurrency=concurrency,
+            cpu_processes=int(
+                os.getenv("WORKER_CPU_PROCESSES", str(os.cpu_count() or 1))
+            ),
+            classes=parse_classes(os.getenv("WORKER_CLASSES", ""), concurrency),
+        )
+
+    def stop(self) -> None:
+        """Stop pulling jobs; in-flight jobs are allowed to finish"""
+        self._stopping.set()
+
+    async def run(self, r: Any | None = None, max_jobs: int | None = None) -> None:
+        """Consume jobs until stop() (or until max_jobs have been started)"""
+        cpu_pool = None
+        if self.cpu_processes > 0:
+            cpu_pool = ProcessPoolExecutor(
+                self.cpu_processes, mp_context=multiprocessing.get_context("spawn")
+            )
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                pass  # not on the main thread / not supported
+
+        in_flight: set[asyncio.Task[None]] = set()
+
+        try:
+            async with WorkerContext(r or get_async_redis(), cpu_pool) as ctx:
+                scheduler = Scheduler(ctx.r)
+                # Leases are kept up until the last in-flight job is done
+                leases = asyncio.create_task(self._maintain_leases(ctx, scheduler))
+                try:
+                    await asyncio.gather(
+                        *(
+                            self._consume(
+                                ctx, scheduler, job_class, slots, in_flight, max_jobs
+                            )
+                            for job_class, slots in self.classes.items()
+                        )
+                    )
+
+                    if in_flight:
+                        logger.info("draining %d in-flight jobs", len(in_flight))
+                        await asyncio.gather(*in_flight, return_exceptions=True)
+                finally:
+                    leases.cancel()
+        finally:
+            if cpu_pool is not None:
+                cpu_pool.shutdown()
+
+    async def _consume(
+        self,
+        ctx: WorkerContext,
+        scheduler: Scheduler,
+        job_class: str,
+        slots: int,
+        in_flight: set[asyncio.Task[None]],
+        max_jobs: int | None,
+    ) -> None:
+        """Pull one class's jobs whenever one of its slots is free"""
+        free = asyncio.Semaphore(slots)
+
+        while not self._stopping.is_set():
+            # Only pull a job once there is a free slot to run it
+            await free.acquire()
+            if self._stopping.is_set():
+                free.release()
+                break
+            entry = await scheduler.dequeue(job_class, timeout=DEQUEUE_TIMEOUT_SECONDS)
+            if entry is None:
+                free.release()
+                continue
+
+            self.started += 1
+            if max_jobs is not None and self.started >= max_jobs:
+                self.stop()
+            task = asyncio.create_task(self._run_job(ctx, scheduler, entry))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            task.add_done_callback(lambda _: free.release())
+
+    async def _maintain_leases(self, ctx: WorkerContext, scheduler: Scheduler) -> None:
+        """Renew the leases held here and requeue expired ones, each third of a lease"""
+        while True:
+            try:
+                if self._held:
+                    await scheduler.renew(list(self._held.values()))
+                for job_class in self.classes:
+                    for entry in await scheduler.reap(job_class):
+                        await self._fail_dropped(ctx, entry)
+            except Exception:
+                logger.exception("lease maintenance failed")
+            await asyncio.sleep(LEASE_SECONDS / 3)
+
+    async def _fail_dropped(self, ctx: WorkerContext, entry: dict[str, Any]) -> None:
+        """Mark a job whose lease ran out too many times as failed"""
+        try:
+            await ctx.store.set_status(
+                entry["job_id"], "failed", 0, error="Job was interrupted too many times"
+            )
+        except ValueError:
+            pass  # the job itself has expired; there is nothing left to mark
+        logger.error(
+            "job %s dropped after its lease expired %d times",
+            entry["job_id"],
+            entry.get("requeues", 0),
+        )
+
+    async def _run_job(
+        self, ctx: WorkerContext, scheduler: Scheduler, entry: dict[str, Any]
+    ) -> None:
+        func = entry["func"]
+        self._held[entry["lease"]] = entry
+        QUEUE_WAIT_SECONDS.labels(entry["job_class"]).observe(
+            max(0.0, time.time() - entry["enqueued_at"])
+        )
+        pipeline = PIPELINES.get(func)
+
+        status = "finished"
+        WORKER_JOBS_IN_FLIGHT.inc()
+        try:
+            if pipeline is None:
+                raise ValueError(f"No pipeline for {func}")
+            await pipeline(ctx, entry["job_id"])
+            self.processed += 1
+        except Exception:
+            status = "failed"
+            self.failed += 1
+            logger.exception("job %s (%s) failed", entry["job_id"], func)
+        finally:
+            WORKER_JOBS_IN_FLIGHT.dec()
+            JOBS_COMPLETED.labels(func.rsplit(".", 1)[-1], status).inc()
+            del self._held[entry["lease"]]
+            try:
+                await scheduler.ack(entry)
+            except Exception:
+                # The lease runs out and the job is requeued: at least once, not lost
+                logger.exception("could not ack job %s", entry["job_id"])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s"
+    )
+    metrics_port = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+    if metrics_port:
+        start_http_server(metrics_port)
+    asyncio.run(WorkerRuntime.from_env().run())
@@ -0,0 +1,283 @@
+"""
+Per-class, fair-share job queues
+Jobs are queued per class ("<output_type>:<length>", e.g. image:short) so
+workers can dedicate capacity to each class: cheap interactive image jobs
+never wait behind long game builds.
+
+Within a class, each user (user_id, or one shared "anonymous" bucket) has
+its own FIFO list, and users take turns by start-time fair queuing: the
+class keeps a virtual clock, each waiting user is scored with the virtual
+time of their next job, and the lowest score goes next. Taking a job moves
+its user's score on by 1/weight, so a user with weight 2 gets twice the
+turns of a user with weight 1 while both have jobs waiting, and one user
+with a thousand queued jobs delays another user's job by at most one turn.
+A user who arrives later starts at the current clock rather than at zero,
+so idle time cannot be saved up for a burst.
+
+Redis layout per class:
+    sched:{class}:users          zset  user -> virtual start of their next job
+    sched:{class}:user:{user}    list  queued entries, oldest first
+    sched:{class}:weights        hash  user -> weight
+    sched:{class}:clock          virtual time of the last job taken
+    sched:{class}:ready          list  one token per queued job, for BLPOP wakeups
+    sched:{class}:processing     zset  taken entries -> lease expiry (ms, Redis clock)
+    sched:depth                  hash  class -> queued jobs (for /metrics)
+
+Enqueue and dequeue are single Lua scripts, so concurrent API instances and
+workers never see a half-updated class. Entries carry the pipeline function,
+job id and queuing user; workers/runtime.py dispatches them through PIPELINES.
+
+Taking an entry leases it for LEASE_SECONDS rather than removing it: the
+worker renews the lease while the job runs and acks it when the job ends.
+If the worker dies, the lease runs out and reap() puts the entry back at the
+front of its user's list. An entry requeued MAX_REQUEUES times is dropped and
+returned to the caller instead, so a job that kills its worker cannot take
+down every worker in turn.
+"""
+
+import json
+import os
+import time
+from typing import Any
+
+from workers.metrics import redis_operation
+
+OUTPUT_TYPES = ("image", "video", "game")
+LENGTHS = ("short", "long")
+CLASSES = [
+    f"{output_type}:{length}" for output_type in OUTPUT_TYPES for length in LENGTHS
+]
+
+KEY_PREFIX = "sched:"
+DEPTH_KEY = "sched:depth"
+ANONYMOUS = "anonymous"
+
+LEASE_SECONDS = float(os.getenv("WORKER_LEASE_SECONDS", "60"))
+MAX_REQUEUES = int(os.getenv("WORKER_MAX_REQUEUES", "3"))
+
+# KEYS: users zset, user list, weights hash, clock, ready list, depth hash
+# ARGV: user, entry JSON, class, weight
+ENQUEUE_LUA = """
+redis.call('RPUSH', KEYS[2], ARGV[2])
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    local clock = redis.call('GET', KEYS[4]) or '0'
+    redis.call('ZADD', KEYS[1], clock, ARGV[1])
+end
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[4])
+redis.call('HINCRBY', KEYS[6], ARGV[3], 1)
+redis.call('RPUSH', KEYS[5], '1')
+return 1
+"""
+
+# KEYS: users zset, weights hash, clock, depth hash, processing zset
+# ARGV: class, user list key prefix, lease (ms)
+# Returns the next entry, leased, or nil if the class is empty
+DEQUEUE_LUA = """
+local head = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+if #head == 0 then
+    return false
+end
+local user, start = head[1], tonumber(head[2])
+local list = ARGV[2] .. user
+local entry = redis.call('LPOP', list)
+redis.call('SET', KEYS[3], start)
+if redis.call('LLEN', list) == 0 then
+    redis.call('ZREM', KEYS[1], user)
+    redis.call('HDEL', KEYS[2], user)
+else
+    local weight = tonumber(redis.call('HGET', KEYS[2], user) or '1')
+    redis.call('ZADD', KEYS[1], start + 1 / weight, user)
+end
+if not entry then
+    return false
+end
+redis.call('HINCRBY', KEYS[4], ARGV[1], -1)
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+redis.call('ZADD', KEYS[5], now + tonumber(ARGV[3]), entry)
+return entry
+"""
+
+# KEYS: processing zset
+# ARGV: lease (ms), entries
+# Extends the leases of entries still held; acked or reaped ones are left alone
+RENEW_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local deadline = now + tonumber(ARGV[1])
+for i = 2, #ARGV do
+    redis.call('ZADD', KEYS[1], 'XX', deadline, ARGV[i])
+end
+return 1
+"""
+
+# KEYS: processing zset, users zset, weights hash, clock, ready list, depth hash
+# ARGV: class, user list key prefix, max requeues
+# Requeues entries whose lease ran out; returns those dropped for too many requeues
+REAP_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local dropped = {}
+for _, entry in ipairs(redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)) do
+    redis.call('ZREM', KEYS[1], entry)
+    local job = cjson.decode(entry)
+    job.requeues = (job.requeues or 0) + 1
+    if job.requeues > tonumber(ARGV[3]) then
+        dropped[#dropped + 1] = cjson.encode(job)
+    else
+        local user = job.user or 'anonymous'
+        -- It was taken first, so it goes back first
+        redis.call('LPUSH', ARGV[2] .. user, cjson.encode(job))
+        if not redis.call('ZSCORE', KEYS[2], user) then
+            redis.call('ZADD', KEYS[2], redis.call('GET', KEYS[4]) or '0', user)
+            redis.call('HSET', KEYS[3], user, job.weight or 1)
+        end
+        redis.call('HINCRBY', KEYS[6], ARGV[1], 1)
+        redis.call('RPUSH', KEYS[5], '1')
+    end
+end
+return dropped
+"""
+
+
+def job_class(output_type: str, length: str) -> str:
+    return f"{output_type}:{length}"
+
+
+def class_key(job_class: str, name: str) -> str:
+    return f"{KEY_PREFIX}{job_class}:{name}"
+
+
+def user_list_key(job_class: str, user: str) -> str:
+    return class_key(job_class, f"user:{user}")
+
+
+def enqueue_args(
+    func: str, job_id: str, job_class: str, user_id: str | None, weight: float
+) -> tuple[list[str], list[Any]]:
+    """(KEYS, ARGV) for ENQUEUE_LUA"""
+    user = user_id or ANONYMOUS
+    entry = json.dumps(
+        {
+            "func": func,
+            "job_id": job_id,
+            "enqueued_at": time.time(),
+            "user": user,
+            "weight": weight,
+        }
+    )
+    keys = [
+        class_key(job_class, "users"),
+        user_list_key(job_class, user),
+        class_key(job_class, "weights"),
+        class_key(job_class, "clock"),
+        class_key(job_class, "ready"),
+        DEPTH_KEY,
+    ]
+    return keys, [user, entry, job_class, weight]
+
+
+class Scheduler:
+    """Class queues on a redis.asyncio client (decode_responses=True)"""
+
+    def __init__(self, r: Any) -> None:
+        self.r = r
+        self._enqueue = r.register_script(ENQUEUE_LUA)
+        self._dequeue = r.register_script(DEQUEUE_LUA)
+        self._renew = r.register_script(RENEW_LUA)
+        self._reap = r.register_script(REAP_LUA)
+
+    @redis_operation("scheduler.enqueue")
+    async def enqueue(
+        self,
+        func: str,
+        job_id: str,
+        job_class: str,
+        user_id: str | None = None,
+        weight: float = 1.0,
+    ) -> None:
+        keys, args = enqueue_args(func, job_id, job_class, user_id, weight)
+        await self._enqueue(keys=keys, args=args)
+
+    @redis_operation("scheduler.enqueue_many")
+    async def enqueue_many(self, jobs: list[dict[str, Any]]) -> None:
+        """Queue many jobs (dicts of enqueue() arguments) in one pipeline round trip"""
+        pipe = self.r.pipeline(transaction=False)
+        for job in jobs:
+            keys, args = enqueue_args(
+                job["func"],
+                job["job_id"],
+                job["job_class"],
+                job.get("user_id"),
+                job.get("weight", 1.0),
+            )
+            await self._enqueue(keys=keys, args=args, client=pipe)
+        await pipe.execute()
+
+    async def dequeue(self, job_class: str, timeout: float) -> dict[str, Any] | None:
+        """Next entry for a class, waiting up to timeout seconds for one"""
+        # The wakeup token only says "something was queued"; the script decides what.
+        # An idle timeout still tries once, so an entry whose token was lost still runs.
+        await self.r.blpop([class_key(job_class, "ready")], timeout=timeout)
+        return await self.take(job_class)
+
+    @redis_operation("scheduler.take")
+    async def take(self, job_class: str) -> dict[str, Any] | None:
+        """Next entry for a class, leased to the caller until ack() (None if empty)"""
+        entry = await self._dequeue(
+            keys=[
+                class_key(job_class, "users"),
+                class_key(job_class, "weights"),
+                class_key(job_class, "clock"),
+                DEPTH_KEY,
+                class_key(job_class, "processing"),
+            ],
+            args=[job_class, class_key(job_class, "user:"), int(LEASE_SECONDS * 1000)],
+        )
+        if entry is None:
+            return None
+        job = json.loads(entry)
+        job["job_class"] = job_class
+        job["lease"] = entry
+        return job
+
+    @redis_operation("scheduler.renew")
+    async def renew(self, jobs: list[dict[str, Any]]) -> None:
+        """Extend the leases of jobs still running, in one pipeline round trip"""
+        pipe = self.r.pipeline(transaction=False)
+        for job in jobs:
+            await self._renew(
+                keys=[class_key(job["job_class"], "processing")],
+                args=[int(LEASE_SECONDS * 1000), job["lease"]],
+                client=pipe,
+            )
+        await pipe.execute()
+
+    @redis_operation("scheduler.ack")
+    async def ack(self, job: dict[str, Any]) -> None:
+        """The job ended (either way): release its lease so it is never requeued"""
+        await self.r.zrem(class_key(job["job_class"], "processing"), job["lease"])
+
+    @redis_operation("scheduler.reap")
+    async def reap(self, job_class: str) -> list[dict[str, Any]]:
+        """Requeue the class's entries whose lease ran out; returns those dropped
+
+        A dropped entry's requeues counts every expired lease, including the last.
+        """
+        dropped = await self._reap(
+            keys=[
+                class_key(job_class, "processing"),
+                class_key(job_class, "users"),
+                class_key(job_class, "weights"),
+                class_key(job_class, "clock"),
+                class_key(job_class, "ready"),
+                DEPTH_KEY,
+            ],
+            args=[job_class, class_key(job_class, "user:"), MAX_REQUEUES],
+        )
+        return [{**json.loads(entry), "job_class": job_class} for entry in dropped]
+
+    @redis_operation("scheduler.depths")
+    async def depths(self) -> dict[str, int]:
+        counts = await self.r.hgetall(DEPTH_KEY)
+        return {name: int(counts.get(name, 0)) for name in CLASSES}
@@ -0,0 +1,290 @@
+"""
+Chunked, parallel audio transcription
+Turns an audio_url into dream text for /v1/transcribe and for audio-only jobs.
+
+The audio is streamed in fixed-size chunks (TRANSCRIBE_CHUNK_BYTES) and each
+chunk is handed to the engine as soon as it arrives, up to
+TRANSCRIBE_PARALLELISM chunks at a time, so a long voice memo is transcribed
+by several pool workers instead of serializing one. MAX_AUDIO_SIZE_MB is
+enforced while streaming: an oversized upload is cut off at the limit, never
+downloaded in full. Text is emitted in chunk order as soon as each prefix of
+chunks is done.
+
+The URL comes from the client, so it is only fetched if its host resolves to
+public addresses: loopback, private, link-local and other internal ranges
+are refused. The request then goes to the address that was checked (with the
+URL's Host header and TLS server name), never to a fresh lookup, so a host
+that re-resolves to an internal address (DNS rebinding) gains nothing.
+Redirects are followed by hand (at most MAX_AUDIO_REDIRECTS) so every hop is
+checked the same way.
+
+Engines are pluggable: TRANSCRIBE_ENGINE is "stub" (deterministic stand-in,
+no model needed) or "package.module:factory", a callable returning an object
+with transcribe(chunk: bytes) -> str. Engines are built once per process, so
+a CPU model loads once per pool worker (or once per process, for threads).
+Chunks are raw bytes at fixed offsets; an engine for a real model should expect
+PCM/WAV input.
+"""
+
+import asyncio
+import hashlib
+import importlib
+import ipaddress
+import os
+import socket
+import threading
+from collections.abc import AsyncIterator, Awaitable, Callable
+from concurrent.futures import Executor
+from contextlib import aclosing
+from typing import Any
+from urllib.parse import urlparse
+
+import httpx
+
+MAX_AUDIO_SIZE_MB = int(os.getenv("MAX_AUDIO_SIZE_MB", "30"))
+TRANSCRIBE_ENGINE = os.getenv("TRANSCRIBE_ENGINE", "stub")
+TRANSCRIBE_CHUNK_BYTES = int(os.getenv("TRANSCRIBE_CHUNK_BYTES", str(256 * 1024)))
+TRANSCRIBE_PARALLELISM = int(os.getenv("TRANSCRIBE_PARALLELISM", "4"))
+TRANSCRIBE_TIMEOUT_SECONDS = float(os.getenv("TRANSCRIBE_TIMEOUT_SECONDS", "30"))
+
+MAX_AUDIO_REDIRECTS = 3
+
+TextCallback = Callable[[str], Awaitable[None]]
+
+# Words the stub engine draws from, so stub transcripts still parse into worlds
+STUB_VOCABULARY = (
+    "I",
+    "was",
+    "flying",
+    "over",
+    "a",
+    "forest",
+    "at",
+    "night",
+    "and",
+    "glowing",
+    "bird",
+    "guided",
+    "me",
+    "to",
+    "floating",
+    "house",
+    "by",
+    "the",
+    "ocean",
+    "where",
+    "feathers",
+    "fell",
+    "like",
+    "rain",
+    "under",
+    "stars",
+    "in",
+    "quiet",
+    "mountains",
+    "with",
+    "a",
+    "river",
+)
+STUB_WORDS_PER_CHUNK = 8
+
+
+class AudioTooLarge(ValueError):  # noqa: N818
+    """The audio exceeds MAX_AUDIO_SIZE_MB"""
+
+
+class UnsafeAudioUrl(ValueError):  # noqa: N818
+    """The audio_url's host is internal (loopback, private, link-local, ...)"""
+
+
+class StubEngine:
+    """Deterministic stand-in: the same chunk always gives the same words"""
+
+    def transcribe(self, chunk: bytes) -> str:
+        digest = hashlib.sha256(chunk).digest()
+        return " ".join(
+            STUB_VOCABULARY[byte % len(STUB_VOCABULARY)]
+            for byte in digest[:STUB_WORDS_PER_CHUNK]
+        )
+
+
+ENGINES: dict[str, Callable[[], Any]] = {"stub": StubEngine}
+
+# Engines built in this process, by spec; thread pools share it, hence the lock
+_loaded: dict[str, Any] = {}
+_loaded_lock = threading.Lock()
+
+
+def load_engine(spec: str) -> Any:
+    """Engine for "stub" or "package.module:factory" (built once per process)"""
+    engine = _loaded.get(spec)
+    if engine is not None:
+        return engine
+    with _loaded_lock:
+        if spec not in _loaded:
+            factory = ENGINES.get(spec)
+            if factory is None:
+                module_name, _, attr = spec.partition(":")
+                if not attr:
+                    raise ValueError(f"Unknown transcription engine: {spec}")
+                factory = getattr(importlib.import_module(module_name), attr)
+            _loaded[spec] = factory()
+        return _loaded[spec]
+
+
+def transcribe_chunk(engine: str, chunk: bytes) -> str:
+    """Transcribe one chunk (module-level so process pools can pickle it)"""
+    return load_engine(engine).transcribe(chunk).strip()
+
+
+def max_audio_bytes() -> int:
+    return MAX_AUDIO_SIZE_MB * 1024 * 1024
+
+
+def open_audio_client() -> httpx.AsyncClient:
+    # Redirects are followed by stream_audio, which checks each target first
+    return httpx.AsyncClient(timeout=TRANSCRIBE_TIMEOUT_SECONDS, follow_redirects=False)
+
+
+async def resolve_host(host: str) -> list[str]:
+    """Every address host resolves to"""
+    loop = asyncio.get_running_loop()
+    try:
+        infos = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+    except socket.gaierror as e:
+        raise httpx.ConnectError(f"Cannot resolve {host}") from e
+    return [info[4][0] for info in infos]
+
+
+def is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+async def check_audio_url(url: str) -> str:
+    """The public address to fetch url from
+
+    Refuses URLs that are not http(s) or whose host resolves to any non-public
+    address.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("audio_url must be an http(s) URL")
+    addresses = await resolve_host(parsed.hostname)
+    if not addresses or not all(map(is_public_address, addresses)):
+        raise UnsafeAudioUrl("audio_url must point to a public host")
+    return addresses[0]
+
+
+def pinned_request(client: httpx.AsyncClient, url: str, address: str) -> httpx.Request:
+    """GET url from address, keeping the URL's Host header and TLS server name"""
+    target = httpx.URL(url)
+    return client.build_request(
+        "GET",
+        target.copy_with(host=address),
+        headers={"Host": target.netloc.decode("ascii")},
+        extensions={"sni_hostname": target.host},
+    )
+
+
+async def stream_audio(
+    url: str, chunk_bytes: int | None = None, max_bytes: int | None = None
+) -> AsyncIterator[bytes]:
+    """Fixed-size chunks of the audio at url, failing as soon as it passes max_bytes"""
+    chunk_bytes = chunk_bytes or TRANSCRIBE_CHUNK_BYTES
+    max_bytes = max_audio_bytes() if max_bytes is None else max_bytes
+
+    async with open_audio_client() as client:
+        for _ in range(MAX_AUDIO_REDIRECTS + 1):
+            address = await check_audio_url(url)
+            request = pinned_request(client, url, address)
+            response = await client.send(request, stream=True)
+            try:
+                if response.is_redirect:
+                    # Relative to the URL as given, not the pinned address
+                    url = str(httpx.URL(url).join(response.headers["location"]))
+                    continue
+                response.raise_for_status()
+                # Honest servers are turned away before any body is read
+                declared = response.headers.get("content-length")
+                if declared and declared.isdigit() and int(declared) > max_bytes:
+                    raise AudioTooLarge(f"Audio exceeds {MAX_AUDIO_SIZE_MB} MB")
+
+                received = 0
+                async for chunk in response.aiter_bytes(chunk_bytes):
+                    received += len(chunk)
+                    if received > max_bytes:
+                        raise AudioTooLarge(f"Audio exceeds {MAX_AUDIO_SIZE_MB} MB")
+                    yield chunk
+                return
+            finally:
+                await response.aclose()
+    raise httpx.TooManyRedirects(
+        f"audio_url redirected more than {MAX_AUDIO_REDIRECTS} times"
+    )
+
+
+async def transcribe_chunks(
+    chunks: AsyncIterator[bytes],
+    executor: Executor | None = None,
+    on_partial: TextCallback | None = None,
+    engine: str | None = None,
+    parallelism: int | None = None,
+) -> str:
+    """Transcribe chunks on the executor as they arrive; returns the full text
+
+    At most `parallelism` chunks are in flight, so reading pauses (and memory
+    stays bounded) while the pool is busy. None uses the loop's default
+    thread pool.
+    """
+    engine = engine or TRANSCRIBE_ENGINE
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(parallelism or TRANSCRIBE_PARALLELISM)
+    pending: list[asyncio.Future[str]] = []
+    texts: list[str] = []
+
+    async def emit_finished() -> None:
+        # Emit the text of every chunk whose predecessors are all done
+        advanced = False
+        while len(texts) < len(pending) and pending[len(texts)].done():
+            texts.append(pending[len(texts)].result())
+            advanced = True
+        if advanced and on_partial is not None:
+            await on_partial(join_text(texts))
+
+    async def run(chunk: bytes) -> str:
+        try:
+            return await loop.run_in_executor(executor, transcribe_chunk, engine, chunk)
+        finally:
+            slots.release()
+
+    try:
+        async for chunk in chunks:
+            await slots.acquire()
+            pending.append(asyncio.ensure_future(run(chunk)))
+            await emit_finished()
+
+        for future in pending[len(texts) :]:
+            await future
+            await emit_finished()
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return join_text(texts)
+
+
+def join_text(texts: list[str]) -> str:
+    return " ".join(text for text in texts if text)
+
+
+async def transcribe_url(
+    url: str,
+    executor: Executor | None = None,
+    on_partial: TextCallback | None = None,
+) -> str:
+    """Stream, chunk and transcribe the audio at url"""
+    async with aclosing(stream_audio(url)) as chunks:
+        return await transcribe_chunks(chunks, executor, on_partial)